@@ -1,9 +1,10 @@
-from spraycharles.commands import parse, gen, analyze, spray, modules
+from spraycharles.commands import parse, gen, analyze, spray, modules, query
 
 all = [
     parse,
     gen,
     analyze,
     spray,
-    modules
+    modules,
+    query
 ]
\ No newline at end of file
@@ -1,8 +1,12 @@
 import typer
 from enum import Enum
+from pathlib import Path
+from typing import List
 
 from spraycharles.lib.analyze import Analyzer
-from spraycharles.lib.logger import init_logger
+from spraycharles.lib.logger import init_logger, logger
+from spraycharles.lib.parallel_analyze import ParallelAnalyzer, expand_inputs
+from spraycharles.lib.profiler import profiler
 from spraycharles.lib.utils import HookSvc
 
 app = typer.Typer()
@@ -12,13 +16,33 @@ HELP =  'Analyze Spraycharles output files for potential spray hits'
 
 @app.callback(no_args_is_help=True, invoke_without_command=True)
 def main(
-    infile:     str     = typer.Argument(..., help="Filepath of the results file"),
+    infiles:    List[str] = typer.Argument(..., help="Results files, directories of results files or globs"),
+    workers:    int     = typer.Option(None, '-w', '--workers', help="Analyze in parallel with this many processes (default when analyzing several files: one per CPU)"),
     notify:     HookSvc = typer.Option(None, case_sensitive=False, help="Enable notifications for Slack, Teams or Discord."),
     webhook:    str     = typer.Option(None, help="Webhook used for specified notification module."),
-    host:       str     = typer.Option(None, help="Target host associated with CSV file.")):
+    host:       str     = typer.Option(None, help="Target host associated with CSV file."),
+    profile:    bool    = typer.Option(False, '--profile', help="Print a per-phase timing breakdown and write folded stacks to ~/.spraycharles/profile"),
+    profile_sample: int = typer.Option(None, '--profile-sample', help="Also sample the call stack every N milliseconds (implies --profile)")):
     
     init_logger(False)
+
+    if profile or profile_sample:
+        profiler.start("analyze", profile_sample)
     
-    analyzer = Analyzer(infile, notify, webhook, host)
-    analyzer.analyze()
+    try:
+        paths = expand_inputs(infiles)
+        if not paths:
+            logger.error(f"No results files found for {' '.join(infiles)}")
+            exit()
+
+        #
+        # A single file is analyzed in-process, unless workers were requested
+        #
+        if len(paths) == 1 and workers is None and Path(infiles[0]).is_file():
+            analyzer = Analyzer(paths[0], notify, webhook, host)
+        else:
+            analyzer = ParallelAnalyzer(paths, workers, notify, webhook, host)
+        analyzer.analyze()
+    finally:
+        profiler.finish()
 
@@ -3,6 +3,7 @@ import json
 from collections import OrderedDict
 
 from spraycharles.lib.logger import init_logger, logger
+from spraycharles.lib.profiler import profiler
 
 app = typer.Typer()
 COMMAND_NAME = 'gen'
@@ -12,10 +13,23 @@ HELP =  'Generate custom password lists from JSON file'
 @app.callback(no_args_is_help=True, invoke_without_command=True)
 def main(
     infile:     str = typer.Argument(..., exists=True, help="Filepath of the JSON file (example in repo's extras folder)"),
-    outfile:    str = typer.Argument(..., writable=True, help="Name and path of the output file")):
+    outfile:    str = typer.Argument(..., writable=True, help="Name and path of the output file"),
+    profile:    bool = typer.Option(False, '--profile', help="Print a per-phase timing breakdown and write folded stacks to ~/.spraycharles/profile"),
+    profile_sample: int = typer.Option(None, '--profile-sample', help="Also sample the call stack every N milliseconds (implies --profile)")):
     
     init_logger(False)
-    
+
+    if profile or profile_sample:
+        profiler.start("gen", profile_sample)
+
+    try:
+        with profiler.phase("gen"):
+            generate_list(infile, outfile)
+    finally:
+        profiler.finish()
+
+
+def generate_list(infile, outfile):
     logger.info(f"Reading {infile} ...")
     try:
         with open(infile) as f:
@@ -44,6 +58,16 @@ def main(
         min_max = r.split(",")
         ranges.append(range(int(min_max[0]), int(min_max[1])))
 
+    with profiler.phase("generate"):
+        spray_list = generate(words, ranges, spec_chars, min_length)
+
+    with profiler.phase("write"):
+        with open(outfile, "w") as f:
+            f.write("\n".join(spray_list))
+    logger.info(f"Password list written to {outfile}")
+
+
+def generate(words, ranges, spec_chars, min_length):
     spray_list = []
 
     for word in words:
@@ -64,11 +88,7 @@ def main(
     # 
     # Remove duplicates and preserve order
     #
-    spray_list = list(OrderedDict.fromkeys(spray_list))
-
-    with open(outfile, "w") as f:
-        f.write("\n".join(spray_list))
-    logger.info(f"Password list written to {outfile}")
+    return list(OrderedDict.fromkeys(spray_list))
 
 
 #
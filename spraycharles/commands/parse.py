@@ -1,5 +1,9 @@
+import sys
 import typer
-from spraycharles.lib.utils import ntlm_challenger
+from pathlib import Path
+
+from spraycharles.lib.logger import init_logger, logger
+from spraycharles.lib.utils import ntlm_challenger, ntlm_scan
 
 app = typer.Typer()
 COMMAND_NAME = 'parse'
@@ -7,8 +11,31 @@ HELP =  'Parse NTLM over HTTP and SMB endpoints to collect domain information'
 
 @app.callback(no_args_is_help=True, invoke_without_command=True)
 def main(
-    url: str = typer.Argument(..., help="URL to parse"),
-    smbv1: bool = typer.Option(False, '--smbv1', help="Use SMBv1 protocol")):
+    url: str = typer.Argument(..., help="URL to parse, or a file of http(s):// and smb:// URLs (one per line)"),
+    smbv1: bool = typer.Option(False, '--smbv1', help="Use SMBv1 protocol"),
+    timeout: int = typer.Option(5, '-t', '--timeout', help="Per-host connection timeout in seconds"),
+    workers: int = typer.Option(20, '-w', '--workers', help="Number of hosts probed concurrently when parsing a file"),
+    output: str = typer.Option(None, '-o', '--output', help="Write JSON lines results to this file instead of the console"),
+    refresh: bool = typer.Option(False, '--refresh', help="Probe hosts again even if a cached result exists")):
+
+    if not Path(url).is_file():
+        ntlm_challenger(url, smbv1, timeout)
+        return
+
+    init_logger(False)
+
+    targets = [line.strip() for line in Path(url).read_text().splitlines() if line.strip() and not line.startswith("#")]
+    cache_file = Path.home() / ".spraycharles" / "parse_cache.json"
+
+    #
+    # Results stream to stdout as JSON lines unless an output file is given
+    #
+    if output is None:
+        ntlm_scan(targets, sys.stdout, smbv1, workers, timeout, cache_file, refresh)
+        return
 
-    ntlm_challenger(url, smbv1)
+    logger.info(f"Parsing {len(targets)} targets with {workers} workers")
+    with open(output, "a") as outfile:
+        probed, cached, failed = ntlm_scan(targets, outfile, smbv1, workers, timeout, cache_file, refresh)
 
+    logger.info(f"Probed {probed} hosts ({failed} failed), {cached} from cache; results written to {output}")
@@ -0,0 +1,102 @@
+import glob
+import json
+import time
+import typer
+from pathlib import Path
+from typing import List
+
+from rich.table import Table
+
+from spraycharles.lib.logger import console, init_logger, logger
+from spraycharles.lib.resultsdb import GROUPS, ResultsDB, parse_time
+
+app = typer.Typer()
+COMMAND_NAME = 'query'
+HELP = 'Search and aggregate results across runs in the results database'
+
+DEFAULT_DB = Path.home() / ".spraycharles" / "results.db"
+
+
+#
+# Results files named by a path, directory (its *.json files) or glob
+#
+def _import_paths(spec):
+    path = Path(spec).expanduser()
+    if path.is_dir():
+        return sorted(path.glob("*.json"))
+    if path.exists():
+        return [path]
+    return [Path(match) for match in sorted(glob.glob(str(path)))]
+
+
+@app.callback(invoke_without_command=True)
+def main(
+    db:         str         = typer.Option(str(DEFAULT_DB), '--db', help="Results database"),
+    imports:    List[str]   = typer.Option(None, '--import', help="Import a results file, directory of results files or glob first (repeatable)", rich_help_panel="Import"),
+    host:       str         = typer.Option(None, '-H', '--host', help="Host filter; with --import, the host to record instead of the one in the file name"),
+    username:   str         = typer.Option(None, '-u', '--username', help="Username filter (* and ? wildcards)", rich_help_panel="Filters"),
+    password:   str         = typer.Option(None, '-p', '--password', help="Password filter (* and ? wildcards)", rich_help_panel="Filters"),
+    module:     str         = typer.Option(None, '-m', '--module', help="Module filter", rich_help_panel="Filters"),
+    result:     str         = typer.Option(None, '-r', '--result', help="Result filter (e.g. Success, Locked, STATUS_LOGON_FAILURE)", rich_help_panel="Filters"),
+    since:      str         = typer.Option(None, '--since', help="Attempts at or after YYYY-MM-DD[ HH:MM:SS] (UTC) or an age like 30d", rich_help_panel="Filters"),
+    until:      str         = typer.Option(None, '--until', help="Attempts at or before YYYY-MM-DD[ HH:MM:SS] (UTC)", rich_help_panel="Filters"),
+    hits:       bool        = typer.Option(False, '--hits', help="Only successful logins (including valid SMB statuses)", rich_help_panel="Filters"),
+    group_by:   str         = typer.Option(None, '-g', '--group-by', help=f"Aggregate attempts and hits per {'/'.join(GROUPS)}", rich_help_panel="Output"),
+    limit:      int         = typer.Option(50, '-l', '--limit', help="Maximum rows to show", rich_help_panel="Output"),
+    as_json:    bool        = typer.Option(False, '--json', help="Print rows as JSON lines", rich_help_panel="Output")):
+
+    init_logger(False)
+
+    database = ResultsDB(db)
+
+    for spec in imports or []:
+        paths = _import_paths(spec)
+        if not paths:
+            logger.warning(f"No results files found for {spec}")
+
+        for path in paths:
+            try:
+                count = database.import_file(path, host)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping {path}: {e}")
+                continue
+
+            if count is None:
+                logger.info(f"{path.name} is unchanged since it was imported")
+            else:
+                logger.info(f"Imported {count} attempts from {path.name}")
+
+    #
+    # With --import, -H names the host of the imported files rather than filtering
+    #
+    filters = {
+        "username": username,
+        "password": password,
+        "module": module,
+        "host": None if imports else host,
+        "result": result,
+    }
+
+    try:
+        start = time.perf_counter()
+        columns, rows = database.query(filters, parse_time(since), parse_time(until, end=True), hits, group_by, limit)
+        elapsed = time.perf_counter() - start
+    except ValueError as e:
+        logger.error(e)
+        exit()
+    finally:
+        database.close()
+
+    if as_json:
+        for row in rows:
+            print(json.dumps(dict(zip(columns, row))))
+        return
+
+    table = Table(title=f"{len(rows)} row(s) in {elapsed * 1000:.1f} ms", title_justify="left", title_style="bold reverse")
+    for column in columns:
+        table.add_column(column, justify="right" if column in ("attempts", "hits", "code", "length", "total_ms") else "left")
+
+    for row in rows:
+        table.add_row(*("" if value is None else str(value) for value in row))
+
+    console.print(table)
@@ -1,4 +1,7 @@
+import re
 import typer
+import yaml
+from typing import List
 from typer_config import use_yaml_config
 from typer_config.decorators import dump_yaml_config
 from rich.prompt import Confirm
@@ -7,8 +10,11 @@ from pathlib import Path
 from spraycharles import ascii
 from spraycharles.lib.logger import logger, init_logger, console
 from spraycharles.targets import Target, all
+from spraycharles.targets.classes.HttpxTransport import HttpxTransport
+from spraycharles.targets.classes.Transport import TransportBackend
 from spraycharles.lib.spraycharles import Spraycharles
-from spraycharles.lib.utils import HookSvc
+from spraycharles.lib.profiler import profiler
+from spraycharles.lib.utils import HookSvc, PasswordPolicy
 
 app = typer.Typer()
 COMMAND_NAME = 'spray'
@@ -24,21 +30,46 @@ def main(
     module:     Target  = typer.Option(..., '-m', '--module', case_sensitive=False, help="Module corresponding to target host", rich_help_panel="Spray Target"),
     path:       str     = typer.Option(None, help="NTLM authentication endpoint (i.e., rpc or ews)", rich_help_panel="Spray Target"),
     output:     str     = typer.Option(None, '-o', '--output', help="Name and path of result output file", rich_help_panel="Output"),
+    metrics_port: int   = typer.Option(None, '--metrics-port', help="Serve OpenMetrics on http://127.0.0.1:PORT/metrics while spraying", rich_help_panel="Output"),
+    db:         str     = typer.Option(None, '--db', help="Also record attempts in this SQLite results database, searchable with the query command", rich_help_panel="Output"),
+    segment_size: int   = typer.Option(None, '--segment-size', help="Split results into gzipped segments of this many MB, listed in the output file", rich_help_panel="Output"),
+    segment_interval: int = typer.Option(None, '--segment-interval', help="Split results into gzipped segments of this many minutes, listed in the output file", rich_help_panel="Output"),
+    stats:      str     = typer.Option(None, '--stats', help="Write spray metrics as JSON to this file every 30 seconds", rich_help_panel="Output"),
     quiet:      bool    = typer.Option(False, '--quiet', help="Will not log each login attempt to the console", rich_help_panel="Output"),
+    dashboard:  bool    = typer.Option(False, '--dashboard', help="Show a live summary (counts, rate, ETA, errors, recent hits) instead of each login attempt", rich_help_panel="Output"),
     attempts:   int     = typer.Option(None, '-a', '--attempts', help="Number of logins submissions per interval (for each user)", rich_help_panel="Spray Behavior"),
     interval:   int     = typer.Option(None, '-i', '--interval', help="Minutes inbetween login intervals", rich_help_panel="Spray Behavior"),
     equal:      bool    = typer.Option(False, '-e', '--equal', help="Does 1 spray for each user where password = username", rich_help_panel="User/Pass Config"),
+    rank:       bool    = typer.Option(False, '--rank', help="Spray the passwords most likely to succeed first, learned from previous results in ~/.spraycharles/out", rich_help_panel="User/Pass Config"),
     timeout:    int     = typer.Option(5, '-t', '--timeout', help="Web request timeout threshold", rich_help_panel="Spray Behavior"),
     port:       int     = typer.Option(443, '-P','--port', help="Port to connect to on the specified host", rich_help_panel="Spray Target"),
     fireprox:   str     = typer.Option(None, '-f', '--fireprox', help="URL of desired fireprox interface", rich_help_panel="Spray Target"),
-    domain:     str     = typer.Option(None, '-d', '--domain', help="HTTP - Prepend DOMAIN\\ to usernames; SMB - Supply domain for smb connection", rich_help_panel="Spray Target"),
+    domain:     str     = typer.Option(None, '-d', '--domain', help="HTTP - Prepend DOMAIN\\ to usernames; SMB - Supply domain for smb connection; Office365/Okta - UPN suffix for bare usernames", rich_help_panel="Spray Target"),
     analyze:    bool    = typer.Option(False, '--analyze', help="Run the results analyzer after each spray interval (Early false positives are more likely)", rich_help_panel="Output"),
     jitter:     int     = typer.Option(None, help="Jitter time between requests in seconds", rich_help_panel="Spray Behavior"),
     jitter_min: int     = typer.Option(None, help="Minimum time between requests in seconds", rich_help_panel="Spray Behavior"),
     notify:     HookSvc = typer.Option(None, '-n', '--notify', case_sensitive=False, help="Enable notifications for Slack, Teams or Discord", rich_help_panel="Notifications"),
     webhook:    str     = typer.Option(None, '-w', '--webhook', help="Webhook used for specified notification module", rich_help_panel="Notifications"),
+    daemon:     bool    = typer.Option(False, '--daemon', help="Run without prompts, controlled through a local Unix socket API", rich_help_panel="Daemon"),
+    socket:     str     = typer.Option(None, '--socket', help="Control API socket path (default ~/.spraycharles/run/<host>_<timestamp>.sock)", rich_help_panel="Daemon"),
+    ledger:     str     = typer.Option(None, '--ledger', help="SQLite lockout ledger shared by sprays against the same directory (requires -a/-i)", rich_help_panel="Spray Behavior"),
+    account_state: str  = typer.Option(None, '--account-state', help="JSON file keeping invalid, disabled, locked and found accounts across runs, so they are skipped", rich_help_panel="Spray Behavior"),
+    lock_cooldown: int  = typer.Option(30, '--lock-cooldown', help="Minutes to skip an account after it was reported locked", rich_help_panel="Spray Behavior"),
     pause:      bool    = typer.Option(False, '--pause', help="Pause the spray between intervals if a new potentially successful login was found", rich_help_panel="Spray Behavior"),
+    dns_ttl:    int     = typer.Option(300, '--dns-ttl', help="Resolve the target once and pin connections to its address, re-resolving after this many seconds (0 resolves on every connection)", rich_help_panel="Spray Target"),
+    transport:  TransportBackend = typer.Option(TransportBackend.requests.value, '--transport', case_sensitive=False, help="HTTP backend: requests, or httpx for asyncio with connection pooling and HTTP/2", rich_help_panel="Spray Target"),
+    tls_resume: bool    = typer.Option(False, '--tls-resume', help="Resume TLS sessions on new connections, saving full handshakes against targets that close the connection after each attempt", rich_help_panel="Spray Target"),
     no_ssl:     bool    = typer.Option(False, '--no-ssl', help="Use HTTP instead of HTTPS", rich_help_panel="Spray Target"),
+    rules:      str     = typer.Option(None, '--rules', help="YAML file of success/failure rules per module, checked before the module's defaults", rich_help_panel="Spray Target"),
+    min_length: int     = typer.Option(None, '--min-length', help="Drop passwords shorter than the target's minimum password length", rich_help_panel="Password Policy"),
+    complexity: bool    = typer.Option(False, '--complexity', help="Drop passwords failing AD complexity rules (3 of 4 character classes, no username)", rich_help_panel="Password Policy"),
+    banned:     List[str] = typer.Option(None, '--banned', help="Drop passwords containing this substring, case-insensitive (repeatable)", rich_help_panel="Password Policy"),
+    policy_regex: List[str] = typer.Option(None, '--policy-regex', help="Drop passwords not matching this regex (repeatable)", rich_help_panel="Password Policy"),
+    simulate:   bool    = typer.Option(False, '--simulate', help="Run the spray plan on a virtual clock against a local fake target, reporting the attempt timeline, per-account attempt windows and ETA in seconds. Nothing is sent", rich_help_panel="Simulation"),
+    sim_latency: float  = typer.Option(0.5, '--sim-latency', help="Simulated seconds per login attempt", rich_help_panel="Simulation"),
+    lockout_window: int = typer.Option(None, '--lockout-window', help="Lockout observation window in minutes to check attempts per account against (default: the interval, or 30)", rich_help_panel="Simulation"),
+    profile:    bool    = typer.Option(False, '--profile', help="Print a per-phase timing breakdown and write folded stacks to ~/.spraycharles/profile", rich_help_panel="Output"),
+    profile_sample: int = typer.Option(None, '--profile-sample', help="Also sample the call stack every N milliseconds (implies --profile)", rich_help_panel="Output"),
     debug:      bool    = typer.Option(False, '--debug', help="Enable debug logging (overrides --quiet)")):
 
 
@@ -137,6 +168,71 @@ def main(
     if pause and not (analyze and interval is not None):
         logger.warning("--pause flag can only takes effect when analyze/interval options are set")
 
+    #
+    # A shared lockout budget needs the lockout policy
+    #
+    if ledger is not None and (attempts is None or interval is None):
+        logger.error("--ledger requires the attempts and interval options to set the shared lockout budget")
+        exit()
+
+    if transport == TransportBackend.httpx and not HttpxTransport.available():
+        logger.error("--transport httpx needs httpx installed - pip install 'spraycharles[httpx]'")
+        exit()
+
+    if dns_ttl < 0:
+        logger.error("--dns-ttl can't be negative")
+        exit()
+
+    if lock_cooldown < 0:
+        logger.error("--lock-cooldown can't be negative")
+        exit()
+
+    #
+    # Simulations run on a virtual clock and must not touch shared state or the network
+    #
+    if simulate and (ledger or db or daemon or segment_size or segment_interval or tls_resume or transport != TransportBackend.requests):
+        logger.error("--simulate can't be combined with --ledger, --db, --daemon, --segment-size/--segment-interval, --tls-resume or --transport")
+        exit()
+
+    if simulate and analyze:
+        logger.warning("--analyze has no effect when simulating - simulated attempts all fail")
+        analyze = False
+
+    if sim_latency < 0 or (lockout_window is not None and lockout_window <= 0):
+        logger.error("--sim-latency can't be negative and --lockout-window must be greater than 0")
+        exit()
+
+    if any(limit is not None and limit <= 0 for limit in (segment_size, segment_interval)):
+        logger.error("--segment-size and --segment-interval must be greater than 0")
+        exit()
+
+    #
+    # Compile the password policy filter, if any policy options were supplied
+    #
+    policy = None
+    if min_length or complexity or banned or policy_regex:
+        try:
+            policy = PasswordPolicy(min_length, complexity, banned, policy_regex)
+        except re.error as e:
+            logger.error(f"Invalid --policy-regex: {e}")
+            exit()
+
+    #
+    # Load custom success/failure rules, keyed by module name
+    #
+    rule_config = None
+    if rules is not None:
+        try:
+            logger.debug(f"Reading rules from file {rules}")
+            rule_config = yaml.safe_load(Path(rules).read_text()) or {}
+        except Exception as e:
+            logger.error(f"Error reading rules file: {e}")
+            exit()
+
+        if not isinstance(rule_config, dict):
+            logger.error("Rules file must map module names to lists of rules")
+            exit()
+
     #
     # Warn user if interval and attempts are not supplied and password list is provided
     #
@@ -144,13 +240,20 @@ def main(
         logger.warning("You have not provided spray attempts/interval. This may lead to account lockouts!")
         print()
 
-        Confirm.ask(
-            "[yellow]Press enter to continue anyways",
-            default=True,
-            show_choices=False,
-            show_default=False,
-        )
-        print()
+        if not daemon and not simulate:
+            Confirm.ask(
+                "[yellow]Press enter to continue anyways",
+                default=True,
+                show_choices=False,
+                show_default=False,
+            )
+            print()
+
+    #
+    # Profile setup too - list hashing, module setup and resolving the target
+    #
+    if profile or profile_sample:
+        profiler.start("spray", profile_sample)
 
     #
     # Finally validated, lets spray
@@ -178,6 +281,26 @@ def main(
         webhook=webhook,
         pause=pause,
         no_ssl=no_ssl,
+        policy=policy,
+        rank=rank,
+        rules=rule_config,
+        ledger=ledger,
+        daemon=daemon,
+        control_socket=socket,
+        metrics_port=metrics_port,
+        stats_file=stats,
+        dashboard=dashboard,
+        segment_size=segment_size,
+        segment_interval=segment_interval,
+        db=db,
+        account_state=account_state,
+        lock_cooldown=lock_cooldown,
+        dns_ttl=dns_ttl,
+        tls_resume=tls_resume,
+        transport=transport,
+        simulate=simulate,
+        latency=sim_latency,
+        lockout_window=lockout_window or interval or 30,
         debug=debug,
         quiet=quiet
     )
@@ -185,4 +308,9 @@ def main(
     spraycharles.initialize_module()
     console.print(ascii())
     spraycharles.pre_spray_info()
-    spraycharles.spray()
\ No newline at end of file
+
+    try:
+        with profiler.phase("spray"):
+            spraycharles.spray()
+    finally:
+        profiler.finish()
\ No newline at end of file
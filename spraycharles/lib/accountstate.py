@@ -0,0 +1,134 @@
+import json
+import os
+from enum import Enum
+from pathlib import Path
+
+from spraycharles.lib.clock import Clock
+from spraycharles.lib.logger import logger
+from spraycharles.lib.utils import LoginResult, SMBStatus
+
+
+class AccountState(str, Enum):
+    INVALID  = "invalid"
+    DISABLED = "disabled"
+    LOCKED   = "locked"
+    FOUND    = "found"
+
+    def __str__(self):
+        return self.value
+
+
+#
+# State an account moves to after a classified attempt, if any
+#
+TRANSITIONS = {
+    LoginResult.INVALID_USER                : AccountState.INVALID,
+    LoginResult.DISABLED                    : AccountState.DISABLED,
+    LoginResult.LOCKED                      : AccountState.LOCKED,
+    LoginResult.SUCCESS                     : AccountState.FOUND,
+    SMBStatus.STATUS_ACCOUNT_DISABLED       : AccountState.DISABLED,
+    SMBStatus.STATUS_ACCOUNT_LOCKED_OUT     : AccountState.LOCKED,
+    SMBStatus.STATUS_SUCCESS                : AccountState.FOUND,
+    SMBStatus.STATUS_PASSWORD_EXPIRED       : AccountState.FOUND,
+    SMBStatus.STATUS_PASSWORD_MUST_CHANGE   : AccountState.FOUND,
+}
+
+
+class AccountTracker:
+    """
+    Per-account state fed by classified attempts. Accounts found to be
+    invalid or disabled, or whose password was found, leave the active set
+    for good; locked accounts leave it for a cooldown. With a path, state
+    is kept in a JSON file across runs, per scope (module and target host),
+    so a file shared between sprays only prunes accounts for the service
+    they were seen on. Changes are written by save(), at most every
+    FLUSH_SECONDS from observe() and whenever the spray calls it
+    """
+
+    FLUSH_SECONDS = 30
+
+    def __init__(self, path=None, lock_cooldown=30, clock=None, scope="default"):
+        self.clock = clock or Clock()
+        self.path = None if path is None else Path(path).expanduser()
+        self.lock_cooldown = lock_cooldown * 60
+        self.scope = scope
+        self.scopes = {}
+        self.dirty = False
+        self.saved = self.clock.time()
+
+        if self.path is not None and self.path.exists():
+            try:
+                self.scopes = json.loads(self.path.read_text()).get("scopes", {})
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not read account state from {self.path}: {e}")
+
+        self.accounts = self.scopes.setdefault(scope, {})
+        self.loaded = len(self.accounts)
+
+
+    #
+    # Whether attempts against the account can still matter
+    #
+    def active(self, key):
+        entry = self.accounts.get(key)
+        if entry is None:
+            return True
+
+        if entry["state"] == AccountState.LOCKED and entry["until"] <= self.clock.time():
+            return True
+
+        return False
+
+
+    #
+    # Move an account on by a classified attempt. Returns the new state, if it changed
+    #
+    def observe(self, key, result):
+        state = TRANSITIONS.get(result.result) or TRANSITIONS.get(result.smb_login)
+        if state is None:
+            return None
+
+        now = self.clock.time()
+        self.accounts[key] = {
+            "state": state.value,
+            "until": now + self.lock_cooldown if state == AccountState.LOCKED else None,
+            "updated": now,
+        }
+        self.dirty = True
+
+        if now - self.saved >= self.FLUSH_SECONDS:
+            self.save()
+        return state
+
+
+    #
+    # Write the state file if anything changed since the last save
+    #
+    def save(self):
+        self.saved = self.clock.time()
+        if self.path is None or not self.dirty:
+            return
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps({"scopes": self.scopes}))
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+
+    #
+    # Number of accounts out of the active set, per state
+    #
+    def counts(self):
+        counts = {state: 0 for state in AccountState}
+        for key, entry in self.accounts.items():
+            if not self.active(key):
+                counts[AccountState(entry["state"])] += 1
+        return counts
+
+
+    def describe(self):
+        counts = self.counts()
+        summary = ", ".join(f"{count} {state}" for state, count in counts.items() if count) or "all active"
+        source = f"{self.path.name}: " if self.path is not None else ""
+        return f"{source}{summary}"
@@ -1,10 +1,21 @@
-import json
 import numpy
 from enum import Enum
 from rich.table import Table
 
 from spraycharles.lib.logger import console, logger
-from spraycharles.lib.utils import discord, slack, teams, SMBStatus, SprayResult, HookSvc
+from spraycharles.lib.profiler import profiler
+from spraycharles.lib.results import iter_records
+from spraycharles.lib.utils import discord, slack, teams, SMBStatus, SprayResult, HookSvc, LoginResult
+
+#
+# NTSTATUS codes indicating valid credentials
+#
+SMB_HIT_STATUSES = [
+    SMBStatus.STATUS_SUCCESS,
+    SMBStatus.STATUS_ACCOUNT_DISABLED,
+    SMBStatus.STATUS_PASSWORD_EXPIRED,
+    SMBStatus.STATUS_PASSWORD_MUST_CHANGE,
+]
 
 
 class Analyzer:
@@ -20,37 +31,67 @@ class Analyzer:
     # Run analysis over spray result file
     #
     def analyze(self):
-        print()
-        logger.debug(f"Opening results file: {self.resultsfile}")
+        with profiler.phase("analyze"):
+            print()
+            logger.debug(f"Opening results file: {self.resultsfile}")
+
+            #
+            # Output file isn't technically JSON compliant, but each line is a JSON object
+            # So read each line (across segments, for segmented output) into a list of records
+            #
+            with profiler.phase("read"):
+                logger.info("Reading JSON spray result objects")
+                responses = list(iter_records(self.resultsfile))
+
+            # an empty manifest, or only empty segments
+            if not responses:
+                logger.info("No successful logins")
+                print()
+                return 0
+
+            #
+            # Determine the type of service that was sprayed
+            #
+            match responses[0].module:
+                case "Office365" | "Okta":
+                    return self.O365_analyze(responses)
+                case "SMB":
+                    return self.smb_analyze(responses)
+                case _:
+                    return self.http_analyze(responses)
 
-        #
-        # Output file isn't technically JSON compliant, but each line is a JSON object
-        # So read each line and load into a list of JSON objects
-        #
-        with open(self.resultsfile, "r") as resultsfile:
-            logger.info("Reading JSON spray result objects")
-            responses = [json.loads(line) for line in resultsfile]
-            
-        #
-        # Determine the type of service that was sprayed
-        #
-        match responses[0][SprayResult.MODULE]:
-            case "Office365":
-                return self.O365_analyze(responses)
+    #
+    # Find hits in a list of result objects, without any output
+    #
+    @staticmethod
+    def hits(responses):
+        if not responses:
+            return []
+
+        match responses[0].module:
+            case "Office365" | "Okta":
+                return Analyzer.O365_hits(responses)
             case "SMB":
-                return self.smb_analyze(responses)
+                return Analyzer.smb_hits(responses)
             case _:
-                return self.http_analyze(responses)
+                return Analyzer.http_hits(responses)
+
+
+    #
+    # O365 and Okta modules classify results at spray time
+    #
+    @staticmethod
+    def O365_hits(responses):
+        return [resp for resp in responses if resp.result == LoginResult.SUCCESS]
+
 
     # 
     # Analyzes O365 and Okta results
     #
     def O365_analyze(self, responses):
-        results = []
-        for line in responses:
-            results.append(line.get("Result"))
+        hits = Analyzer.O365_hits(responses)
 
-        if "Success" in results:
+        if hits:
             logger.info("Identified potentially successful logins!")
             print()
 
@@ -60,21 +101,18 @@ class Analyzer:
             success_table.add_column(SprayResult.PASSWORD)
             success_table.add_column(SprayResult.MESSAGE, justify="right")
 
-            count = 0
-            for resp in responses:
-                if resp.get(SprayResult.RESULT) == "Success":
-                    count += 1
-                    success_table.add_row(
-                        str(resp.get(SprayResult.USERNAME)),
-                        str(resp.get(SprayResult.PASSWORD)),
-                        str(resp.get(SprayResult.MESSAGE))
-                    )
+            for resp in hits:
+                success_table.add_row(
+                    str(resp.username),
+                    str(resp.password),
+                    str(resp.message)
+                )
 
             console.print(success_table)
 
-            self.send_notification(count)
+            self.send_notification(len(hits))
 
-            return count
+            return len(hits)
         else:
             logger.info("No successful logins")
             print()
@@ -82,38 +120,48 @@ class Analyzer:
 
 
     #
-    # Standard HTTP module analysis
+    # Responses classified Success by a module rule, plus unclassified responses
+    # with outlying lengths (more than 2 standard deviations from the mean)
     #
-    def http_analyze(self, responses):
-        len_with_timeouts = len(responses)
+    @staticmethod
+    def http_hits(responses):
 
-        # remove lines with timeouts
-        responses = [line for line in responses if line.get(SprayResult.RESPONSE_CODE) != "TIMEOUT"]
+        # remove timeouts and records without a response length
+        responses = [resp for resp in responses if not resp.timeout and resp.length is not None]
 
-        response_lengths = []
-        # Get the response length column for analysis
-        for indx, line in enumerate(responses):
-            response_lengths.append(int(line.get(SprayResult.RESPONSE_LENGTH)))
-
-        logger.info("Calculating mean and standard deviation of response lengths")
+        if not responses:
+            return []
 
         # find outlying response lengths
-        length_elements = numpy.array(response_lengths)
+        length_elements = numpy.array([resp.length for resp in responses])
         length_mean = numpy.mean(length_elements, axis=0)
         length_sd = numpy.std(length_elements, axis=0)
-        
-        logger.info("Checking for outliers")
-        
-        length_outliers = [
+
+        length_outliers = set(
             x
-            for x in length_elements
+            for x in length_elements.tolist()
             if (x > length_mean + 2 * length_sd or x < length_mean - 2 * length_sd)
+        )
+
+        # rows a module rule classified are trusted over the length statistics
+        return [
+            resp for resp in responses
+            if resp.result == LoginResult.SUCCESS
+            or (resp.result is None and resp.length in length_outliers)
         ]
 
-        length_outliers = list(set(length_outliers))
+
+    #
+    # Standard HTTP module analysis
+    #
+    def http_analyze(self, responses):
+        logger.info("Calculating mean and standard deviation of response lengths")
+        logger.info("Checking for outliers")
+
+        hits = Analyzer.http_hits(responses)
 
         # print out logins with outlying response lengths
-        if len(length_outliers) > 0:
+        if len(hits) > 0:
             logger.info("Identified potentially successful logins!")
             print()
 
@@ -124,45 +172,40 @@ class Analyzer:
             success_table.add_column(SprayResult.RESPONSE_CODE, justify="right")
             success_table.add_column(SprayResult.RESPONSE_LENGTH, justify="right")
 
-            count = 0
-            for resp in responses:
-                if int(resp.get("Response Length")) in length_outliers:
-                    count += 1
-                    success_table.add_row(
-                        str(resp.get(SprayResult.USERNAME)),
-                        str(resp.get(SprayResult.PASSWORD)),
-                        str(resp.get(SprayResult.RESPONSE_CODE)),
-                        str(resp.get(SprayResult.RESPONSE_LENGTH))
-                    )
+            for resp in hits:
+                success_table.add_row(
+                    str(resp.username),
+                    str(resp.password),
+                    str(resp.code),
+                    str(resp.length)
+                )
                 
             console.print(success_table)
 
-            self.send_notification(count)
+            self.send_notification(len(hits))
 
             print()
 
-            return count
+            return len(hits)
         else:
             logger.info("No outliers found or not enough data to find statistical significance")
             print()
             return 0
 
 
+    #
+    # SMB results with NTSTATUS codes indicating valid credentials
+    #
+    @staticmethod
+    def smb_hits(responses):
+        return [result for result in responses if result.smb_login in SMB_HIT_STATUSES]
+
+
     # 
     # Check for SMB successes against SMB status codes
     #
     def smb_analyze(self, responses):
-        successes = []
-        positive_statuses = [
-            SMBStatus.STATUS_SUCCESS,
-            SMBStatus.STATUS_ACCOUNT_DISABLED,
-            SMBStatus.STATUS_PASSWORD_EXPIRED,
-            SMBStatus.STATUS_PASSWORD_MUST_CHANGE,
-        ]
-
-        for result in responses:
-            if SMBStatus(result.get(SprayResult.SMB_LOGIN)) in positive_statuses:
-                successes.append(result)
+        successes = Analyzer.smb_hits(responses)
 
         if len(successes) > 0:
             logger.info("Identified potentially successful logins!")
@@ -175,9 +218,9 @@ class Analyzer:
 
             for result in successes:
                 success_table.add_row(
-                    str(result.get(SprayResult.USERNAME)),
-                    str(result.get(SprayResult.PASSWORD)),
-                    str(result.get(SprayResult.SMB_LOGIN))
+                    str(result.username),
+                    str(result.password),
+                    str(result.smb_login)
                 )
 
             console.print(success_table)
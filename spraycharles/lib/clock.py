@@ -0,0 +1,54 @@
+import datetime
+import time
+
+
+class Clock:
+    """
+    Time source for the spray scheduler. Every clock read and wait that
+    decides when attempts happen (intervals, jitter, retries, lockout
+    cooldowns) goes through one, so a spray can run on a virtual clock
+    """
+
+    def time(self):
+        return time.time()
+
+
+    #
+    # Local datetime of the clock's current time
+    #
+    def now(self):
+        return datetime.datetime.fromtimestamp(self.time())
+
+
+    #
+    # Wait for event for up to timeout seconds. Returns whether it was set
+    #
+    def wait(self, event, timeout):
+        return event.wait(timeout)
+
+
+class VirtualClock(Clock):
+    """
+    Clock that only moves when advanced. Waits return at once with the
+    clock moved past the timeout, so days of intervals and jitter pass in
+    the time it takes to run the spray loop
+    """
+
+    def __init__(self, start=None):
+        self.current = time.time() if start is None else start
+
+
+    def time(self):
+        return self.current
+
+
+    def advance(self, seconds):
+        self.current += max(0, seconds)
+
+
+    def wait(self, event, timeout):
+        if event.is_set():
+            return True
+
+        self.advance(timeout)
+        return False
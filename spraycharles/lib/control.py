@@ -0,0 +1,231 @@
+import json
+import os
+import socket
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler
+from pathlib import Path
+
+from spraycharles.lib.clock import Clock
+from spraycharles.lib.logger import logger
+from spraycharles.lib.metrics import CONTENT_TYPE
+
+
+class SprayStopped(Exception):
+    """
+    Raised inside the spray loop once a stop was requested, to unwind to the
+    end-of-spray summary and analysis
+    """
+
+
+class SprayControl:
+    """
+    Pause/resume/stop state shared between the spray loop and the control
+    API. All waits in the spray go through here, so a stop or a changed
+    interval takes effect without waiting out a sleep. Waits run on clock
+    """
+
+    def __init__(self, clock=None):
+        self.clock = clock or Clock()
+        self.state = "starting"
+        self._stop = threading.Event()
+        self._resume = threading.Event()
+        self._resume.set()
+        self._wake = threading.Event()
+
+
+    @property
+    def paused(self):
+        return not self._resume.is_set()
+
+
+    @property
+    def stopping(self):
+        return self._stop.is_set()
+
+
+    def pause(self):
+        self._resume.clear()
+
+
+    def resume(self):
+        self._resume.set()
+
+
+    def stop(self):
+        self._stop.set()
+        self._resume.set()
+        self._wake.set()
+
+
+    #
+    # Interrupt a sleep so its deadline is re-evaluated
+    #
+    def wake(self):
+        self._wake.set()
+
+
+    #
+    # Called before each login attempt - blocks while paused
+    #
+    def checkpoint(self):
+        if self.paused:
+            state, self.state = self.state, "paused"
+            logger.info("Spray paused")
+            self._resume.wait()
+            self.state = state
+            if not self.stopping:
+                logger.info("Spray resumed")
+
+        if self.stopping:
+            raise SprayStopped()
+
+
+    #
+    # Sleep until deadline() (re-read whenever woken) or a stop is requested
+    #
+    def sleep_until(self, deadline):
+        while True:
+            if self.stopping:
+                raise SprayStopped()
+
+            remaining = deadline() - self.clock.time()
+            if remaining <= 0:
+                return
+
+            self.clock.wait(self._wake, remaining)
+            self._wake.clear()
+
+
+    def sleep(self, seconds):
+        end = self.clock.time() + seconds
+        self.sleep_until(lambda: end)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class ControlHandler(BaseHTTPRequestHandler):
+    """
+    Local control API:
+        GET  /status    spray settings, progress and counters
+        GET  /metrics   OpenMetrics text
+        POST /pause     pause before the next login attempt
+        POST /resume
+        POST /config    {"interval": minutes, "jitter": seconds, "jitter_min": seconds}
+        POST /stop      finish the current attempt, then analyze and exit
+    """
+
+    server_version = "spraycharles"
+
+    def address_string(self):
+        return "control"
+
+
+    def log_message(self, format, *args):
+        logger.debug(f"Control API: {format % args}")
+
+
+    def reply(self, code, body):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+    def do_GET(self):
+        if self.path == "/status":
+            return self.reply(200, self.server.spray.status())
+
+        if self.path == "/metrics":
+            data = self.server.spray.metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        self.reply(404, {"error": "not found"})
+
+
+    def do_POST(self):
+        spray = self.server.spray
+        control = spray.control
+
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+
+        if self.path == "/pause":
+            control.pause()
+            logger.info("Pause requested through the control API")
+        elif self.path == "/resume":
+            control.resume()
+        elif self.path == "/stop":
+            logger.info("Stop requested through the control API")
+            control.stop()
+        elif self.path == "/config":
+            try:
+                spray.set_timing(**json.loads(body or b"{}"))
+            except (ValueError, TypeError) as e:
+                return self.reply(400, {"error": str(e)})
+            control.wake()
+        else:
+            return self.reply(404, {"error": "not found"})
+
+        self.reply(200, spray.status())
+
+
+class ControlServer:
+    """
+    Serves the control API on a Unix socket in a background thread. The
+    socket is only accessible to the current user
+    """
+
+    def __init__(self, spray, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        #
+        # Clear a socket left behind by a spray that didn't exit cleanly
+        #
+        if self.path.exists():
+            probe = socket.socket(socket.AF_UNIX)
+            try:
+                probe.connect(str(self.path))
+                raise OSError(f"Control socket {self.path} is in use by another spray")
+            except ConnectionRefusedError:
+                self.path.unlink()
+            finally:
+                probe.close()
+
+        #
+        # Restrict the socket to the current user before it accepts connections.
+        # The umask is process-wide, so the mode is set on the socket itself
+        #
+        self.server = UnixHTTPServer(str(self.path), ControlHandler, bind_and_activate=False)
+        try:
+            self.server.server_bind()
+            os.chmod(self.path, 0o600)
+            self.server.server_activate()
+        except OSError:
+            self.server.server_close()
+            self.path.unlink(missing_ok=True)
+            raise
+
+        self.server.spray = spray
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+
+    def start(self):
+        self.thread.start()
+        logger.info(f"Control API listening on {self.path}")
+
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.path.unlink(missing_ok=True)
@@ -0,0 +1,134 @@
+import datetime
+import threading
+import time
+from collections import deque
+
+from rich.console import Group
+from rich.live import Live
+from rich.panel import Panel
+from rich.table import Table
+
+from spraycharles.lib.analyze import SMB_HIT_STATUSES
+from spraycharles.lib.logger import console
+from spraycharles.lib.utils import LoginResult, SprayResult
+
+
+#
+# Window for the attempt rate, in seconds
+#
+RATE_WINDOW = 60
+
+
+class Dashboard:
+    """
+    Live summary of a running spray, redrawn at a fixed rate from a
+    background thread instead of printing every attempt: counts per result,
+    errors, attempt rate, ETA and the most recent hits, above the spray's
+    progress bar. Per-attempt detail only goes to the results file
+    """
+
+    def __init__(self, spray, refresh_per_second=2, recent=8):
+        self.spray = spray
+        self.hits = deque(maxlen=recent)
+        self.hit_count = 0
+        self._times = deque()
+        self._lock = threading.Lock()
+        self.refresh_per_second = refresh_per_second
+        self.live = None
+
+
+    #
+    # The live display renders on creation, so it is built once the spray is running
+    #
+    def start(self):
+        if self.live is None:
+            self.live = Live(
+                console=console,
+                get_renderable=self.render,
+                refresh_per_second=self.refresh_per_second,
+            )
+        self.live.start()
+
+
+    def stop(self):
+        if self.live is not None:
+            self.live.stop()
+
+
+    #
+    # Called for every classified attempt
+    #
+    def record(self, result):
+        now = time.time()
+        with self._lock:
+            self._times.append(now)
+
+        if result.result == LoginResult.SUCCESS.value or result.smb_login in SMB_HIT_STATUSES:
+            self.hits.append((now, result))
+            self.hit_count += 1
+
+
+    #
+    # Attempts per minute over the rate window
+    #
+    def rate(self):
+        cutoff = time.time() - RATE_WINDOW
+        with self._lock:
+            while self._times and self._times[0] < cutoff:
+                self._times.popleft()
+            count = len(self._times)
+
+        elapsed = min(RATE_WINDOW, time.time() - self.spray.started)
+        return count / elapsed * 60 if elapsed > 0 else 0.0
+
+
+    def render(self):
+        spray = self.spray
+        metrics = spray.metrics
+
+        state = spray.control.state
+        if spray.control.paused:
+            state = "paused"
+        elif spray.sleeping_until is not None:
+            state = f"sleeping until {datetime.datetime.fromtimestamp(spray.sleeping_until()).strftime('%m-%d %H:%M:%S')}"
+
+        results = metrics.totals("spraycharles_attempts", "result")
+        errors = metrics.totals("spraycharles_errors", "exception")
+
+        stats = Table.grid(padding=(0, 2))
+        stats.add_column(style="bold")
+        stats.add_column()
+        stats.add_row("State", state)
+        stats.add_row("Password", f"{spray.current_password or '-'} ({len(spray.sprayed)}/{len(spray.passwords)} sprayed)")
+        stats.add_row("Attempts", f"{spray.sent} sent, {self.rate():.1f}/min")
+        stats.add_row("Results", ", ".join(f"{name} {count:g}" for name, count in sorted(results.items())) or "-")
+        stats.add_row("Errors", ", ".join(f"{name} {count:g}" for name, count in sorted(errors.items())) or "-")
+        stats.add_row("Hits", f"{self.hit_count} classified, {spray.total_hits} from analysis")
+        stats.add_row("ETA", str(datetime.timedelta(seconds=spray._eta())))
+        if spray.tls_sessions and spray.tls_sessions.handshakes:
+            stats.add_row("TLS", f"{spray.tls_sessions.resumed}/{spray.tls_sessions.handshakes} handshakes resumed")
+
+        renderables = [stats]
+
+        if self.hits:
+            hits = Table(title="Recent hits", title_justify="left", title_style="bold", expand=True)
+            hits.add_column("Time")
+            hits.add_column(SprayResult.USERNAME)
+            hits.add_column(SprayResult.PASSWORD)
+            hits.add_column(SprayResult.MESSAGE)
+            for when, result in reversed(list(self.hits)):
+                hits.add_row(
+                    datetime.datetime.fromtimestamp(when).strftime("%H:%M:%S"),
+                    result.username,
+                    result.password,
+                    result.message or result.smb_login or "",
+                )
+            renderables.append(hits)
+
+        renderables.append(spray.progress)
+
+        return Panel(
+            Group(*renderables),
+            title=f"spraycharles - {spray.target.NAME} - {spray.host}",
+            title_align="left",
+        )
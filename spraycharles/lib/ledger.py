@@ -0,0 +1,137 @@
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+from spraycharles.lib.logger import logger
+from spraycharles.lib.utils import LoginResult
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS policy (
+    key     TEXT PRIMARY KEY,
+    value   INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS attempts (
+    id          INTEGER PRIMARY KEY,
+    account     TEXT NOT NULL,
+    password    TEXT NOT NULL,
+    module      TEXT NOT NULL,
+    host        TEXT,
+    pid         INTEGER NOT NULL,
+    ts          REAL NOT NULL,
+    result      TEXT
+);
+CREATE INDEX IF NOT EXISTS attempts_account_ts ON attempts (account, ts);
+CREATE INDEX IF NOT EXISTS attempts_account_password ON attempts (account, password);
+"""
+
+
+class LockoutLedger:
+    """
+    SQLite store shared by spray processes targeting one directory through
+    different modules. Every attempt is reserved in the ledger before it is
+    sent, so the attempts against an account from all processes together
+    stay within one lockout budget (attempts per interval, sliding window).
+    Reservations are made in an IMMEDIATE transaction, which holds the
+    database write lock for the check and the insert
+    """
+
+    READY = "ready"
+    DEFERRED = "deferred"
+    DONE = "done"
+
+    def __init__(self, path, attempts, interval, module, host):
+        self.path = Path(path)
+        self.module = module
+        self.host = host
+        self.pid = os.getpid()
+
+        self.conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+        #
+        # The first process to open the ledger sets the lockout policy for the engagement
+        #
+        self.conn.execute("BEGIN IMMEDIATE")
+        self.conn.execute("INSERT OR IGNORE INTO policy VALUES ('attempts', ?), ('interval', ?)", (attempts, interval))
+        policy = dict(self.conn.execute("SELECT key, value FROM policy"))
+        self.conn.execute("COMMIT")
+
+        self.attempts = policy["attempts"]
+        self.interval = policy["interval"]
+
+        if (self.attempts, self.interval) != (attempts, interval):
+            logger.warning(f"Ledger budget is {self.attempts} attempts per {self.interval} minutes, which overrides -a/-i for shared accounts")
+
+
+    @property
+    def window(self):
+        return self.interval * 60
+
+
+    #
+    # Reserve an attempt for account/password. Returns DONE if the pair was
+    # already tried or the account was found by any process, DEFERRED if the
+    # account has no budget left in the window, else READY and the entry id
+    # to record the result against
+    #
+    def reserve(self, account, password):
+        now = time.time()
+
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            done = self.conn.execute(
+                "SELECT 1 FROM attempts WHERE account = ? AND (password = ? OR result = ?) LIMIT 1",
+                (account, password, LoginResult.SUCCESS.value),
+            ).fetchone()
+            if done:
+                return LockoutLedger.DONE, None
+
+            (used,) = self.conn.execute(
+                "SELECT COUNT(*) FROM attempts WHERE account = ? AND ts > ?",
+                (account, now - self.window),
+            ).fetchone()
+            if used >= self.attempts:
+                return LockoutLedger.DEFERRED, None
+
+            cursor = self.conn.execute(
+                "INSERT INTO attempts (account, password, module, host, pid, ts) VALUES (?, ?, ?, ?, ?, ?)",
+                (account, password, self.module, self.host, self.pid, now),
+            )
+            return LockoutLedger.READY, cursor.lastrowid
+        finally:
+            self.conn.execute("COMMIT")
+
+
+    #
+    # Record the outcome of a reserved attempt
+    #
+    def record(self, entry, result):
+        self.conn.execute("UPDATE attempts SET result = ? WHERE id = ?", (result.result, entry))
+
+
+    #
+    # Seconds until the account regains an attempt in the window
+    #
+    def wait_time(self, account):
+        now = time.time()
+        rows = self.conn.execute(
+            "SELECT ts FROM attempts WHERE account = ? AND ts > ? ORDER BY ts",
+            (account, now - self.window),
+        ).fetchall()
+
+        if len(rows) < self.attempts:
+            return 0
+
+        return max(0, rows[len(rows) - self.attempts][0] + self.window - now)
+
+
+    def describe(self):
+        (accounts,) = self.conn.execute("SELECT COUNT(DISTINCT account) FROM attempts").fetchone()
+        return f"{self.path.name} ({self.attempts} per {self.interval} min, {accounts} accounts tracked)"
+
+
+    def close(self):
+        self.conn.close()
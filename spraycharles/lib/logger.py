@@ -1,4 +1,8 @@
+import atexit
 import logging
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener
 from rich.logging import RichHandler
 from rich.console import Console
 from rich.console import Console
@@ -39,4 +43,37 @@ def init_logger(debug):
             datefmt='[%X]'
         )
     )
-    logger.addHandler(richHandler)
\ No newline at end of file
+    logger.addHandler(richHandler)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Hands records to the queue untouched - QueueHandler.prepare() would
+    format them on the calling thread, which is what the queue is there to avoid.
+    Records are only read by the listener in this process
+    """
+
+    def prepare(self, record):
+        return record
+
+
+#
+# Spray logfile (UTC timestamps), written by a background thread so logging
+# never blocks the spray loop. Queued records are flushed at exit
+#
+def init_file_logger(filename):
+    formatter = logging.Formatter("%(asctime)s UTC - %(levelname)s - %(message)s")
+    formatter.converter = time.gmtime
+
+    fileHandler = logging.FileHandler(filename)
+    fileHandler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, fileHandler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    return listener
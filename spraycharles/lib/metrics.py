@@ -0,0 +1,285 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from spraycharles.lib.logger import logger
+
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+#
+# Latency buckets in seconds, upper bounds
+#
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+#
+# name: (type, help)
+#
+METRICS = {
+    "spraycharles_attempts":                ("counter", "Login attempts by module and result"),
+    "spraycharles_errors":                  ("counter", "Exceptions raised while sending login attempts, by type"),
+    "spraycharles_retries":                 ("counter", "Login attempts retried after a connection error"),
+    "spraycharles_attempt_duration_seconds": ("histogram", "Time to send and classify a login attempt"),
+    "spraycharles_phase_seconds":           ("counter", "Time spent per spray phase"),
+    "spraycharles_tls_handshakes":          ("counter", "TLS handshakes with --tls-resume, by whether a session was resumed"),
+    "spraycharles_prefetch":                ("counter", "Values prefetched ahead of attempts, by whether they were used, missing or expired"),
+    "spraycharles_tls_resumption_ratio":    ("gauge", "Share of TLS handshakes that resumed a session"),
+    "spraycharles_passwords_sprayed":       ("gauge", "Passwords sprayed so far"),
+    "spraycharles_passwords":               ("gauge", "Passwords in the list"),
+    "spraycharles_accounts":                ("gauge", "Unique accounts being sprayed"),
+    "spraycharles_interval_position":       ("gauge", "Passwords sprayed in the current interval"),
+    "spraycharles_hits":                    ("gauge", "Potential hits found by the analyzer"),
+    "spraycharles_eta_seconds":             ("gauge", "Estimated time until the spray completes"),
+}
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """
+    In-process counters, gauges and latency histograms for a spray. Gauges
+    are callables evaluated when metrics are rendered, so the spray loop
+    only pays for counter and histogram updates
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self.started = time.time()
+
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+
+    def gauge(self, name, function):
+        self.gauges[name] = function
+
+
+    #
+    # Mean of a histogram across all label values, or None before any observations
+    #
+    def mean(self, name):
+        with self._lock:
+            observed = [h for (n, _), h in self.histograms.items() if n == name]
+            count = sum(h.count for h in observed)
+            return sum(h.sum for h in observed) / count if count else None
+
+
+    #
+    # Counter values summed per value of one label
+    #
+    def totals(self, name, label):
+        totals = {}
+        with self._lock:
+            for (n, labels), value in self.counters.items():
+                if n == name:
+                    key = dict(labels).get(label)
+                    totals[key] = totals.get(key, 0) + value
+        return totals
+
+
+    #
+    # Add the time spent in the block to spraycharles_phase_seconds{phase}
+    #
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.inc("spraycharles_phase_seconds", time.perf_counter() - start, phase=name)
+
+
+    def _gauge_values(self):
+        values = {}
+        for name, function in self.gauges.items():
+            try:
+                values[name] = function()
+            except Exception as e:
+                logger.debug(f"Metrics gauge {name} failed: {e}")
+        return values
+
+
+    #
+    # OpenMetrics text exposition
+    #
+    def render(self):
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {key: (list(h.counts), h.sum, h.count) for key, h in self.histograms.items()}
+        gauges = self._gauge_values()
+
+        lines = []
+        for name, (kind, help) in METRICS.items():
+            if kind == "counter":
+                samples = [(labels, value) for (n, labels), value in counters.items() if n == name]
+            elif kind == "histogram":
+                samples = [(labels, value) for (n, labels), value in histograms.items() if n == name]
+            else:
+                samples = [((), gauges[name])] if gauges.get(name) is not None else []
+
+            if not samples:
+                continue
+
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"# HELP {name} {help}")
+
+            for labels, value in sorted(samples):
+                if kind == "counter":
+                    lines.append(f"{name}_total{_labels(labels)} {value}")
+                elif kind == "gauge":
+                    lines.append(f"{name}{_labels(labels)} {value}")
+                else:
+                    counts, total, count = value
+                    cumulative = 0
+                    for bound, bucket in zip([*BUCKETS, "+Inf"], counts):
+                        cumulative += bucket
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+                    lines.append(f"{name}_count{_labels(labels)} {count}")
+                    lines.append(f"{name}_sum{_labels(labels)} {total}")
+
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+    #
+    # JSON-friendly snapshot for the stats file
+    #
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {key: (list(h.counts), h.sum, h.count) for key, h in self.histograms.items()}
+
+        snapshot = {"timestamp": time.time(), "uptime": round(time.time() - self.started, 3)}
+
+        for (name, labels), value in sorted(counters.items()):
+            snapshot.setdefault(name, []).append({**dict(labels), "value": value})
+
+        for (name, labels), (counts, total, count) in sorted(histograms.items()):
+            snapshot.setdefault(name, []).append({
+                **dict(labels),
+                "count": count,
+                "sum": total,
+                "mean": total / count if count else None,
+                "buckets": dict(zip([str(b) for b in [*BUCKETS, "+Inf"]], counts)),
+            })
+
+        snapshot.update(self._gauge_values())
+        return snapshot
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+
+        data = self.server.metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+    def log_message(self, format, *args):
+        logger.debug(f"Metrics endpoint: {format % args}")
+
+
+class MetricsExporter:
+    """
+    Serves /metrics on localhost and/or periodically writes a JSON stats file,
+    from background threads
+    """
+
+    def __init__(self, metrics, port=None, stats_file=None, period=30):
+        self.metrics = metrics
+        self.stats_file = None if stats_file is None else Path(stats_file)
+        self.period = period
+        self.server = None
+        self._stop = threading.Event()
+
+        if port is not None:
+            self.server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+            self.server.daemon_threads = True
+            self.server.metrics = metrics
+
+
+    def start(self):
+        if self.server:
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+            logger.info(f"Metrics endpoint listening on http://127.0.0.1:{self.server.server_address[1]}/metrics")
+
+        if self.stats_file:
+            threading.Thread(target=self._write_loop, daemon=True).start()
+
+
+    def _write_loop(self):
+        while not self._stop.wait(self.period):
+            self.write_stats()
+
+
+    #
+    # Replace the stats file atomically, so readers never see a partial write
+    #
+    def write_stats(self):
+        tmp = self.stats_file.with_name(self.stats_file.name + ".tmp")
+        try:
+            tmp.write_text(json.dumps(self.metrics.snapshot(), indent=2))
+            os.replace(tmp, self.stats_file)
+        except OSError as e:
+            logger.debug(f"Error writing stats file: {e}")
+
+
+    def close(self):
+        self._stop.set()
+
+        if self.stats_file:
+            self.write_stats()
+
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
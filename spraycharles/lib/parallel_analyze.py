@@ -0,0 +1,294 @@
+import glob
+import gzip
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy
+from rich.table import Table
+
+from spraycharles.lib.analyze import Analyzer
+from spraycharles.lib.logger import console, logger
+from spraycharles.lib.profiler import profiler
+from spraycharles.lib.results import iter_records, result_files
+from spraycharles.lib.serialization import decode_record
+from spraycharles.lib.utils import LoginResult, SprayResult
+
+
+#
+# Plain results files are split into chunks of about this many bytes
+#
+CHUNK_BYTES = 32 * 1024 * 1024
+
+
+class RunningStats:
+    """
+    Count, mean and sum of squared deviations (M2) of a sample, mergeable
+    with the exact pairwise update of Chan et al., so chunks can be
+    summarized independently and combined in any order
+    """
+
+    __slots__ = ("n", "mean", "m2")
+
+    def __init__(self, n=0, mean=0.0, m2=0.0):
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+
+
+    @classmethod
+    def of(cls, values):
+        if not values:
+            return cls()
+        values = numpy.asarray(values, dtype=numpy.float64)
+        mean = values.mean()
+        return cls(len(values), float(mean), float(((values - mean) ** 2).sum()))
+
+
+    def merge(self, other):
+        if other.n == 0:
+            return self
+        if self.n == 0:
+            return RunningStats(other.n, other.mean, other.m2)
+
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        return RunningStats(
+            n,
+            self.mean + delta * other.n / n,
+            self.m2 + other.m2 + delta * delta * self.n * other.n / n,
+        )
+
+
+    #
+    # Population standard deviation, matching numpy.std
+    #
+    @property
+    def sd(self):
+        return math.sqrt(self.m2 / self.n) if self.n else 0.0
+
+
+#
+# Results files named by paths, directories (their *.json files) and globs
+#
+def expand_inputs(specs):
+    paths = []
+    for spec in specs:
+        path = Path(spec).expanduser()
+        if path.is_dir():
+            paths.extend(sorted(path.glob("*.json")))
+        elif path.exists():
+            paths.append(path)
+        else:
+            paths.extend(Path(match) for match in sorted(glob.glob(str(path))))
+
+    # a file named twice is analyzed once
+    return list(dict.fromkeys(paths))
+
+
+#
+# Byte ranges of a results file's data: whole gzipped segments, and chunks of plain files
+#
+def _units(path):
+    units = []
+    for file in result_files(path):
+        if file.suffix == ".gz":
+            units.append((str(file), 0, None))
+            continue
+
+        size = file.stat().st_size
+        for start in range(0, max(size, 1), CHUNK_BYTES):
+            units.append((str(file), start, min(start + CHUNK_BYTES, size)))
+    return units
+
+
+#
+# Records of the lines starting in [start, end) - a line straddling the
+# start belongs to the previous chunk
+#
+def _read_chunk(file, start, end):
+    if end is None:
+        with gzip.open(file, "rb") as f:
+            for line in f:
+                if line.strip():
+                    yield decode_record(line)
+        return
+
+    with open(file, "rb") as f:
+        if start:
+            f.seek(start - 1)
+            f.readline()
+
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            if line.strip():
+                yield decode_record(line)
+
+
+#
+# HTTP records with a response length to analyze
+#
+def _measured(record):
+    return not record.timeout and record.length is not None
+
+
+#
+# Pass 1 (worker): record count, response length statistics and classified hits of a chunk
+#
+def _scan_chunk(kind, file, start, end):
+    records = list(_read_chunk(file, start, end))
+
+    if kind == "O365":
+        return len(records), RunningStats(), Analyzer.O365_hits(records)
+    if kind == "SMB":
+        return len(records), RunningStats(), Analyzer.smb_hits(records)
+
+    lengths = [record.length for record in records if _measured(record)]
+    hits = [record for record in records if record.result == LoginResult.SUCCESS and _measured(record)]
+    return len(records), RunningStats.of(lengths), hits
+
+
+#
+# Pass 2 (worker): unclassified responses of a chunk with lengths outside [low, high]
+#
+def _outlier_chunk(file, start, end, low, high):
+    return [
+        record for record in _read_chunk(file, start, end)
+        if record.result is None and _measured(record)
+        and not low <= record.length <= high
+    ]
+
+
+class ParallelAnalyzer:
+    """
+    Analyzes many results files at once, fanning parsing out across a
+    process pool by file and by byte-range chunk. Hits are found the way
+    Analyzer finds them for each file on its own - length statistics are
+    per file, merged exactly across its chunks - and shown in one table
+    """
+
+    def __init__(self, paths, workers=None, notify=None, webhook=None, host=None):
+        self.paths = paths
+        self.workers = workers or os.cpu_count()
+        self.notify = notify
+        self.webhook = webhook
+        self.host = host
+
+
+    #
+    # Module family of a results file, from its first record
+    #
+    @staticmethod
+    def _kind(path):
+        first = next(iter_records(path), None)
+        if first is None:
+            return None
+
+        match first.module:
+            case "Office365" | "Okta":
+                return "O365"
+            case "SMB":
+                return "SMB"
+            case _:
+                return "HTTP"
+
+
+    def analyze(self):
+        with profiler.phase("analyze"):
+            print()
+            files = []
+            for path in self.paths:
+                try:
+                    kind = ParallelAnalyzer._kind(path)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Skipping {path}: {e}")
+                    continue
+                if kind is not None:
+                    files.append((path, kind, _units(path)))
+
+            chunks = sum(len(units) for _, _, units in files)
+            logger.info(f"Analyzing {len(files)} results file(s) in {chunks} chunk(s) with {self.workers} worker(s)")
+
+            counts = [0] * len(files)
+            stats = [RunningStats() for _ in files]
+            hits = [[] for _ in files]
+
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+
+                #
+                # Pass 1 - counts, length statistics and classified hits
+                #
+                with profiler.phase("scan"):
+                    futures = [
+                        (index, pool.submit(_scan_chunk, kind, *unit))
+                        for index, (_, kind, units) in enumerate(files)
+                        for unit in units
+                    ]
+                    for index, future in futures:
+                        count, chunk_stats, chunk_hits = future.result()
+                        counts[index] += count
+                        stats[index] = stats[index].merge(chunk_stats)
+                        hits[index].extend(chunk_hits)
+
+                #
+                # Pass 2 - unclassified HTTP responses more than 2 standard deviations from their file's mean
+                #
+                with profiler.phase("outliers"):
+                    futures = [
+                        (index, pool.submit(_outlier_chunk, *unit, stats[index].mean - 2 * stats[index].sd, stats[index].mean + 2 * stats[index].sd))
+                        for index, (_, kind, units) in enumerate(files)
+                        if kind == "HTTP" and stats[index].sd > 0
+                        for unit in units
+                    ]
+                    for index, future in futures:
+                        hits[index].extend(future.result())
+
+            logger.info(f"Analyzed {sum(counts)} attempts")
+            total = self.print_hits(files, hits)
+
+            if total:
+                analyzer = Analyzer(None, self.notify, self.webhook, self.host)
+                analyzer.send_notification(total)
+
+            print()
+            return total
+
+
+    #
+    # One table of the hits in all files
+    #
+    def print_hits(self, files, hits):
+        total = sum(len(file_hits) for file_hits in hits)
+        if not total:
+            logger.info("No potentially successful logins found")
+            return 0
+
+        logger.info(f"Identified {total} potentially successful login(s)!")
+        print()
+
+        table = Table(show_footer=False, highlight=True, title="Spray Hits", title_justify="left", title_style="bold reverse")
+        table.add_column("File")
+        table.add_column(SprayResult.TIMESTAMP)
+        table.add_column(SprayResult.USERNAME)
+        table.add_column(SprayResult.PASSWORD)
+        table.add_column(SprayResult.RESULT)
+        table.add_column(SprayResult.RESPONSE_CODE, justify="right")
+        table.add_column(SprayResult.RESPONSE_LENGTH, justify="right")
+
+        for (path, _, _), file_hits in zip(files, hits):
+            for record in sorted(file_hits, key=lambda record: record.timestamp or ""):
+                table.add_row(
+                    path.name,
+                    str(record.timestamp),
+                    str(record.username),
+                    str(record.password),
+                    str(record.message or record.smb_login or record.result or "Length outlier"),
+                    "" if record.code is None else str(record.code),
+                    "" if record.length is None else str(record.length),
+                )
+
+        console.print(table)
+        return total
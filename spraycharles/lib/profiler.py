@@ -0,0 +1,193 @@
+import datetime
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+from rich.table import Table
+
+from spraycharles.lib.logger import console, logger
+
+
+class PhaseStats:
+    __slots__ = ("calls", "total", "self", "max")
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.self = 0.0
+        self.max = 0.0
+
+
+class Profiler:
+    """
+    Opt-in phase timers for `--profile`. Phases nest per thread, so the
+    breakdown and the folded output attribute time to e.g. spray;attempt;send.
+    While disabled phase() hands back a shared no-op context manager, so the
+    instrumented code paths cost one attribute check.
+    Optionally samples the main thread's stack for a flamegraph of everything else
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.started = None
+        self.stats = defaultdict(PhaseStats)
+        self.samples = Counter()
+        self.sample_interval = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+        self._noop = nullcontext()
+
+
+    def phase(self, name):
+        if not self.enabled:
+            return self._noop
+        return self._phase(name)
+
+
+    @contextmanager
+    def _phase(self, name):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+
+        # [path, children time]
+        path = (stack[-1][0] + (name,)) if stack else (name,)
+        frame = [path, 0.0]
+        stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            if stack:
+                stack[-1][1] += elapsed
+
+            with self._lock:
+                stats = self.stats[path]
+                stats.calls += 1
+                stats.total += elapsed
+                stats.self += elapsed - frame[1]
+                stats.max = max(stats.max, elapsed)
+
+
+    #
+    # Wrap a function so every call is timed as a phase
+    #
+    def wrap(self, name, function):
+        def wrapper(*args, **kwargs):
+            with self.phase(name):
+                return function(*args, **kwargs)
+        wrapper.__wrapped__ = function
+        return wrapper
+
+
+    #
+    # Record a phase timed elsewhere (e.g. by a trace callback on an event
+    # loop, where nested phases can't follow interleaved tasks), as its own root
+    #
+    def record(self, name, elapsed):
+        if not self.enabled:
+            return
+
+        with self._lock:
+            stats = self.stats[(name,)]
+            stats.calls += 1
+            stats.total += elapsed
+            stats.self += elapsed
+            stats.max = max(stats.max, elapsed)
+
+
+    def start(self, command, sample_ms=None):
+        self.enabled = True
+        self.command = command
+        self.started = time.perf_counter()
+
+        if sample_ms:
+            self.sample_interval = sample_ms / 1000
+            self._sampler = threading.Thread(target=self._sample, args=(threading.main_thread().ident,), daemon=True)
+            self._sampler.start()
+
+
+    #
+    # Sampling profiler - records the main thread's stack every interval
+    #
+    def _sample(self, thread_id):
+        while not self._stop.wait(self.sample_interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+
+    #
+    # Print the per-phase breakdown and write flamegraph-compatible folded stacks
+    #
+    def finish(self):
+        if not self.enabled:
+            return
+
+        self._stop.set()
+        if self._sampler:
+            self._sampler.join()
+        wall = time.perf_counter() - self.started
+        self.enabled = False
+
+        table = Table(title=f"Profile: {self.command} ({wall:.2f}s wall)", title_justify="left", title_style="bold reverse")
+        table.add_column("Phase")
+        table.add_column("Calls", justify="right")
+        table.add_column("Total (s)", justify="right")
+        table.add_column("Self (s)", justify="right")
+        table.add_column("Mean (ms)", justify="right")
+        table.add_column("Max (ms)", justify="right")
+        table.add_column("% Wall", justify="right")
+
+        for path, stats in sorted(self.stats.items()):
+            table.add_row(
+                "  " * (len(path) - 1) + path[-1],
+                str(stats.calls),
+                f"{stats.total:.3f}",
+                f"{stats.self:.3f}",
+                f"{stats.total / stats.calls * 1000:.2f}",
+                f"{stats.max * 1000:.2f}",
+                f"{stats.total / wall * 100:.1f}" if wall else "-",
+            )
+
+        print()
+        console.print(table)
+
+        #
+        # Folded stacks: sampled stacks weighted by sample count, otherwise
+        # phase paths weighted by self time in microseconds
+        #
+        out_dir = Path.home() / ".spraycharles" / "profile"
+        out_dir.mkdir(parents=True, exist_ok=True)
+        timestamp = datetime.datetime.now(datetime.UTC).strftime("%Y%m%d-%H%M%S")
+
+        phases_file = out_dir / f"{self.command}_{timestamp}.phases.folded"
+        with open(phases_file, "w") as f:
+            for path, stats in sorted(self.stats.items()):
+                micros = round(stats.self * 1_000_000)
+                if micros:
+                    f.write(f"{';'.join(path)} {micros}\n")
+        logger.info(f"Phase profile written to {phases_file}")
+
+        if self.samples:
+            samples_file = out_dir / f"{self.command}_{timestamp}.samples.folded"
+            with open(samples_file, "w") as f:
+                for stack, count in self.samples.most_common():
+                    f.write(f"{stack} {count}\n")
+            logger.info(f"{sum(self.samples.values())} stack samples written to {samples_file}")
+
+
+profiler = Profiler()
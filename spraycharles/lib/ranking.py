@@ -0,0 +1,238 @@
+import datetime
+import json
+import re
+from collections import defaultdict
+from pathlib import Path
+
+from spraycharles.lib.analyze import Analyzer
+from spraycharles.lib.logger import logger
+from spraycharles.lib.results import iter_records, result_files
+
+
+SEASONS = {"spring", "summer", "fall", "autumn", "winter"}
+MONTHS = {
+    "january", "february", "march", "april", "may", "june", "july",
+    "august", "september", "october", "november", "december",
+}
+
+#
+# Relative likelihood of common password structures, used as a prior before
+# (and alongside) any engagement data. Keys are case-insensitive pattern shapes
+#
+PATTERN_PRIORS = {
+    "Season+Year+Symbol":   1.0,
+    "Season+Year":          0.9,
+    "Season+Digits2+Symbol": 0.7,
+    "Season+Digits2":       0.6,
+    "Month+Year+Symbol":    0.7,
+    "Month+Year":           0.6,
+    "Word+Year+Symbol":     0.6,
+    "Word+Year":            0.5,
+    "Word+Digits+Symbol":   0.5,
+    "Word+Digits":          0.4,
+    "Word+Symbol+Digits":   0.3,
+    "Word+Symbol":          0.2,
+}
+DEFAULT_PRIOR = 0.1
+
+#
+# Smoothing constants. BASE_RATE scales the priors into an expected hit rate,
+# the strengths are pseudo-attempt counts observed data has to outweigh
+#
+BASE_RATE = 0.002
+PATTERN_STRENGTH = 500
+EXACT_STRENGTH = 200
+
+TOKEN = re.compile(r"[A-Za-z]+|[0-9]+|[^A-Za-z0-9]+")
+
+
+class PasswordRanker:
+    """
+    Scores password candidates with a frequency/pattern model trained from
+    previous spray results, so likely passwords are sprayed first
+    """
+
+    def __init__(self, model_file):
+        self.model_file = Path(model_file)
+
+        #
+        # Per results file counts, keyed by path: {"size", "mtime", "passwords": {pw: [tries, hits]}}
+        #
+        self.files = {}
+        self.password_counts = {}
+        self.pattern_counts = {}
+
+        if self.model_file.exists():
+            try:
+                self.files = json.loads(self.model_file.read_text()).get("files", {})
+            except Exception as e:
+                logger.debug(f"Error reading ranking model {self.model_file}: {e}")
+
+
+    #
+    # Structural pattern of a password, e.g. Winter2024! -> Season(Cap)+Year+Symbol
+    #
+    @staticmethod
+    def pattern(password, cased=True):
+        parts = []
+        for tok in TOKEN.findall(password):
+            if tok.isalpha():
+                low = tok.lower()
+                kind = "Season" if low in SEASONS else "Month" if low in MONTHS else "Word"
+                if cased:
+                    if tok.islower():
+                        kind += "(lower)"
+                    elif tok.isupper():
+                        kind += "(UPPER)"
+                    elif tok[0].isupper() and tok[1:].islower():
+                        kind += "(Cap)"
+                    else:
+                        kind += "(Mixed)"
+                parts.append(kind)
+            elif tok.isdigit():
+                if len(tok) == 4 and tok[:2] in ("19", "20"):
+                    parts.append("Year")
+                elif len(tok) == 2:
+                    parts.append("Digits2")
+                else:
+                    parts.append("Digits")
+            else:
+                parts.append("Symbol")
+        return "+".join(parts)
+
+
+    #
+    # Count tries and hits per password in a results file
+    #
+    @staticmethod
+    def _count_file(path):
+        responses = list(iter_records(path))
+
+        counts = defaultdict(lambda: [0, 0])
+        for resp in responses:
+            counts[resp.password][0] += 1
+
+        for resp in Analyzer.hits(responses):
+            counts[resp.password][1] += 1
+
+        counts.pop(None, None)
+        return dict(counts)
+
+
+    #
+    # Bring the model up to date with results files. Only new or modified
+    # files are re-read, so a growing output file can be re-trained mid-spray
+    #
+    def train(self, paths, save=True):
+        changed = False
+
+        for path in paths:
+            path = Path(path)
+            try:
+                stats = [file.stat() for file in {path, *result_files(path)}]
+            except OSError:
+                continue
+
+            #
+            # Segmented output only rewrites its manifest on rotation, so look at the segments too
+            #
+            size = sum(stat.st_size for stat in stats)
+            mtime = max(stat.st_mtime for stat in stats)
+
+            cached = self.files.get(str(path))
+            if cached and cached["size"] == size and cached["mtime"] == mtime:
+                continue
+
+            try:
+                counts = PasswordRanker._count_file(path)
+            except Exception as e:
+                logger.debug(f"Skipping {path} for ranking model: {e}")
+                continue
+
+            self.files[str(path)] = {"size": size, "mtime": mtime, "passwords": counts}
+            changed = True
+
+        if changed and save:
+            try:
+                self.model_file.write_text(json.dumps({"files": self.files}))
+            except Exception as e:
+                logger.debug(f"Error writing ranking model {self.model_file}: {e}")
+
+        self._aggregate()
+
+
+    #
+    # Sum the per file counts into password and pattern tables
+    #
+    def _aggregate(self):
+        password_counts = defaultdict(lambda: [0, 0])
+        for entry in self.files.values():
+            for password, (tries, hits) in entry["passwords"].items():
+                password_counts[password][0] += tries
+                password_counts[password][1] += hits
+
+        pattern_counts = defaultdict(lambda: [0, 0])
+        for password, (tries, hits) in password_counts.items():
+            pattern = PasswordRanker.pattern(password)
+            pattern_counts[pattern][0] += tries
+            pattern_counts[pattern][1] += hits
+
+        self.password_counts = dict(password_counts)
+        self.pattern_counts = dict(pattern_counts)
+
+
+    #
+    # Passwords built around the current date are the most common choices
+    #
+    @staticmethod
+    def _recency(password, now):
+        factor = 1.0
+
+        years = [int(y) for y in re.findall(r"(?<![0-9])(?:19|20)[0-9]{2}(?![0-9])", password)]
+        if years:
+            factor *= 1 / (1 + abs(now.year - max(years)))
+
+        low = password.lower()
+        season = ["winter", "spring", "summer", "fall"][(now.month % 12) // 3]
+        if season in low or (season == "fall" and "autumn" in low):
+            factor *= 1.5
+
+        if now.strftime("%B").lower() in low:
+            factor *= 1.5
+
+        return factor
+
+
+    #
+    # Estimated probability that a password yields a hit
+    #
+    def score(self, password, now=None):
+        now = now or datetime.datetime.now()
+
+        pattern = PasswordRanker.pattern(password)
+        prior = PATTERN_PRIORS.get(PasswordRanker.pattern(password, cased=False), DEFAULT_PRIOR) * BASE_RATE
+
+        tries, hits = self.pattern_counts.get(pattern, (0, 0))
+        pattern_rate = (hits + prior * PATTERN_STRENGTH) / (tries + PATTERN_STRENGTH)
+
+        tries, hits = self.password_counts.get(password, (0, 0))
+        rate = (hits + pattern_rate * EXACT_STRENGTH) / (tries + EXACT_STRENGTH)
+
+        return rate * PasswordRanker._recency(password, now)
+
+
+    #
+    # Order passwords by descending score; ties keep their list order
+    #
+    def rank(self, passwords):
+        now = datetime.datetime.now()
+        scores = {password: self.score(password, now) for password in set(passwords)}
+        return sorted(passwords, key=lambda p: -scores[p])
+
+
+    #
+    # Human readable summary of the training data for the pre-spray table
+    #
+    def describe(self):
+        attempts = sum(tries for tries, _ in self.password_counts.values())
+        return f"{len(self.files)} result files, {attempts} attempts"
@@ -0,0 +1,245 @@
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+
+from spraycharles.lib.logger import logger
+from spraycharles.lib.serialization import decode_record, loads
+
+
+#
+# First key of a segmented output's manifest. Result records never carry it
+#
+MANIFEST_KEY = "Spraycharles Segments"
+
+
+#
+# Read the manifest at path, or None if path is a plain results file
+#
+def read_manifest(path):
+    try:
+        with open(path, "r") as f:
+            line = f.readline()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+    try:
+        manifest = json.loads(line)
+    except ValueError:
+        return None
+
+    return manifest if isinstance(manifest, dict) and MANIFEST_KEY in manifest else None
+
+
+#
+# The files holding a results file's records - the file itself, or the segments of a manifest
+#
+def result_files(path):
+    path = Path(path)
+    manifest = read_manifest(path)
+    if manifest is None:
+        return [path]
+
+    files = []
+    for segment in manifest["segments"]:
+        file = path.parent / segment["file"]
+
+        # compressed since the manifest was read
+        if not file.exists() and file.with_name(file.name + ".gz").exists():
+            file = file.with_name(file.name + ".gz")
+        files.append(file)
+    return files
+
+
+#
+# Non-blank lines of a results file: JSON lines, gzipped JSON lines or a
+# segmented output's manifest
+#
+def _lines(path):
+    for file in result_files(path):
+        try:
+            f = _open(file)
+        except FileNotFoundError:
+            # compressed while we were reading earlier segments
+            if file.suffix == ".gz":
+                raise
+            f = _open(file.with_name(file.name + ".gz"))
+
+        with f:
+            for line in f:
+                if line.strip():
+                    yield line
+
+
+#
+# Iterate the records of a results file as JSON objects
+#
+def iter_results(path):
+    for line in _lines(path):
+        yield loads(line)
+
+
+#
+# Iterate a results file as typed records, whatever schema version wrote it
+#
+def iter_records(path):
+    for line in _lines(path):
+        yield decode_record(line)
+
+
+#
+# Open a results file or segment for reading lines as bytes
+#
+def _open(file):
+    return gzip.open(file, "rb") if file.suffix == ".gz" else open(file, "rb")
+
+
+#
+# Delete a results file, including the segments it lists
+#
+def remove_results(path):
+    path = Path(path)
+    if not path.exists():
+        return
+
+    if read_manifest(path) is not None:
+        for file in result_files(path):
+            file.unlink(missing_ok=True)
+    path.unlink()
+
+
+class ResultWriter:
+    """
+    Where a spray's result records go. Without limits this is the output
+    file itself. With a segment size or interval, records go to numbered
+    segment files next to it, rotated once a limit is reached, and the
+    output file becomes a one-line JSON manifest of the segments. Closed
+    segments are gzipped by a background thread. Modules append to the
+    current segment (path), and the spray calls written() after each record
+    """
+
+    def __init__(self, output, segment_bytes=None, segment_seconds=None):
+        self.output = Path(output)
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.segmented = bool(segment_bytes or segment_seconds)
+        self.segments = []
+        self.path = self.output
+        self._lock = threading.Lock()
+        self._compress_queue = None
+        self._compressor = None
+
+        if self.segmented:
+            self._compress_queue = queue.SimpleQueue()
+            self._compressor = threading.Thread(target=self._compress_loop, daemon=True)
+            self._compressor.start()
+            self._open_segment()
+
+
+    def _open_segment(self):
+        index = len(self.segments) + 1
+        self.path = self.output.with_name(f"{self.output.stem}.{index:04d}.jsonl")
+        self.path.write_bytes(b"")
+        with self._lock:
+            self.segments.append({
+                "file": self.path.name,
+                "records": 0,
+                "bytes": 0,
+                "started": time.time(),
+                "closed": None,
+                "compressed": None,
+            })
+        self._write_manifest()
+
+
+    #
+    # Replace the manifest atomically, so readers never see a partial write
+    #
+    def _write_manifest(self):
+        with self._lock:
+            data = json.dumps({MANIFEST_KEY: 1, "segments": self.segments})
+            tmp = self.output.with_name(self.output.name + ".tmp")
+            tmp.write_text(data + "\n")
+            os.replace(tmp, self.output)
+
+
+    #
+    # Count a record appended to the current segment and rotate if a limit was reached
+    #
+    def written(self):
+        if not self.segmented:
+            return
+
+        segment = self.segments[-1]
+        segment["records"] += 1
+
+        if self.segment_bytes and self.path.stat().st_size >= self.segment_bytes:
+            self.rotate()
+        elif self.segment_seconds and time.time() - segment["started"] >= self.segment_seconds:
+            self.rotate()
+
+
+    def rotate(self):
+        self._close_segment()
+        self._open_segment()
+
+
+    def _close_segment(self):
+        segment = self.segments[-1]
+        segment["closed"] = time.time()
+        segment["bytes"] = self.path.stat().st_size if self.path.exists() else 0
+
+        if segment["records"]:
+            self._compress_queue.put((segment, self.path))
+        else:
+            with self._lock:
+                self.segments.pop()
+            self.path.unlink(missing_ok=True)
+
+
+    #
+    # Gzip closed segments. The manifest names the compressed file before the
+    # plain one is removed, so readers always find one of them
+    #
+    def _compress_loop(self):
+        while True:
+            item = self._compress_queue.get()
+            if item is None:
+                return
+
+            segment, path = item
+            target = path.with_name(path.name + ".gz")
+            tmp = path.with_name(path.name + ".gz.tmp")
+            try:
+                with open(path, "rb") as src, gzip.open(tmp, "wb") as dst:
+                    while chunk := src.read(1 << 20):
+                        dst.write(chunk)
+                os.replace(tmp, target)
+            except OSError as e:
+                logger.warning(f"Could not compress result segment {path.name}: {e}")
+                continue
+
+            segment["file"] = target.name
+            segment["compressed"] = target.stat().st_size
+            self._write_manifest()
+            path.unlink(missing_ok=True)
+
+
+    #
+    # Close and compress the last segment, waiting for compression to finish
+    #
+    def close(self):
+        if not self.segmented or self._compressor is None:
+            return
+
+        self._close_segment()
+        self._write_manifest()
+        self._compress_queue.put(None)
+        self._compressor.join()
+        self._compressor = None
+
+        records = sum(segment["records"] for segment in self.segments)
+        logger.info(f"Results: {records} records in {len(self.segments)} compressed segment(s), manifest {self.output.name}")
@@ -0,0 +1,244 @@
+import datetime
+import re
+import sqlite3
+from pathlib import Path
+
+from spraycharles.lib.analyze import SMB_HIT_STATUSES
+from spraycharles.lib.logger import logger
+from spraycharles.lib.results import iter_records, result_files
+from spraycharles.lib.utils import LoginResult
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id          INTEGER PRIMARY KEY,
+    source      TEXT NOT NULL UNIQUE,
+    host        TEXT,
+    size        INTEGER,
+    mtime       REAL
+);
+CREATE TABLE IF NOT EXISTS attempts (
+    id          INTEGER PRIMARY KEY,
+    run         INTEGER NOT NULL REFERENCES runs (id),
+    ts          TEXT NOT NULL,
+    module      TEXT COLLATE NOCASE,
+    host        TEXT COLLATE NOCASE,
+    username    TEXT COLLATE NOCASE,
+    password    TEXT,
+    result      TEXT COLLATE NOCASE,
+    message     TEXT,
+    code        INTEGER,
+    length      INTEGER,
+    total_ms    REAL,
+    hit         INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS attempts_username ON attempts (username);
+CREATE INDEX IF NOT EXISTS attempts_password ON attempts (password);
+CREATE INDEX IF NOT EXISTS attempts_module ON attempts (module);
+CREATE INDEX IF NOT EXISTS attempts_host ON attempts (host);
+CREATE INDEX IF NOT EXISTS attempts_result ON attempts (result);
+CREATE INDEX IF NOT EXISTS attempts_ts ON attempts (ts);
+CREATE INDEX IF NOT EXISTS attempts_hits ON attempts (ts) WHERE hit = 1;
+CREATE INDEX IF NOT EXISTS attempts_run ON attempts (run);
+"""
+
+INSERT = """
+INSERT INTO attempts (run, ts, module, host, username, password, result, message, code, length, total_ms, hit)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+#
+# Columns query() can filter and group on
+#
+COLUMNS = ("username", "password", "module", "host", "result")
+GROUPS = (*COLUMNS, "day")
+
+#
+# Default output names are <host>_<YYYYmmdd-HHMMSS>.json
+#
+OUTPUT_NAME = re.compile(r"^(?P<host>.+)_\d{8}-\d{6}$")
+
+
+def _row(run, host, record):
+    result = record.result or record.smb_login
+    hit = record.result == LoginResult.SUCCESS or record.smb_login in SMB_HIT_STATUSES
+    return (
+        run,
+        record.timestamp,
+        record.module,
+        host,
+        record.username,
+        record.password,
+        None if result is None else str(result),
+        record.message,
+        record.code,
+        record.length,
+        record.total_ms,
+        int(hit),
+    )
+
+
+#
+# Accept YYYY-mm-dd[ HH:MM:SS] or a relative age like 30d / 12h / 45m
+#
+def parse_time(value, end=False):
+    if value is None:
+        return None
+
+    match = re.fullmatch(r"(\d+)([dhm])", value)
+    if match:
+        amount, unit = int(match.group(1)), match.group(2)
+        delta = {"d": datetime.timedelta(days=amount), "h": datetime.timedelta(hours=amount), "m": datetime.timedelta(minutes=amount)}[unit]
+        return (datetime.datetime.now(datetime.UTC) - delta).strftime("%Y-%m-%d %H:%M:%S")
+
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid time '{value}' - use YYYY-MM-DD, 'YYYY-MM-DD HH:MM:SS' or an age like 30d")
+
+    if end and len(value) == 10:
+        parsed += datetime.timedelta(days=1, seconds=-1)
+    return parsed.strftime("%Y-%m-%d %H:%M:%S")
+
+
+#
+# Turn * and ? wildcards into a LIKE pattern
+#
+def _like(value):
+    escaped = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped.replace("*", "%").replace("?", "_")
+
+
+class ResultsDB:
+    """
+    SQLite database of attempts across runs, indexed for lookups by
+    username, password, module, host, result and time. Sprays write into it
+    with --db, and existing results files are bulk-imported with
+    `query --import`. Each results file is one run, so re-importing a file
+    that has grown replaces its attempts rather than duplicating them
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+
+    #
+    # Start recording a run, replacing anything recorded for the same source
+    #
+    def start_run(self, source, host):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            run = self._replace_run(source, host)
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+        return run
+
+
+    def _replace_run(self, source, host, size=None, mtime=None):
+        source = str(Path(source).resolve())
+
+        existing = self.conn.execute("SELECT id FROM runs WHERE source = ?", (source,)).fetchone()
+        if existing is None:
+            return self.conn.execute("INSERT INTO runs (source, host, size, mtime) VALUES (?, ?, ?, ?)", (source, host, size, mtime)).lastrowid
+
+        self.conn.execute("DELETE FROM attempts WHERE run = ?", existing)
+        self.conn.execute("UPDATE runs SET host = ?, size = ?, mtime = ? WHERE id = ?", (host, size, mtime, existing[0]))
+        return existing[0]
+
+
+    #
+    # Record one attempt (a SprayRecord) of a run
+    #
+    def add(self, run, host, record):
+        self.conn.execute(INSERT, _row(run, host, record))
+
+
+    #
+    # Bulk-import a results file (plain, gzipped or segmented). Returns the
+    # number of attempts imported, or None if the file is unchanged since
+    # it was last imported
+    #
+    def import_file(self, path, host=None):
+        path = Path(path)
+        stats = [file.stat() for file in {path, *result_files(path)}]
+        size = sum(stat.st_size for stat in stats)
+        mtime = max(stat.st_mtime for stat in stats)
+
+        known = self.conn.execute("SELECT size, mtime FROM runs WHERE source = ?", (str(path.resolve()),)).fetchone()
+        if known == (size, mtime):
+            return None
+
+        if host is None:
+            match = OUTPUT_NAME.match(path.name.split(".")[0])
+            host = match.group("host") if match else None
+
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            run = self._replace_run(path, host, size, mtime)
+            count = self.conn.executemany(INSERT, (_row(run, host, record) for record in iter_records(path))).rowcount
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+        return count
+
+
+    #
+    # Matching attempts, newest first, or per-group aggregates if group_by is set.
+    # Returns (column names, rows)
+    #
+    def query(self, filters=None, since=None, until=None, hits=False, group_by=None, limit=50):
+        where = []
+        params = []
+
+        for column, value in (filters or {}).items():
+            if value is None:
+                continue
+            if column not in COLUMNS:
+                raise ValueError(f"Unknown filter '{column}'")
+
+            if "*" in value or "?" in value:
+                where.append(f"{column} LIKE ? ESCAPE '\\'")
+                params.append(_like(value))
+            else:
+                where.append(f"{column} = ?")
+                params.append(value)
+
+        if since:
+            where.append("ts >= ?")
+            params.append(since)
+        if until:
+            where.append("ts <= ?")
+            params.append(until)
+        if hits:
+            where.append("hit = 1")
+
+        clause = f"WHERE {' AND '.join(where)}" if where else ""
+
+        if group_by is None:
+            columns = ("ts", "module", "host", "username", "password", "result", "message", "code", "length", "total_ms")
+            sql = f"SELECT {', '.join(columns)} FROM attempts {clause} ORDER BY ts DESC LIMIT ?"
+        else:
+            if group_by not in GROUPS:
+                raise ValueError(f"Cannot group by '{group_by}' - use one of {', '.join(GROUPS)}")
+
+            key = "substr(ts, 1, 10)" if group_by == "day" else group_by
+            columns = (group_by, "attempts", "hits", "first", "last")
+            sql = f"SELECT {key}, COUNT(*), SUM(hit), MIN(ts), MAX(ts) FROM attempts {clause} GROUP BY {key} ORDER BY SUM(hit) DESC, COUNT(*) DESC LIMIT ?"
+
+        logger.debug(f"Results query: {sql} {params}")
+        return columns, self.conn.execute(sql, (*params, limit)).fetchall()
+
+
+    def close(self):
+        self.conn.close()
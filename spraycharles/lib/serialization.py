@@ -0,0 +1,48 @@
+import json
+
+from spraycharles.lib.utils import SprayRecord
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+#
+# JSON backend for results files: orjson when it is installed, the standard
+# library otherwise. Both read and write the same JSON lines, so files
+# written with one are read with the other
+#
+BACKEND = "orjson" if orjson is not None else "json"
+
+
+#
+# Encode an object as one line of UTF-8 JSON (without the newline)
+#
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode()
+
+
+#
+# Decode one line of JSON, as bytes or str
+#
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+#
+# Results file line of a record
+#
+def encode_record(record):
+    return dumps(record.to_dict()) + b"\n"
+
+
+#
+# Record from a results file line
+#
+def decode_record(line):
+    return SprayRecord.from_dict(loads(line))
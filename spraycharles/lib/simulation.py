@@ -0,0 +1,124 @@
+import datetime
+from collections import deque
+from pathlib import Path
+
+from rich.table import Table
+
+from spraycharles.lib.logger import console
+from spraycharles.lib.serialization import dumps
+
+
+class AccountWindow:
+    """
+    Attempts against one account in a simulated spray
+    """
+
+    __slots__ = ("first", "last", "count", "recent", "peak", "peak_at")
+
+    def __init__(self, when):
+        self.first = when
+        self.last = when
+        self.count = 0
+        self.recent = deque()
+        self.peak = 0
+        self.peak_at = when
+
+
+class Timeline:
+    """
+    Attempts of a simulated spray, written to a JSON lines file as they are
+    made. For each account it keeps the attempt count, the first and last
+    attempt and the most attempts that fell within any lockout window, which
+    is what a lockout threshold is checked against
+    """
+
+    def __init__(self, path, window, started):
+        self.path = Path(path)
+        self.window = window
+        self.accounts = {}
+        self.attempts = 0
+        self.started = started
+        self.finished = started
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.path, "wb")
+
+
+    def add(self, when, username, password):
+        stamp = datetime.datetime.fromtimestamp(when, datetime.UTC).isoformat(timespec="milliseconds")
+        self.file.write(dumps({"Time": stamp, "Username": username, "Password": password}) + b"\n")
+
+        self.finished = when
+        self.attempts += 1
+
+        account = self.accounts.get(username)
+        if account is None:
+            account = self.accounts[username] = AccountWindow(when)
+
+        account.last = when
+        account.count += 1
+
+        #
+        # Attempts within the window ending at this one
+        #
+        recent = account.recent
+        recent.append(when)
+        while recent[0] <= when - self.window:
+            recent.popleft()
+
+        if len(recent) > account.peak:
+            account.peak = len(recent)
+            account.peak_at = when
+
+
+    def close(self):
+        self.file.close()
+
+
+    #
+    # Highest attempt count within a lockout window, and the accounts that reached it
+    #
+    def peak(self):
+        peak = max((account.peak for account in self.accounts.values()), default=0)
+        return peak, [username for username, account in self.accounts.items() if account.peak == peak]
+
+
+    def report(self, threshold=None):
+        table = Table(
+            show_header=False,
+            show_footer=False,
+            min_width=61,
+            title="Simulated Plan",
+            title_justify="left",
+            title_style="bold reverse",
+        )
+
+        if not self.attempts:
+            table.add_row("Attempts", "0")
+            console.print(table)
+            return
+
+        def local(when):
+            return datetime.datetime.fromtimestamp(when).strftime("%m-%d %H:%M:%S")
+
+        counts = [account.count for account in self.accounts.values()]
+        spread = max(account.last - account.first for account in self.accounts.values())
+        peak, peaked = self.peak()
+        worst = self.accounts[peaked[0]]
+
+        table.add_row("Attempts", f"{self.attempts:,} against {len(self.accounts):,} accounts")
+        table.add_row("Started", local(self.started))
+        table.add_row("Finished", local(self.finished))
+        table.add_row("ETA", str(datetime.timedelta(seconds=round(self.finished - self.started))))
+        table.add_row("Per account", f"{min(counts)}-{max(counts)} attempts, spread over up to {datetime.timedelta(seconds=round(spread))}")
+
+        window = f"{self.window / 60:g} minute window"
+        table.add_row("Peak", f"{peak} attempts in a {window} ({len(peaked):,} accounts, first {peaked[0]} at {local(worst.peak_at)})")
+
+        if threshold is not None:
+            over = sum(1 for account in self.accounts.values() if account.peak > threshold)
+            verdict = f"[red]exceeded for {over:,} accounts" if over else "[green]never exceeded"
+            table.add_row("Budget", f"{threshold} attempts per {window} - {verdict}")
+
+        table.add_row("Timeline", self.path.name)
+        console.print(table)
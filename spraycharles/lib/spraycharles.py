@@ -1,11 +1,16 @@
 import datetime
 import logging
+import os
 import pathlib
 import random
+import signal
 import time
 import hashlib
+import math
+from contextlib import contextmanager
+from dataclasses import replace
 from pathlib import Path
-from time import sleep
+from urllib.parse import urlsplit
 
 import requests
 from requests.exceptions import ConnectTimeout, ConnectionError, ReadTimeout, Timeout, TooManyRedirects, RetryError, RequestException
@@ -15,15 +20,44 @@ from rich.table import Table
 from rich.prompt import Confirm
 
 from spraycharles import __version__
-from spraycharles.lib.logger import console, logger
+from spraycharles.lib.logger import console, init_file_logger, logger
 from spraycharles.lib.analyze import Analyzer
+from spraycharles.lib.clock import Clock, VirtualClock
+from spraycharles.lib.control import ControlServer, SprayControl, SprayStopped
+from spraycharles.lib.dashboard import Dashboard
+from spraycharles.lib.accountstate import AccountTracker
+from spraycharles.lib.ledger import LockoutLedger
+from spraycharles.lib.metrics import Metrics, MetricsExporter
+from spraycharles.lib.profiler import profiler
+from spraycharles.lib.ranking import PasswordRanker
+from spraycharles.lib.results import ResultWriter, remove_results
+from spraycharles.lib.resultsdb import ResultsDB
+from spraycharles.lib.simulation import Timeline
+from spraycharles.lib.utils import LoginResult, UserIndex, UsernameFormat
 from spraycharles.targets import all as all_modules
+from spraycharles.targets.classes.LegacyTarget import LegacyTarget
+from spraycharles.targets.classes.Resolver import resolver
+from spraycharles.targets.classes.SimulatedTarget import SimulatedTarget
+from spraycharles.targets.classes.HttpxTransport import HttpxTransport
+from spraycharles.targets.classes.Transport import AttemptTimer, HttpTransport, TlsSessionCache, TransportBackend, install_hooks
 
 
 class Spraycharles:
     def __init__( self, user_list, user_file, password_list, password_file, host, module,
                  path, output, attempts, interval, equal, timeout, port, fireprox, domain,
-                 analyze, jitter, jitter_min, notify, webhook, pause, no_ssl, debug, quiet):
+                 analyze, jitter, jitter_min, notify, webhook, pause, no_ssl, debug, quiet, policy=None, rank=False, rules=None, ledger=None,
+                 daemon=False, control_socket=None, metrics_port=None, stats_file=None, dashboard=False,
+                 segment_size=None, segment_interval=None, db=None, account_state=None, lock_cooldown=30, dns_ttl=300,
+                 tls_resume=False, transport=TransportBackend.requests, simulate=False, latency=0.5, lockout_window=30):
+
+        #
+        # Scheduler clock - simulations run on a virtual one against a local fake target
+        #
+        self.simulate = simulate
+        self.clock = VirtualClock() if simulate else Clock()
+        self.latency = latency
+        self.lockout_window = lockout_window
+        self.timeline = None
 
         self.passwords = password_list
         self.password_file = None if password_file is None else Path(password_file)
@@ -49,11 +83,68 @@ class Spraycharles:
         self.webhook = webhook
         self.pause = pause
         self.no_ssl = no_ssl
-        self.print = False if debug or quiet else True
+        self.print = False if debug or quiet or dashboard else True
+        self.policy = policy
+        self.policy_dropped = set()
+        self.policy_skipped = 0
+        self.ranker = None
+        self.sprayed = []
+        self.rules = rules or {}
+        self.ledger_file = ledger
+        self.ledger = None
+        self.ledger_skipped = 0
+        self.ledger_deferred = 0
+        self.tracker = AccountTracker(account_state, lock_cooldown, self.clock, f"{module.lower()}:{host.lower()}")
+        self.state_skipped = 0
+        self.daemon = daemon
+        self.control = SprayControl(self.clock)
+        self.control_socket = control_socket
+        self.control_server = None
+        self.started = time.time()
+        self.sent = 0
+        self.successes = 0
+        self.current_password = None
+        self.sleeping_until = None
+        self.target_host = None
+        self.target_address = None
+        resolver.ttl = dns_ttl
+        install_hooks()
+        self.tls_resume = tls_resume
+        self.transport = transport
+        self.tls_sessions = None
+
+        #
+        # One progress bar for the whole spray, reset for each password. With
+        # --dashboard it is drawn as part of the live dashboard
+        #
+        self.progress = Progress(transient=True, console=console)
+        self.progress_task = None
+        self.dashboard = Dashboard(self) if dashboard else None
+        self.display = self.dashboard or self.progress
+
+        #
+        # Counters and latency histograms, optionally exported while spraying
+        #
+        self.metrics = Metrics()
+        self.metrics.gauge("spraycharles_passwords_sprayed", lambda: len(self.sprayed))
+        self.metrics.gauge("spraycharles_passwords", lambda: len(self.passwords))
+        self.metrics.gauge("spraycharles_accounts", lambda: len(self.accounts) if self.accounts is not None else None)
+        self.metrics.gauge("spraycharles_interval_position", lambda: self.login_attempts if self.attempts else None)
+        self.metrics.gauge("spraycharles_hits", lambda: self.total_hits)
+        self.metrics.gauge("spraycharles_eta_seconds", self._eta)
+        self.metrics.gauge("spraycharles_tls_resumption_ratio", lambda: self.tls_sessions.hit_rate() if self.tls_sessions else None)
+        self.exporter = None
+        if metrics_port is not None or stats_file is not None:
+            try:
+                self.exporter = MetricsExporter(self.metrics, metrics_port, stats_file)
+            except OSError as e:
+                logger.error(f"Could not start metrics endpoint: {e}")
+                exit()
 
         self.total_hits = 0
         self.login_attempts = 0
         self.target = None
+        self.accounts = None
         self.log_name = None
 
         # 
@@ -74,28 +165,63 @@ class Spraycharles:
         current = datetime.datetime.now(datetime.UTC)
         timestamp = current.strftime("%Y%m%d-%H%M%S")
     
-        if self.output is None:
+        if self.output is None and self.simulate:
+            self.output = spraycharles_dir / "sim" / f"{host}_{timestamp}.jsonl"
+        elif self.output is None:
             self.output = Path(f"{user_home}/.spraycharles/out/{host}_{timestamp}.json")
         else:
             self.output = Path(self.output)
             
         #
-        # Overwrite output file if it already exists
+        # Overwrite output file (and any segments it lists) if it already exists
+        #
+        remove_results(self.output)
+
+        #
+        # Optionally split results into rotated, compressed segments (size in MB, interval in minutes)
+        #
+        self.results = ResultWriter(
+            self.output,
+            segment_size * 1024 * 1024 if segment_size else None,
+            segment_interval * 60 if segment_interval else None,
+        )
+
+        #
+        # Optionally record attempts in the results database as well (see the query command)
         #
-        if self.output.exists():
-            self.output.unlink()
+        self.db = None
+        self.db_run = None
+        if db is not None:
+            self.db = ResultsDB(db)
+            self.db_run = self.db.start_run(self.output, self.host)
         
         #
         # Logfile will use the default logger and UTC time
         # This file will not contain passwords (output JSON file will)
+        # Simulations send nothing, so they leave no logfile
         #
-        self.log_name = f"{user_home}/.spraycharles/logs/{self.host}_{timestamp}.log"
-        logging.basicConfig(
-            filename=self.log_name,
-            level=logging.INFO,
-            format="%(asctime)s UTC - %(levelname)s - %(message)s",
-        )
-        logging.Formatter.converter = time.gmtime
+        self.log_name = None if self.simulate else f"{user_home}/.spraycharles/logs/{self.host}_{timestamp}.log"
+
+        if self.daemon and self.control_socket is None:
+            self.control_socket = spraycharles_dir / "run" / f"{self.host}_{timestamp}.sock"
+        if self.log_name:
+            init_file_logger(self.log_name)
+        else:
+            # keeps logging.info() from configuring a console handler on the root logger
+            logging.getLogger().addHandler(logging.NullHandler())
+
+        #
+        # Drop passwords the target's policy would reject before we start
+        #
+        self._apply_policy()
+
+        #
+        # Order passwords by likelihood of success, learned from previous results
+        #
+        if rank:
+            self.ranker = PasswordRanker(spraycharles_dir / "ranking.json")
+            self.ranker.train(path for path in out_dir.glob("*.json") if path != self.output)
+            self._rank_passwords()
 
 
     #
@@ -106,6 +232,15 @@ class Spraycharles:
             if self.module == target.NAME:
                 logger.debug(f"Using {target.NAME} module")
                 self.target = target(self.host, self.port, self.timeout, self.fireprox)
+
+                #
+                # Modules written against the old login()/print_response() interface
+                #
+                if not hasattr(self.target, "prepare"):
+                    logger.debug(f"{target.NAME} uses the legacy module interface")
+                    self.target = LegacyTarget(self.target)
+                    if self.db:
+                        logger.warning(f"{target.NAME} writes its own results - import the results file with 'query --import' to add them to the database")
                  
                 #
                 # NTLM module requires path to be set
@@ -119,6 +254,84 @@ class Spraycharles:
                 if self.no_ssl:
                     self.target.set_plain_http()
 
+                #
+                # Simulated attempts go to a local fake and the timeline instead
+                #
+                if self.simulate:
+                    self.timeline = Timeline(self.output, self.lockout_window * 60, self.clock.time())
+                    self.target = SimulatedTarget(self.target, self.clock, self.timeline, self.latency)
+
+                #
+                # Send through the selected backend. Modules with their own
+                # transport (NTLM, SMB) keep it
+                #
+                if self.transport != TransportBackend.requests:
+                    if isinstance(self.target.transport, HttpTransport):
+                        self.target.transport = HttpxTransport()
+                        if not self.target.transport.pinned:
+                            logger.warning("This httpx version doesn't allow pinning connections - they resolve the target themselves")
+                    else:
+                        logger.warning(f"{target.NAME} uses its own transport - ignoring --transport {self.transport.value}")
+
+                #
+                # Resume TLS sessions on the new connection each attempt opens
+                #
+                if self.tls_resume:
+                    if type(self.target.transport) is HttpTransport:
+                        self.tls_sessions = TlsSessionCache()
+                        self.target.transport = HttpTransport(self.tls_sessions)
+                    else:
+                        logger.warning(f"--tls-resume needs the requests transport of an HTTP module - ignoring it for {target.NAME}")
+
+                #
+                # Count how many prefetched values the module got to use, and
+                # only prefetch as far ahead as values last at the jitter
+                #
+                if self.target.prefetcher is not None:
+                    self.target.prefetcher.counter = lambda outcome: self.metrics.inc("spraycharles_prefetch", module=self.target.NAME, outcome=outcome)
+                    self.target.prefetcher.pace(self.jitter)
+
+                #
+                # Resolve the target once, up front
+                #
+                if not self.simulate:
+                    self._pin_target()
+
+                #
+                # Compile the module's success/failure rules, custom rules first
+                #
+                if hasattr(self.target, "set_rules"):
+                    try:
+                        self.target.set_rules(self.rules.get(target.NAME))
+                    except ValueError as e:
+                        logger.error(f"{target.NAME} rules: {e}")
+                        exit()
+
+                #
+                # Collapse username variants into one account each, in the module's username format
+                #
+                self.accounts = UserIndex(getattr(target, "USERNAME_FORMAT", UsernameFormat.RAW), self.domain)
+                self._update_accounts()
+
+                #
+                # Share per-account attempt budgets with other sprays against the same directory
+                #
+                if self.ledger_file is not None:
+                    self.ledger = LockoutLedger(self.ledger_file, self.attempts, self.interval, target.NAME, self.host)
+
+
+    #
+    # Resolve the target's host and pin its connections to one address, so
+    # attempts skip the resolver and stay on one load balanced node
+    #
+    def _pin_target(self):
+        url = urlsplit(getattr(self.target, "url", None) or "")
+        self.target_host = url.hostname or self.host
+        port = url.port or {"https": 443, "http": 80, "smb": 445}.get(url.scheme, self.port)
+
+        with profiler.phase("resolve"):
+            self.target_address = resolver.pin(self.target_host, port)
+
 
     #
     # Display table with spray configs
@@ -135,9 +348,17 @@ class Spraycharles:
 
         spray_info.add_row("Target", f"{self.target.url}")
 
+        if isinstance(self.target.transport, HttpxTransport):
+            spray_info.add_row("Transport", self.target.transport.describe())
+
+        if self.target_address and self.target_address != self.target_host and getattr(self.target.transport, "pinned", True):
+            spray_info.add_row("Address", resolver.describe(self.target_host))
+
         if self.domain:
             spray_info.add_row("Domain", f"{self.domain}")
 
+        spray_info.add_row("Accounts", f"{len(self.accounts)} ({self.accounts.duplicates} duplicate variants collapsed)")
+
         if self.attempts:
             spray_info.add_row("Interval", f"{self.interval} minutes")
             spray_info.add_row("Attempts", f"{self.attempts} per interval")
@@ -148,23 +369,39 @@ class Spraycharles:
         if self.notify:
             spray_info.add_row("Notify", f"True ({self.notify.value})")
 
-        log_name = pathlib.PurePath(self.log_name)
+        if self.policy:
+            spray_info.add_row("Policy", f"{self.policy.describe()} ({len(self.policy_dropped)} passwords dropped)")
+
+        if self.ranker:
+            spray_info.add_row("Ranking", f"Trained on {self.ranker.describe()}")
+
+        if self.ledger:
+            spray_info.add_row("Ledger", self.ledger.describe())
+
+        if self.tracker.accounts:
+            spray_info.add_row("Skipping", self.tracker.describe())
+
+        if self.simulate:
+            spray_info.add_row("Simulation", f"Virtual clock, {self.latency:g} seconds per attempt, {self.lockout_window} minute lockout window")
+
         out_name = pathlib.PurePath(self.output)
-        spray_info.add_row("Logfile", f"{log_name.name}")
-        spray_info.add_row("Results", f"{out_name.name}")
+        if self.log_name:
+            spray_info.add_row("Logfile", f"{pathlib.PurePath(self.log_name).name}")
+        spray_info.add_row("Timeline" if self.simulate else "Results", f"{out_name.name}")
 
         console.print(spray_info)
 
         print()
-        Confirm.ask(
-            "[blue]Press enter to begin",
-            default=True,
-            show_choices=False,
-            show_default=False,
-        )
-        print()
+        if not self.daemon and not self.simulate:
+            Confirm.ask(
+                "[blue]Press enter to begin",
+                default=True,
+                show_choices=False,
+                show_default=False,
+            )
+            print()
 
-        if self.module == "SMB":
+        if self.module == "SMB" and not self.simulate:
             logger.info(f"Initiaing SMB connection to {self.host}")
             if self.target.get_conn():
                 logger.info(f"Connected to {self.host} over {'SMBv1' if self.target.smbv1 else 'SMBv3'}")
@@ -190,8 +427,9 @@ class Spraycharles:
             # Optionally run result analysis
             #
             if self.analyze:
-                analyzer = Analyzer(self.output, self.notify, self.webhook, self.host, self.total_hits)
-                new_hit_total = analyzer.analyze()
+                with self.metrics.phase("analyzing"):
+                    analyzer = Analyzer(self.output, self.notify, self.webhook, self.host, self.total_hits)
+                    new_hit_total = analyzer.analyze()
 
                 # 
                 # Pausing if specified by user before continuing with spray
@@ -201,12 +439,20 @@ class Spraycharles:
                     logger.info("Identified new potentially successful login! Pausing...")
                     print()
 
-                    Confirm.ask(
-                        "[blue]Press enter to continue",
-                        default=True,
-                        show_choices=False,
-                        show_default=False,
-                    )
+                    #
+                    # Daemons have no one to press enter - resume through the control API
+                    #
+                    if self.daemon:
+                        self.control.pause()
+                    else:
+                        self.display.stop()
+                        Confirm.ask(
+                            "[blue]Press enter to continue",
+                            default=True,
+                            show_choices=False,
+                            show_default=False,
+                        )
+                        self.display.start()
 
                 #
                 # New hit total becomes the total hits for next analysis interation
@@ -217,8 +463,20 @@ class Spraycharles:
             # Sleep for interval
             #
             print()
-            logger.info(f"Sleeping until {(datetime.datetime.now() + datetime.timedelta(minutes=self.interval)).strftime('%m-%d %H:%M:%S')}")
-            time.sleep(self.interval * 60)
+            logger.info(f"Sleeping until {(self.clock.now() + datetime.timedelta(minutes=self.interval)).strftime('%m-%d %H:%M:%S')}")
+
+            #
+            # The interval can be changed through the control API while sleeping
+            #
+            start = self.clock.time()
+            self.control.state = "sleeping"
+            self.sleeping_until = lambda: start + self.interval * 60
+            try:
+                with self.metrics.phase("sleeping"), profiler.phase("sleep"):
+                    self.control.sleep_until(self.sleeping_until)
+            finally:
+                self.control.state = "running"
+                self.sleeping_until = None
             print()
 
             #
@@ -233,8 +491,9 @@ class Spraycharles:
     @staticmethod
     def _hash_file(file: Path, current_hash: str = None):
         try:
-            fb = file.read_bytes()
-            hash = hashlib.sha256(fb).hexdigest()
+            with profiler.phase("hash_file"):
+                fb = file.read_bytes()
+                hash = hashlib.sha256(fb).hexdigest()
             logger.debug(f"Calculated hash for {file} to check for changes")
             return hash
         except Exception as e:
@@ -245,6 +504,7 @@ class Spraycharles:
 
     #
     # Allows username/password files to be modified mid-spray and take effect
+    # Returns the file hash to track for the next check
     #
     def _update_list_from_file(self, file: Path, current_hash: str, current_list: list[str], type="usernames"):
         
@@ -252,43 +512,123 @@ class Spraycharles:
         # A single password could have been provided on the CLI, so ensure we're provided a Path() object 
         #
         if file is None:
-            return
+            return current_hash
         
         new_hash = Spraycharles._hash_file(file, current_hash)
         
         if new_hash == current_hash:
             logger.debug(f"{file} has not been modified")
-            return
+            return current_hash
 
         #
         # There has been a file change, let's update the list
         #
-        current_hash = new_hash
         logger.debug(f"Detected change in {file} - updating {type} list")
-        old_size = len(current_list)
-        current_list.clear()
         try:
-            current_list.extend(file.read_text().splitlines())
-            logger.info(f"Updated {type} list - size of changes: {len(current_list) - old_size}")
+            new_list = file.read_text().splitlines()
         except Exception as e:
             logger.debug(f"Error updating {type} list: {e}")
+            return current_hash
+
+        old_size = len(current_list)
+        current_list.clear()
+        current_list.extend(new_list)
+        logger.info(f"Updated {type} list - size of changes: {len(current_list) - old_size}")
+        return new_hash
+
+
+    #
+    # Rebuild the account index after the username list is (re)loaded
+    #
+    def _update_accounts(self):
+        old_size = len(self.accounts)
+        self.accounts.update(self.usernames)
+        logger.debug(f"Account index: {len(self.accounts)} accounts ({len(self.accounts) - old_size:+})")
+
+        if self.accounts.duplicates:
+            logger.info(f"Collapsed {self.accounts.duplicates} duplicate username variant(s) - {len(self.accounts)} unique accounts")
+
+
+    #
+    # Filter the password list in place against the password policy
+    #
+    def _apply_policy(self):
+        if self.policy is None:
             return
 
+        allowed, dropped = self.policy.filter(self.passwords)
+        new_drops = set(dropped) - self.policy_dropped
+
+        if new_drops:
+            logger.info(f"Password policy dropped {len(new_drops)} password(s) the target would reject")
+            for password in new_drops:
+                logger.debug(f"Dropped by password policy: '{password}'")
+
+        self.policy_dropped.update(dropped)
+        self.passwords[:] = allowed
+
+        if not self.passwords:
+            logger.warning("No passwords remaining after applying the password policy")
+
+
+    #
+    # Re-rank the passwords that haven't been sprayed yet, folding in results
+    # from the current spray. Sprayed passwords stay at the front of the list
+    #
+    def _rank_passwords(self, reloaded=False):
+        if self.ranker is None:
+            return
+
+        if reloaded:
+            sprayed = set(self.sprayed)
+            remaining = [p for p in self.passwords if p not in sprayed]
+        else:
+            remaining = self.passwords[len(self.sprayed):]
+
+        self.ranker.train([self.output], save=False)
+        self.passwords[:] = self.sprayed + self.ranker.rank(remaining)
+
+        for password in self.passwords[len(self.sprayed):len(self.sprayed) + 5]:
+            logger.debug(f"Rank score {self.ranker.score(password):.6f} ({PasswordRanker.pattern(password)}): '{password}'")
+
+
+    #
+    # Report login attempts and intervals saved by the password policy
+    #
+    def _policy_summary(self):
+        if self.policy is None:
+            return
+
+        saved = len(self.policy_dropped) * len(self.accounts) + self.policy_skipped
+        logger.info(f"Password policy saved {saved} login attempts ({len(self.policy_dropped)} passwords dropped, {self.policy_skipped} per-user skips)")
+
+        if self.attempts:
+            kept = len(self.passwords)
+            intervals = math.ceil((kept + len(self.policy_dropped)) / self.attempts) - math.ceil(kept / self.attempts)
+            logger.info(f"Password policy saved {intervals} spray interval(s) ({intervals * self.interval} minutes)")
+
 
     #
     # Recursive function to send login attempts
     #
     def _login(self, username: str, password: str):
+        spec = self.target.prepare(username, password)
+        timer = AttemptTimer()
+
         try:
-            response = self.target.login(username, password)
-            self.target.print_response(response, self.output, print_to_screen=self.print)
+            with self.metrics.phase("sending"):
+                with timer, profiler.phase("send"):
+                    response = self.target.send(spec)
+                with profiler.phase("classify"):
+                    result = self.target.classify(spec, response)
         
         #
         # If we timeout, we'll note that in the result object/output
         # 
         except (ConnectTimeout, Timeout) as e:
-            logger.debug(f"Timeout error: {e}")
-            self.target.print_response(None, self.output, timeout=True, print_to_screen=self.print)
+            logger.debug("Timeout error: %s", e)
+            self.metrics.inc("spraycharles_errors", module=self.target.NAME, exception=type(e).__name__)
+            result = self.target.timeout_result(spec)
         
         #
         # For these exeptions, we'll sleep for 5 seconds and try again
@@ -298,8 +638,11 @@ class Spraycharles:
             print()
             logger.warning("Connection error - will retry 5 seconds")
             logger.debug(str(e))
-            sleep(5)
-            self._login(username, password)
+            self.metrics.inc("spraycharles_errors", module=self.target.NAME, exception=type(e).__name__)
+            self.metrics.inc("spraycharles_retries", module=self.target.NAME)
+            with self.metrics.phase("retry_wait"):
+                self.control.sleep(5)
+            return self._login(username, password)
 
         #
         # Last ditch effort, something else with Requests went wrong
@@ -307,62 +650,307 @@ class Spraycharles:
         except RequestException as e:
             logger.error("Unexpected error with Requests library - will retry in 5 seconds")
             logger.error(str(e))
-            sleep(5)
-            self._login(username, password)
+            self.metrics.inc("spraycharles_errors", module=self.target.NAME, exception=type(e).__name__)
+            self.metrics.inc("spraycharles_retries", module=self.target.NAME)
+            with self.metrics.phase("retry_wait"):
+                self.control.sleep(5)
+            return self._login(username, password)
+
+        result = replace(result, timing=timer.timing())
+
+        self.metrics.observe("spraycharles_attempt_duration_seconds", timer.total, module=self.target.NAME)
+        if timer.resumed is not None:
+            self.metrics.inc("spraycharles_tls_handshakes", module=self.target.NAME, resumed=str(timer.resumed).lower())
+        self.metrics.inc("spraycharles_attempts", module=self.target.NAME, result=result.result or result.smb_login or ("Timeout" if result.timeout else "Unclassified"))
+
+        with self.metrics.phase("reporting"), profiler.phase("report"):
+            self.target.report(result, self.results.path, print_to_screen=self.print)
+            self.results.written()
+            if self.db and not isinstance(self.target, LegacyTarget):
+                self.db.add(self.db_run, self.host, result.record(type(self.target).__name__))
+            if self.dashboard:
+                self.dashboard.record(result)
+
+        self.sent += 1
+        if result.result == LoginResult.SUCCESS.value:
+            self.successes += 1
+
+        return result
+
+
+    #
+    # Send one login for an account, through the lockout ledger if one is shared.
+    # Returns False if the account has no budget left and has to wait
+    #
+    def _attempt(self, account, password):
+        if self.control.paused:
+            with self.metrics.phase("paused"):
+                self.control.checkpoint()
+        else:
+            self.control.checkpoint()
+
+        if self.ledger is None:
+            with profiler.phase("attempt"):
+                result = self._login(account.submit, password)
+            self._observe(account, result)
+            with profiler.phase("logging"):
+                logging.info("Login attempted as %s", account.submit, extra={"account": account.key, "target": self.target.NAME})
+            return True
+
+        with profiler.phase("ledger"):
+            status, entry = self.ledger.reserve(account.key, password)
+
+        if status == LockoutLedger.DONE:
+            logger.debug("Skipping %s - already attempted with '%s' or found by another spray", account.submit, password)
+            self.ledger_skipped += 1
+            self.target.skip(account.submit)
+            return True
+
+        if status == LockoutLedger.DEFERRED:
+            logger.debug("Deferring %s - no attempts left in the shared lockout budget", account.submit)
+            self.ledger_deferred += 1
+            self.target.skip(account.submit)
+            return False
+
+        with profiler.phase("attempt"):
+            result = self._login(account.submit, password)
+        with profiler.phase("ledger"):
+            self.ledger.record(entry, result)
+        self._observe(account, result)
+        with profiler.phase("logging"):
+            logging.info("Login attempted as %s", account.submit, extra={"account": account.key, "target": self.target.NAME})
+        return True
+
+
+    #
+    # Feed a classified attempt to the account state tracker
+    #
+    def _observe(self, account, result):
+        state = self.tracker.observe(account.key, result)
+        if state is not None:
+            logger.debug("Account %s is now %s", account.submit, state)
+
+
+    #
+    # Whether to skip an account in this pass: known invalid, disabled,
+    # already found or locked and cooling down
+    #
+    def _inactive(self, account, progress, task):
+        if self.tracker.active(account.key):
+            return False
+
+        logger.debug("Skipping %s - account is %s", account.submit, self.tracker.accounts[account.key]["state"])
+        self.state_skipped += 1
+        self.target.skip(account.submit)
+        progress.update(task, advance=1)
+        return True
+
+
+    #
+    # Retry accounts deferred by the lockout ledger as their budget frees up
+    #
+    def _attempt_deferred(self, deferred, password_for, progress, task):
+        while deferred:
+            wait = min(self.ledger.wait_time(account.key) for account in deferred)
+            logger.info(f"{len(deferred)} account(s) at the shared lockout budget - waiting {wait / 60:.1f} minutes")
+            with self.metrics.phase("deferred"):
+                self.control.sleep(wait)
+
+            waiting = []
+            for account in deferred:
+                if self._inactive(account, progress, task):
+                    continue
+
+                self._jitter()
+                if self._attempt(account, password_for(account)):
+                    progress.update(task, advance=1)
+                else:
+                    waiting.append(account)
+            deferred = waiting
+
 
-    
     #
     # Calculate jitter and sleep
     #
     def _jitter(self):
         if self.jitter:
             num = random.randint(self.jitter_min, self.jitter)
-            logger.debug(f"Jitter sleep: {num} seconds")
-            sleep(num)
+            logger.debug("Jitter sleep: %d seconds", num)
+            with self.metrics.phase("jitter"), profiler.phase("jitter"):
+                self.control.sleep(num)
 
     
+    #
+    # Reset the spray's progress bar for a pass over the accounts
+    #
+    @contextmanager
+    def _progress(self, description):
+        if self.progress_task is None:
+            self.progress_task = self.progress.add_task(description, total=len(self.accounts))
+        else:
+            self.progress.reset(self.progress_task, total=len(self.accounts), description=description)
+
+        yield self.progress, self.progress_task
+
+
     #
     # Perform one attempt per username with password = username
     #
     def _spray_equal(self):
-        with Progress(transient=True, console=console) as progress:
-            task = progress.add_task(f"[yellow]Password = Username", total=len(self.usernames))
+        with self._progress(f"[yellow]Password = Username") as (progress, task):
+            deferred = []
+
+            self.target.upcoming([
+                account.submit for account in self.accounts
+                if self.tracker.active(account.key)
+                and (not self.policy or (self.policy.allows(account.name) and self.policy.allows_for(account.name, account.name)))
+            ])
             
-            for indx, username in enumerate(self.usernames):
+            for indx, account in enumerate(self.accounts):
+                if self._inactive(account, progress, task):
+                    continue
+
                 if indx > 0:
                     self._jitter()
 
                 #
-                # If we have an email address, strip the @domain
+                # Password is the bare account name, without any domain
                 #
-                password = username.split("@")[0]
+                username = account.submit
+                password = account.name
+
+                if self.policy and not (self.policy.allows(password) and self.policy.allows_for(password, account.name)):
+                    logger.debug("Skipping %s - password policy rejects password = username", username)
+                    self.policy_skipped += 1
+                    progress.update(task, advance=1)
+                    continue
+
+                if not self._attempt(account, password):
+                    deferred.append(account)
+                    continue
 
-                self._login(username, password)
                 progress.update(task, advance=1)
 
-                #
-                # Log attempt to logfile
-                #
-                logging.info(f"Login attempted as {username}")
+            self._attempt_deferred(deferred, lambda account: account.name, progress, task)
+            self.tracker.save()
 
             self.login_attempts += 1
 
 
+    #
+    # Serve the control API and stop gracefully on SIGTERM/SIGINT
+    #
+    def _start_control(self):
+        try:
+            self.control_server = ControlServer(self, self.control_socket)
+        except OSError as e:
+            logger.error(f"Could not start control API: {e}")
+            exit()
+
+        self.control_server.start()
+
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, lambda signum, frame: self.control.stop())
+
+
+    #
+    # Spray progress and counters for the control API
+    #
+    def status(self):
+        deadline = self.sleeping_until
+        return {
+            "state": self.control.state,
+            "paused": self.control.paused,
+            "module": self.module,
+            "host": self.host,
+            "pid": os.getpid(),
+            "uptime": round(time.time() - self.started),
+            "password": self.current_password,
+            "passwords_sprayed": len(self.sprayed),
+            "passwords_total": len(self.passwords),
+            "accounts": len(self.accounts) if self.accounts is not None else 0,
+            "attempts_sent": self.sent,
+            "successes": self.successes,
+            "analyzer_hits": self.total_hits,
+            "eta_seconds": self._eta(),
+            "attempts": self.attempts,
+            "interval": self.interval,
+            "jitter": self.jitter,
+            "jitter_min": self.jitter_min,
+            "sleeping_until": None if deadline is None else datetime.datetime.fromtimestamp(deadline(), datetime.UTC).isoformat(timespec="seconds"),
+            "output": str(self.output),
+        }
+
+
+    #
+    # Estimated seconds until the password list is exhausted, from the mean
+    # attempt duration, jitter and the intervals still to sleep
+    #
+    def _eta(self):
+        remaining = len(self.passwords) - len(self.sprayed)
+        if remaining <= 0 or self.accounts is None:
+            return 0
+
+        per_attempt = (self.metrics.mean("spraycharles_attempt_duration_seconds") or 0) + \
+            ((self.jitter_min + self.jitter) / 2 if self.jitter else 0)
+        seconds = remaining * len(self.accounts) * per_attempt
+
+        if self.attempts:
+            left_in_interval = self.attempts - self.login_attempts
+            seconds += math.ceil(max(0, remaining - left_in_interval) / self.attempts) * self.interval * 60
+
+        return round(seconds)
+
+
+    #
+    # Change interval/jitter while spraying (control API)
+    #
+    def set_timing(self, interval=None, jitter=None, jitter_min=None):
+        for name, value in (("interval", interval), ("jitter", jitter), ("jitter_min", jitter_min)):
+            if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < 0):
+                raise ValueError(f"{name} must be a non-negative integer")
+
+        if interval is not None and self.attempts is None:
+            raise ValueError("interval can only be changed when spraying with attempts/interval")
+
+        jitter = self.jitter if jitter is None else jitter
+        jitter_min = self.jitter_min if jitter_min is None else jitter_min
+        if (jitter is None) ^ (jitter_min is None) or (jitter and jitter_min >= jitter):
+            raise ValueError("jitter must be greater than jitter_min (or 0 to disable), and both must be set")
+
+        if interval is not None:
+            self.interval = interval
+        self.jitter = jitter
+        self.jitter_min = jitter_min
+        if self.target.prefetcher is not None:
+            self.target.prefetcher.pace(self.jitter)
+        logger.info(f"Timing updated - interval: {self.interval} minutes, jitter: {self.jitter_min}-{self.jitter} seconds")
+
+
     #
     # Main spray logic
     #
     def spray(self):
-        # 
-        # Spray once with password = username if flag present
-        #
-        if self.equal:
-            self._spray_equal()
+        if self.daemon:
+            self._start_control()
+
+        if self.exporter:
+            self.exporter.start()
+
+        self.control.state = "running"
+        self.display.start()
 
-        #
-        # Spray using provided password [file]
-        # We'll use a while loop so we can manually control the list index, in the event of user/pass file changes
-        #
         try:
+            # 
+            # Spray once with password = username if flag present
+            #
+            if self.equal:
+                self._spray_equal()
+
+            #
+            # Spray using provided password [file]
+            # We'll use a while loop so we can manually control the list index, in the event of user/pass file changes
+            #
             indx = 0
             while indx < len(self.passwords):
                 self._check_sleep()
@@ -370,16 +958,67 @@ class Spraycharles:
                 #
                 # Bring in user/pass file updates
                 #
-                self._update_list_from_file(self.user_file, self.user_file_hash, self.usernames, type="usernames")
-                self._update_list_from_file(self.password_file, self.password_file_hash, self.passwords, type="passwords")
+                user_file_hash = self._update_list_from_file(self.user_file, self.user_file_hash, self.usernames, type="usernames")
+
+                if user_file_hash != self.user_file_hash:
+                    self.user_file_hash = user_file_hash
+                    self._update_accounts()
+
+                password_file_hash = self._update_list_from_file(self.password_file, self.password_file_hash, self.passwords, type="passwords")
+
+                reloaded = password_file_hash != self.password_file_hash
+                if reloaded:
+                    self.password_file_hash = password_file_hash
+                    self._apply_policy()
+
+                #
+                # Ranked lists keep sprayed passwords in front, so the index follows them
+                #
+                if self.ranker and indx > 0:
+                    self._rank_passwords(reloaded)
+                    indx = len(self.sprayed)
+
+                #
+                # Policy or re-ranking may have shortened the list past our index
+                #
+                if indx >= len(self.passwords):
+                    break
 
                 password = self.passwords[indx]
+                self.current_password = password
                 logger.debug(f"Loop index: {indx} - Password: '{password}'")
 
-                with Progress(transient=True, console=console) as progress:
-                    task = progress.add_task(f"[green]Spraying: {password}", total=len(self.usernames))
+                with self._progress(f"[green]Spraying: {password}") as (progress, task):
                     
-                    for user_indx, username in enumerate(self.usernames):
+                    deferred = []
+
+                    self.target.upcoming([
+                        account.submit for account in self.accounts
+                        if self.tracker.active(account.key)
+                        and (not self.policy or self.policy.allows_for(password, account.name))
+                    ])
+
+                    for user_indx, account in enumerate(self.accounts):
+
+                        #
+                        # Username was formatted for the module when the list loaded
+                        #
+                        username = account.submit
+
+                        #
+                        # Skip attempts the password policy would reject for this user
+                        #
+                        if self.policy and not self.policy.allows_for(password, account.name):
+                            logger.debug("Skipping %s - password policy rejects '%s' for this user", username, password)
+                            self.policy_skipped += 1
+                            progress.update(task, advance=1)
+                            continue
+
+                        #
+                        # Skip accounts known to be invalid, disabled, locked or already found
+                        #
+                        if self._inactive(account, progress, task):
+                            continue
 
                         #
                         # If we did a spray with password = username, we'll need jitter, even on first iteration
@@ -389,28 +1028,73 @@ class Spraycharles:
                         elif user_indx > 0:
                             self._jitter()
                         
-                        if self.domain:
-                            username = f"{self.domain}\\{username}"
-                        
-                        self._login(username, password)
+                        if not self._attempt(account, password):
+                            deferred.append(account)
+                            continue
                         
                         progress.update(task, advance=1)
 
-                        #
-                        # Log attempt to logfile
-                        #
-                        logging.info(f"Login attempted as {username}")
+                    self._attempt_deferred(deferred, lambda account: password, progress, task)
+                    self.tracker.save()
 
+                self.sprayed.append(password)
                 self.login_attempts += 1
                 indx += 1
 
         except IndexError as e:
             logger.error("Index error in spray loop, exiting spray loop! Bad user/pass file change?")
 
+        #
+        # Stop requested - the current attempt was logged, wrap up as usual
+        #
+        except SprayStopped:
+            print()
+            logger.info("Spray stopped")
+
+        finally:
+            self.display.stop()
+            self.tracker.save()
+
+        self.control.state = "finishing"
+
         #
         # The spray is complete, let's analyze results
         #
         print()
         logger.info("Spray complete!")
-        analyzer = Analyzer(self.output, self.notify, self.webhook, self.host, self.total_hits)
-        analyzer.analyze()
+        self._policy_summary()
+
+        if self.ledger:
+            logger.info(f"Lockout ledger: {self.ledger_skipped} attempts skipped as already made by another spray, {self.ledger_deferred} deferred for budget")
+            self.ledger.close()
+
+        if self.tls_sessions and self.tls_sessions.handshakes:
+            logger.info(f"TLS sessions: {self.tls_sessions.resumed} of {self.tls_sessions.handshakes} handshakes resumed ({self.tls_sessions.hit_rate():.0%})")
+
+        prefetcher = self.target.prefetcher
+        if prefetcher is not None and prefetcher.hits + prefetcher.misses + prefetcher.expired:
+            logger.info(f"Prefetch: {prefetcher.hits} of {prefetcher.hits + prefetcher.misses + prefetcher.expired} attempts used a prefetched value ({prefetcher.misses} missing, {prefetcher.expired} expired)")
+
+        if self.state_skipped:
+            logger.info(f"Account state: {self.state_skipped} attempts skipped ({self.tracker.describe()})")
+
+        self.results.close()
+        if self.db:
+            self.db.close()
+
+        #
+        # Simulated attempts all fail - report the plan instead of analyzing them
+        #
+        if self.timeline:
+            self.timeline.close()
+            self.timeline.report(self.attempts)
+        else:
+            with self.metrics.phase("analyzing"):
+                analyzer = Analyzer(self.output, self.notify, self.webhook, self.host, self.total_hits)
+                analyzer.analyze()
+
+        self.control.state = "done"
+        if self.exporter:
+            self.exporter.close()
+        if self.control_server:
+            self.control_server.close()
@@ -1,4 +1,6 @@
 from spraycharles.lib.utils.notify import discord, teams, slack, HookSvc
-from spraycharles.lib.utils.ntlm_challenger import main as ntlm_challenger
+from spraycharles.lib.utils.ntlm_challenger import main as ntlm_challenger, scan as ntlm_scan
 from spraycharles.lib.utils.smbstatus import SMBStatus
-from spraycharles.lib.utils.sprayresult import SprayResult
+from spraycharles.lib.utils.sprayresult import SprayResult, SprayRecord, LoginResult, SCHEMA_VERSION
+from spraycharles.lib.utils.policy import PasswordPolicy
+from spraycharles.lib.utils.accounts import UserIndex, UsernameFormat
@@ -0,0 +1,205 @@
+from enum import Enum
+
+from spraycharles.lib.logger import logger
+
+
+class UsernameFormat(str, Enum):
+    UPN       = "upn"           # user@domain.com
+    DOWNLEVEL = "downlevel"     # DOMAIN\user
+    RAW       = "raw"           # as given, with DOMAIN\ prepended if --domain is set
+
+
+class Account:
+    """
+    One real account, collapsed from every username variant in the user list
+    """
+
+    __slots__ = ("key", "name", "netbios", "dns", "submit")
+
+    def __init__(self, key, name, netbios, dns, submit):
+        self.key = key
+        self.name = name
+        self.netbios = netbios
+        self.dns = dns
+        self.submit = submit
+
+    def __eq__(self, other):
+        return isinstance(other, Account) and self.submit == other.submit and self.key == other.key
+
+    def __repr__(self):
+        return f"Account({self.key!r}, submit={self.submit!r})"
+
+
+class UserIndex:
+    """
+    Canonicalization index over the username list. Maps the variants of a
+    username to a single account key. With one domain in play (at most one
+    NetBIOS and one DNS domain across the list and --domain), the key is the
+    lowercased name, so jdoe, CORP\\jdoe and jdoe@corp.com are one account.
+    Otherwise it is qualified with the domain, matching a NetBIOS name to the
+    first label of a DNS domain, so CORP\\jdoe and OTHER\\jdoe are two.
+    Precomputes the username to submit in the target module's expected format
+    """
+
+    def __init__(self, fmt, domain=None):
+        self.format = UsernameFormat(fmt)
+        self.domain = domain
+        self.accounts = []
+        self.duplicates = 0
+
+        #
+        # raw line -> (name, netbios, dns), kept across reloads so only new
+        # lines need parsing
+        #
+        self._parsed = {}
+        self._by_key = {}
+
+        if self.format == UsernameFormat.UPN and domain and "." not in domain:
+            logger.warning(f"--domain {domain} is not a DNS domain and can't be used to build UPNs - ignoring")
+            self.domain = None
+
+
+    def __iter__(self):
+        return iter(self.accounts)
+
+
+    def __len__(self):
+        return len(self.accounts)
+
+
+    #
+    # Split a raw username into (name, netbios domain, dns domain)
+    #
+    @staticmethod
+    def parse(raw):
+        netbios = None
+        dns = None
+        name = raw
+
+        if "\\" in raw:
+            netbios, name = raw.split("\\", 1)
+        elif "@" in raw:
+            name, dns = raw.rsplit("@", 1)
+
+        return name, netbios or None, dns or None
+
+
+    #
+    # Lowercased label identifying a domain: the NetBIOS name, or the first
+    # label of the DNS domain, which is the NetBIOS name by default
+    #
+    @staticmethod
+    def _realm(netbios, dns):
+        if netbios:
+            return netbios.lower()
+        if dns:
+            return dns.split(".", 1)[0].lower()
+        return None
+
+
+    #
+    # Whether the list and --domain name at most one NetBIOS and one DNS
+    # domain, so every variant of a name is the same account
+    #
+    def _single_domain(self, parsed):
+        netbios = {n.lower() for _, n, _ in parsed if n}
+        dns = {d.lower() for _, _, d in parsed if d}
+        if self.domain:
+            (dns if "." in self.domain else netbios).add(self.domain.lower())
+        return len(netbios) <= 1 and len(dns) <= 1
+
+
+    #
+    # Account key - the lowercased name, qualified with the domain from the
+    # list or, for bare names, --domain when several domains are in play
+    #
+    def _key(self, name, netbios, dns, single):
+        if single:
+            return name.lower()
+
+        realm = UserIndex._realm(netbios, dns or self.domain)
+        return f"{realm}\\{name.lower()}" if realm else name.lower()
+
+
+    #
+    # Username to submit for an account, per module format
+    #
+    def _submit(self, raw, name, netbios, dns):
+        match self.format:
+            case UsernameFormat.UPN:
+                dns = dns or self.domain
+                return f"{name}@{dns}" if dns else name
+
+            case UsernameFormat.DOWNLEVEL:
+                netbios = netbios or (None if dns else self.domain)
+                if netbios:
+                    return f"{netbios}\\{name}"
+                return f"{name}@{dns}" if dns else name
+
+            case _:
+                if self.domain and "\\" not in raw and "@" not in raw:
+                    return f"{self.domain}\\{raw}"
+                return raw
+
+
+    #
+    # (Re)build the index from the username list. Previously seen lines are
+    # not re-parsed and unchanged accounts keep their existing entries
+    #
+    def update(self, lines):
+        entries = []
+        for line in lines:
+            raw = line.strip()
+            if not raw:
+                continue
+
+            parsed = self._parsed.get(raw)
+            if parsed is None:
+                parsed = self._parsed[raw] = UserIndex.parse(raw)
+            entries.append((raw, parsed))
+
+        seen = len(entries)
+        single = self._single_domain({parsed for _, parsed in entries})
+
+        merged = {}
+        raws = {}
+        for raw, (name, netbios, dns) in entries:
+            key = self._key(name, netbios, dns, single)
+            if key not in merged:
+                merged[key] = [name, netbios, dns]
+                raws[key] = raw
+            else:
+                #
+                # Fill in any domain details the first variant was missing
+                #
+                entry = merged[key]
+                entry[1] = entry[1] or netbios
+                entry[2] = entry[2] or dns
+
+        by_key = {}
+        submitted = set()
+        for key, (name, netbios, dns) in merged.items():
+            account = Account(key, name, netbios, dns, self._submit(raws[key], name, netbios, dns))
+
+            #
+            # Variants the module format can't tell apart (CORP\\jdoe and
+            # OTHER\\jdoe as UPNs) would be the same login - attempt it once
+            #
+            if account.submit in submitted:
+                continue
+            submitted.add(account.submit)
+
+            existing = self._by_key.get(key)
+            by_key[key] = existing if existing == account else account
+
+        #
+        # Drop parse cache entries for lines no longer in the list
+        #
+        if len(self._parsed) > 2 * seen:
+            current = {line.strip() for line in lines}
+            self._parsed = {raw: p for raw, p in self._parsed.items() if raw in current}
+
+        self._by_key = by_key
+        self.accounts = list(by_key.values())
+        self.duplicates = seen - len(self.accounts)
+        return self
@@ -4,8 +4,14 @@
 
 import base64
 import datetime
+import json
+import struct
 import sys
+import threading
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from urllib.parse import urlsplit
 
 import requests
 from impacket import ntlm, smb, smb3
@@ -14,19 +20,26 @@ from urllib3.exceptions import InsecureRequestWarning
 from spraycharles.lib.logger import console
 
 
-def decode_string(byte_string):
-    return byte_string.decode("UTF-8").replace("\x00", "")
+#
+# Fields are decoded straight out of a memoryview over the message, so
+# parsing doesn't copy the buffer slice by slice
+#
+def decode_string(buffer):
+    return str(buffer, "utf-16-le")
 
 
 def decode_int(byte_string):
     return int.from_bytes(byte_string, "little")
 
 
+VERSION = struct.Struct("<BBH")
+AV_PAIR = struct.Struct("<HH")
+CHALLENGE_HEADER = struct.Struct("<8sIHHIIQQHHI")
+
+
 def parse_version(version_bytes):
 
-    major_version = version_bytes[0]
-    minor_version = version_bytes[1]
-    product_build = decode_int(version_bytes[2:4])
+    major_version, minor_version, product_build = VERSION.unpack_from(version_bytes)
 
     version = "Unknown"
 
@@ -108,28 +121,31 @@ def parse_target_info(target_info_bytes):
     MsvAvTargetName = 0x0009
     MsvAvChannelBindings = 0x000A
 
+    names = {
+        MsvAvNbComputerName: "MsvAvNbComputerName",
+        MsvAvNbDomainName: "MsvAvNbDomainName",
+        MsvAvDnsComputerName: "MsvAvDnsComputerName",
+        MsvAvDnsDomainName: "MsvAvDnsDomainName",
+        MsvAvDnsTreeName: "MsvAvDnsTreeName",
+        MsvAvSingleHost: "MsvAvSingleHost",
+        MsvAvTargetName: "MsvAvTargetName",
+    }
+
     target_info = OrderedDict()
     info_offset = 0
+    view = memoryview(target_info_bytes)
 
-    while info_offset < len(target_info_bytes):
-        av_id = decode_int(target_info_bytes[info_offset : info_offset + 2])
-        av_len = decode_int(target_info_bytes[info_offset + 2 : info_offset + 4])
-        av_value = target_info_bytes[info_offset + 4 : info_offset + 4 + av_len]
+    while info_offset + AV_PAIR.size <= len(view):
+        av_id, av_len = AV_PAIR.unpack_from(view, info_offset)
+        value_offset = info_offset + AV_PAIR.size
+        av_value = view[value_offset : value_offset + av_len]
 
-        info_offset = info_offset + 4 + av_len
+        info_offset = value_offset + av_len
 
         if av_id == MsvAvEOL:
-            pass
-        elif av_id == MsvAvNbComputerName:
-            target_info["MsvAvNbComputerName"] = decode_string(av_value)
-        elif av_id == MsvAvNbDomainName:
-            target_info["MsvAvNbDomainName"] = decode_string(av_value)
-        elif av_id == MsvAvDnsComputerName:
-            target_info["MsvAvDnsComputerName"] = decode_string(av_value)
-        elif av_id == MsvAvDnsDomainName:
-            target_info["MsvAvDnsDomainName"] = decode_string(av_value)
-        elif av_id == MsvAvDnsTreeName:
-            target_info["MsvAvDnsTreeName"] = decode_string(av_value)
+            break
+        elif av_id in names:
+            target_info[names[av_id]] = decode_string(av_value)
         elif av_id == MsvAvFlags:
             pass
         elif av_id == MsvAvTimestamp:
@@ -139,65 +155,46 @@ def parse_target_info(target_info_bytes):
                 microseconds=microseconds
             )
             target_info["MsvAvTimestamp"] = time.strftime("%b %d, %Y %H:%M:%S.%f")
-        elif av_id == MsvAvSingleHost:
-            target_info["MsvAvSingleHost"] = decode_string(av_value)
-        elif av_id == MsvAvTargetName:
-            target_info["MsvAvTargetName"] = decode_string(av_value)
         elif av_id == MsvAvChannelBindings:
-            target_info["MsvAvChannelBindings"] = av_value
+            target_info["MsvAvChannelBindings"] = av_value.hex()
 
     return target_info
 
 
 def parse_challenge(challenge_message):
 
-    # Signature
-    # b'NTLMSSP\x00' --> NTLMSSP
-    signature = decode_string(challenge_message[0:7])
+    view = memoryview(challenge_message)
 
-    # MessageType
-    # b'\x02\x00\x00\x00' --> 2
-    message_type = decode_int(challenge_message[8:12])
+    if len(view) < CHALLENGE_HEADER.size:
+        raise ValueError("NTLM challenge message is truncated")
 
-    # TargetNameFields
-    target_name_fields = challenge_message[12:20]
-    target_name_len = decode_int(target_name_fields[0:2])
-    target_name_max_len = decode_int(target_name_fields[2:4])
-    target_name_offset = decode_int(target_name_fields[4:8])
+    (
+        signature,              # b'NTLMSSP\x00'
+        message_type,           # 2
+        target_name_len,        # TargetNameFields
+        target_name_max_len,
+        target_name_offset,
+        negotiate_flags_int,    # NegotiateFlags
+        server_challenge,       # ServerChallenge
+        reserved,               # Reserved
+        target_info_len,        # TargetInfoFields
+        target_info_max_len,
+        target_info_offset,
+    ) = CHALLENGE_HEADER.unpack_from(view)
 
-    # NegotiateFlags
-    negotiate_flags_int = decode_int(challenge_message[20:24])
+    if signature != b"NTLMSSP\x00" or message_type != 2:
+        raise ValueError("Not an NTLM challenge message")
 
     negotiate_flags = parse_negotiate_flags(negotiate_flags_int)
 
-    # ServerChallenge
-    server_challenge = challenge_message[24:32]
-
-    # Reserved
-    reserved = challenge_message[32:40]
-
-    # TargetInfoFields
-    target_info_fields = challenge_message[40:48]
-    target_info_len = decode_int(target_info_fields[0:2])
-    target_info_max_len = decode_int(target_info_fields[2:4])
-    target_info_offset = decode_int(target_info_fields[4:8])
-
     # Version
-    version_bytes = challenge_message[48:56]
-    version = parse_version(version_bytes)
+    version = parse_version(view[CHALLENGE_HEADER.size : CHALLENGE_HEADER.size + 8]) if len(view) >= CHALLENGE_HEADER.size + 8 else "Unknown"
 
     # TargetName
-    target_name = challenge_message[
-        target_name_offset : target_name_offset + target_name_len
-    ]
-    target_name = decode_string(target_name)
+    target_name = decode_string(view[target_name_offset : target_name_offset + target_name_len])
 
     # TargetInfo
-    target_info_bytes = challenge_message[
-        target_info_offset : target_info_offset + target_info_len
-    ]
-
-    target_info = parse_target_info(target_info_bytes)
+    target_info = parse_target_info(view[target_info_offset : target_info_offset + target_info_len])
 
     return {
         "target_name": target_name,
@@ -227,45 +224,45 @@ def print_challenge(challenge):
         console.print("  {}".format(flag))
 
 
-def request_http(url):
+def request_http(url, timeout=None, session=None):
 
     # setup request, insecurely
     headers = {"Authorization": "NTLM TlRMTVNTUAABAAAAB4IIAAAAAAAAAAAAAAAAAAAAAAA="}
     requests.packages.urllib3.disable_warnings(category=InsecureRequestWarning)
 
-    request = requests.get(url, headers=headers, verify=False)
+    request = (session or requests).get(url, headers=headers, verify=False, timeout=timeout)
 
     if request.status_code not in [401, 302]:
-        console.print(
-            "[!] Expecting response code 401 or 302, received: {}".format(
+        raise ValueError(
+            "Expecting response code 401 or 302, received: {}".format(
                 request.status_code
             )
         )
-        return None
 
     # get auth header
     auth_header = request.headers.get("WWW-Authenticate")
 
     if not auth_header:
-        console.print("[!] NTLM Challenge response not found (WWW-Authenticate header missing)")
-        return None
+        raise ValueError("NTLM Challenge response not found (WWW-Authenticate header missing)")
 
     if not "NTLM" in auth_header:
-        console.print(
-            '[!] NTLM Challenge response not found (WWW-Authenticate does not contain "NTLM")'
+        raise ValueError(
+            'NTLM Challenge response not found (WWW-Authenticate does not contain "NTLM")'
         )
-        return None
 
     # get challenge message from header
-    challenge_message = base64.b64decode(auth_header.split(" ")[1].replace(",", ""))
+    for value in auth_header.split(","):
+        value = value.strip()
+        if value.startswith("NTLM "):
+            return base64.b64decode(value.split(" ")[1])
 
-    return challenge_message
+    raise ValueError("NTLM Challenge response not found (no challenge in WWW-Authenticate)")
 
 
-def request_SMBv23(host, port=445):
+def request_SMBv23(host, port=445, timeout=60):
 
     # start client
-    smb_client = smb3.SMB3(host, host, sess_port=port)
+    smb_client = smb3.SMB3(host, host, sess_port=port, timeout=timeout)
 
     # start: modified from login()
     # https://github.com/SecureAuthCorp/impacket/blob/master/impacket/smb3.py
@@ -299,12 +296,11 @@ def request_SMBv23(host, port=445):
     packet["Command"] = smb3.SMB2_SESSION_SETUP
     packet["Data"] = session_setup
 
-    packet_id = smb_client.sendSMB(packet)
-
-    smb_response = smb_client.recvSMB(packet_id)
-
-    if smb_client._Connection["Dialect"] == smb3.SMB2_DIALECT_311:
-        smb_client.__UpdatePreAuthHash(smb_response.rawData)
+    try:
+        packet_id = smb_client.sendSMB(packet)
+        smb_response = smb_client.recvSMB(packet_id)
+    finally:
+        smb_client.close_session()
 
     # NTLM challenge
     if smb_response.isValidAnswer(smb3.STATUS_MORE_PROCESSING_REQUIRED):
@@ -314,13 +310,13 @@ def request_SMBv23(host, port=445):
         return resp_token["ResponseToken"]
 
     else:
-        return None
+        raise ValueError("NTLM Challenge response not found in SMB session setup response")
 
 
-def request_SMBv1(host, port=445):
+def request_SMBv1(host, port=445, timeout=None):
 
     # start client
-    smb_client = smb.SMB(host, host, sess_port=port)
+    smb_client = smb.SMB(host, host, sess_port=port, timeout=timeout)
 
     # start: modified from login_standard()
     # https://github.com/SecureAuthCorp/impacket/blob/master/impacket/smb.py
@@ -366,9 +362,11 @@ def request_SMBv1(host, port=445):
 
     smb_packet.addCommand(session_setup)
 
-    smb_client.sendSMB(smb_packet)
-
-    smb_response = smb_client.recvSMB()
+    try:
+        smb_client.sendSMB(smb_packet)
+        smb_response = smb_client.recvSMB()
+    finally:
+        smb_client.close_session()
 
     # NTLM challenge
     if smb_response.isValidAnswer(smb.SMB.SMB_COM_SESSION_SETUP_ANDX):
@@ -388,37 +386,143 @@ def request_SMBv1(host, port=445):
         return resp_token["ResponseToken"]
 
     else:
-        return None
+        raise ValueError("NTLM Challenge response not found in SMBv1 session setup response")
 
 
-def main(url, smbv1):
+#
+# Request the NTLM challenge message from an http(s):// or smb:// URL
+#
+def request_challenge(url, smbv1=False, timeout=None, session=None):
 
-    # request challenge
     if url.startswith("smb"):
 
         # get host/port from SMB
-        host_port = url.split("://")[1].split("/")[0].split(":")
-
-        if len(host_port) == 2:
-            host, port = host_port
-        else:
-            host = host_port[0]
-            port = 445
+        parts = urlsplit(url)
+        host = parts.hostname
+        port = parts.port or 445
 
         if smbv1:
-            challenge = request_SMBv1(host, port)
+            return request_SMBv1(host, port, timeout)
         else:
-            challenge = request_SMBv23(host, port)
+            return request_SMBv23(host, port, timeout or 60)
 
     elif url.startswith("http"):
-        challenge = request_http(url)
+        return request_http(url, timeout, session)
 
     else:
-        console.print("[!] Invalid URL, expecting http://... or smb://...")
-        sys.exit()
+        raise ValueError("Invalid URL, expecting http://... or smb://...")
+
+
+#
+# Targets are cached by host and port, so http and https on one host are
+# fingerprinted separately but different paths are not
+#
+def cache_key(url):
+    parts = urlsplit(url)
+    port = parts.port or {"http": 80, "https": 443}.get(parts.scheme, 445)
+    return f"{(parts.hostname or '').lower()}:{port}"
+
+
+#
+# JSON-serializable record for one target
+#
+def challenge_record(url, challenge=None, error=None):
+    record = {
+        "target": url,
+        "host": cache_key(url),
+        "timestamp": datetime.datetime.now(datetime.UTC).isoformat(timespec="seconds"),
+    }
 
-    # parse challenge
-    parsed_challenge = parse_challenge(challenge)
+    if error is not None:
+        record["error"] = error
+        return record
+
+    if "NTLMSSP_TARGET_TYPE_DOMAIN" in challenge["negotiate_flags"]:
+        record["target_type"] = "Domain"
+    elif "NTLMSSP_TARGET_TYPE_SERVER" in challenge["negotiate_flags"]:
+        record["target_type"] = "Server"
+
+    record.update(challenge)
+    return record
+
+
+def probe(url, smbv1, timeout, session):
+    try:
+        challenge = parse_challenge(request_challenge(url, smbv1, timeout, session))
+    except Exception as e:
+        return challenge_record(url, error=str(e) or e.__class__.__name__)
+    return challenge_record(url, challenge)
+
+
+#
+# Probe a list of targets with a bounded worker pool, streaming one JSON
+# object per target to outfile as results come in. Hosts with a result in
+# the cache file are not probed again unless refresh is set; either way
+# the cache keeps every other host it holds.
+# Returns the number of (probed, cached, failed) targets
+#
+def scan(targets, outfile, smbv1=False, workers=20, timeout=5, cache_file=None, refresh=False):
+
+    cache = {}
+    if cache_file is not None and cache_file.exists():
+        try:
+            cache = json.loads(cache_file.read_text())
+        except ValueError:
+            cache = {}
+
+    # one target per host, in file order
+    pending = OrderedDict()
+    for url in targets:
+        pending.setdefault(cache_key(url), url)
+
+    probed = cached = failed = 0
+
+    def emit(record):
+        outfile.write(json.dumps(record))
+        outfile.write("\n")
+        outfile.flush()
+
+    for key in [key for key in pending if key in cache and not refresh]:
+        emit({**cache[key], "cached": True})
+        cached += 1
+        del pending[key]
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = [executor.submit(probe, url, smbv1, timeout, session) for url in pending.values()]
+        for future in as_completed(futures):
+            record = future.result()
+            emit(record)
+            probed += 1
+            if "error" in record:
+                failed += 1
+            else:
+                cache[record["host"]] = record
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        session.close()
+
+        if cache_file is not None:
+            cache_file.parent.mkdir(exist_ok=True)
+            cache_file.write_text(json.dumps(cache))
+
+    return probed, cached, failed
+
+
+def main(url, smbv1, timeout=None):
+
+    # request challenge
+    try:
+        challenge = request_challenge(url, smbv1, timeout)
+        parsed_challenge = parse_challenge(challenge)
+    except ValueError as e:
+        console.print(f"[!] {e}")
+        sys.exit()
 
     # print challenge
     print_challenge(parsed_challenge)
@@ -0,0 +1,134 @@
+import re
+
+
+#
+# Character classes counted by the Active Directory complexity requirement
+# (uppercase, lowercase, base 10 digits, non-alphanumeric)
+#
+COMPLEXITY_CLASSES = [
+    re.compile(r"[A-Z]"),
+    re.compile(r"[a-z]"),
+    re.compile(r"[0-9]"),
+    re.compile(r"[^A-Za-z0-9]"),
+]
+
+#
+# Delimiters AD uses to tokenize account/display names for the complexity check
+#
+NAME_DELIMITERS = re.compile(r"[,.\-_#\s\t]")
+
+
+class PasswordPolicy:
+    """
+    Compiled password policy used to drop candidates the target would reject
+    """
+
+    def __init__(self, min_length=None, complexity=False, banned=None, regexes=None):
+        self.min_length = min_length or 0
+        self.complexity = complexity
+        self.banned = None
+        self.regexes = [re.compile(r) for r in regexes or []]
+
+        if banned:
+            self.banned = re.compile("|".join(re.escape(b) for b in banned), re.IGNORECASE)
+
+        #
+        # Cache of username -> compiled name token pattern, so per-user
+        # checks don't rebuild the same regex every password rotation
+        #
+        self._user_patterns = {}
+
+
+    #
+    # Only rules which reference the username need to run per attempt
+    #
+    @property
+    def per_user(self):
+        return self.complexity
+
+
+    #
+    # Human readable summary for the pre-spray table
+    #
+    def describe(self):
+        rules = []
+        if self.min_length:
+            rules.append(f"min length {self.min_length}")
+        if self.complexity:
+            rules.append("AD complexity")
+        if self.banned:
+            rules.append("banned substrings")
+        if self.regexes:
+            rules.append(f"{len(self.regexes)} regex(es)")
+        return ", ".join(rules)
+
+
+    #
+    # User independent checks, run when password lists are loaded
+    #
+    def allows(self, password):
+        if len(password) < self.min_length:
+            return False
+
+        if self.banned is not None and self.banned.search(password):
+            return False
+
+        for regex in self.regexes:
+            if not regex.search(password):
+                return False
+
+        if self.complexity:
+            classes = sum(1 for c in COMPLEXITY_CLASSES if c.search(password))
+            if classes < 3:
+                return False
+
+        return True
+
+
+    #
+    # Username dependent checks. AD rejects passwords containing the account
+    # name, or any name token of 3+ characters, regardless of case
+    #
+    def allows_for(self, password, username):
+        if not self.complexity:
+            return True
+
+        # None is cached too, for names too short to check
+        if username in self._user_patterns:
+            pattern = self._user_patterns[username]
+        else:
+            pattern = self._user_patterns[username] = self._compile_user(username)
+
+        return pattern is None or not pattern.search(password)
+
+
+    #
+    # Split a password list into (allowed, dropped)
+    #
+    def filter(self, passwords):
+        allowed = []
+        dropped = []
+        for password in passwords:
+            if self.allows(password):
+                allowed.append(password)
+            else:
+                dropped.append(password)
+        return allowed, dropped
+
+
+    @staticmethod
+    def _compile_user(username):
+        #
+        # Strip any DOMAIN\ prefix or @domain suffix down to the account name
+        #
+        name = username.split("\\")[-1].split("@")[0]
+
+        tokens = set()
+        if len(name) >= 3:
+            tokens.add(name)
+        tokens.update(t for t in NAME_DELIMITERS.split(name) if len(t) >= 3)
+
+        if not tokens:
+            return None
+
+        return re.compile("|".join(re.escape(t) for t in tokens), re.IGNORECASE)
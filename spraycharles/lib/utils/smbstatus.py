@@ -8,3 +8,6 @@ class SMBStatus(str, Enum):
     STATUS_ACCOUNT_DISABLED     = "STATUS_ACCOUNT_DISABLED"
     STATUS_PASSWORD_EXPIRED     = "STATUS_PASSWORD_EXPIRED"
     STATUS_PASSWORD_MUST_CHANGE = "STATUS_PASSWORD_MUST_CHANGE"
+
+    def __str__(self):
+        return self.value
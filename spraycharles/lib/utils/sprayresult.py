@@ -1,13 +1,166 @@
+from enum import Enum
+
+from spraycharles.lib.utils.smbstatus import SMBStatus
+
+
 #
 # Define strings for JSON properties
 #
 class SprayResult:
     TIMESTAMP       = 'UTC Timestamp'
     MODULE          = 'Module'
-    RESULT          = 'Result'          # O365/Okta only
-    MESSAGE         = 'Message'         # O365/Okta only
+    SCHEMA          = 'Schema'          # Record format version, absent in version 1
+    RESULT          = 'Result'          # Classified attempts only
+    MESSAGE         = 'Message'         # Classified attempts only
     USERNAME        = 'Username'
     PASSWORD        = 'Password'
     RESPONSE_CODE   = 'Response Code'
     RESPONSE_LENGTH = 'Response Length'
     SMB_LOGIN       = 'SMB Login'       # SMB only
+    TIMEOUT         = 'Timeout'         # Timed out attempts only
+    CONNECT_TIME    = 'Connect ms'      # Network timings, in milliseconds
+    TLS_TIME        = 'TLS ms'
+    TTFB            = 'TTFB ms'
+    TOTAL_TIME      = 'Total ms'
+    REUSED          = 'Connection Reused'
+
+
+#
+# Classified outcomes of a login attempt (the Result property)
+#
+class LoginResult(str, Enum):
+    SUCCESS      = "Success"
+    FAIL         = "Fail"
+    LOCKED       = "Locked"
+    INVALID_USER = "Invalid user"
+    DISABLED     = "Disabled"
+    ERROR        = "Error"
+
+    def __str__(self):
+        return self.value
+
+
+#
+# Version of the results file record format, written with each record.
+# Version 1 records carry no Schema property, hold response lengths as
+# strings and mark timeouts with TIMEOUT in the code and length fields
+#
+SCHEMA_VERSION = 2
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+#
+# Enum member with the value, or the value itself if the enum doesn't know it
+#
+def _enum(cls, value):
+    return cls._value2member_map_.get(value, value)
+
+
+class SprayRecord:
+    """
+    One results file record with native types: integer response codes and
+    lengths, LoginResult and SMBStatus members for classified outcomes, an
+    explicit timeout flag and timings in milliseconds. Reads both the
+    current and version 1 record formats, and writes the current one
+    """
+
+    __slots__ = (
+        "timestamp", "module", "username", "password", "result", "message",
+        "code", "length", "smb_login", "timeout",
+        "connect_ms", "tls_ms", "ttfb_ms", "total_ms", "reused",
+    )
+
+    def __init__(self, timestamp=None, module=None, username=None, password=None, result=None, message=None,
+                 code=None, length=None, smb_login=None, timeout=False,
+                 connect_ms=None, tls_ms=None, ttfb_ms=None, total_ms=None, reused=None):
+        self.timestamp = timestamp
+        self.module = module
+        self.username = username
+        self.password = password
+        self.result = None if result is None else _enum(LoginResult, result)
+        self.message = message
+        self.code = code
+        self.length = length
+        self.smb_login = None if smb_login is None else _enum(SMBStatus, smb_login)
+        self.timeout = timeout
+        self.connect_ms = connect_ms
+        self.tls_ms = tls_ms
+        self.ttfb_ms = ttfb_ms
+        self.total_ms = total_ms
+        self.reused = reused
+
+
+    def __repr__(self):
+        return f"SprayRecord({self.timestamp!r}, {self.module!r}, {self.username!r}, {self.result or self.smb_login or self.code!r})"
+
+
+    #
+    # Record from a results file JSON object of any schema version
+    #
+    @classmethod
+    def from_dict(cls, data):
+        code = data.get(SprayResult.RESPONSE_CODE)
+        smb_login = data.get(SprayResult.SMB_LOGIN)
+        timeout = bool(data.get(SprayResult.TIMEOUT)) or code == "TIMEOUT" or smb_login == "TIMEOUT"
+
+        return cls(
+            timestamp=data.get(SprayResult.TIMESTAMP),
+            module=data.get(SprayResult.MODULE),
+            username=data.get(SprayResult.USERNAME),
+            password=data.get(SprayResult.PASSWORD),
+            result=data.get(SprayResult.RESULT),
+            message=data.get(SprayResult.MESSAGE),
+            code=None if timeout else _int(code),
+            length=None if timeout else _int(data.get(SprayResult.RESPONSE_LENGTH)),
+            smb_login=None if smb_login == "TIMEOUT" else smb_login,
+            timeout=timeout,
+            connect_ms=data.get(SprayResult.CONNECT_TIME),
+            tls_ms=data.get(SprayResult.TLS_TIME),
+            ttfb_ms=data.get(SprayResult.TTFB),
+            total_ms=data.get(SprayResult.TOTAL_TIME),
+            reused=data.get(SprayResult.REUSED),
+        )
+
+
+    #
+    # JSON object written to the results file. Fields a module doesn't
+    # populate are left out, matching the per-module output formats
+    #
+    def to_dict(self):
+        data = {
+            SprayResult.TIMESTAMP   : self.timestamp,
+            SprayResult.MODULE      : self.module,
+            SprayResult.SCHEMA      : SCHEMA_VERSION,
+        }
+
+        if self.result is not None:
+            data[SprayResult.RESULT] = str(self.result)
+            data[SprayResult.MESSAGE] = self.message
+
+        data[SprayResult.USERNAME] = self.username
+        data[SprayResult.PASSWORD] = self.password
+
+        if self.code is not None:
+            data[SprayResult.RESPONSE_CODE] = self.code
+            data[SprayResult.RESPONSE_LENGTH] = self.length
+
+        if self.smb_login is not None:
+            data[SprayResult.SMB_LOGIN] = str(self.smb_login)
+
+        if self.timeout:
+            data[SprayResult.TIMEOUT] = True
+
+        if self.total_ms is not None or self.reused is not None:
+            data[SprayResult.CONNECT_TIME] = self.connect_ms
+            data[SprayResult.TLS_TIME] = self.tls_ms
+            data[SprayResult.TTFB] = self.ttfb_ms
+            data[SprayResult.TOTAL_TIME] = self.total_ms
+            data[SprayResult.REUSED] = self.reused
+
+        return data
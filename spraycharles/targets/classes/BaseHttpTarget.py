@@ -1,18 +1,26 @@
-import json
-import datetime
+from spraycharles.lib.utils import SprayResult, UsernameFormat
 
-from spraycharles.lib.utils import SprayResult
-from spraycharles.lib.logger import logger, JSON_FMT
+from .Attempt import AttemptResult
+from .BaseTarget import BaseTarget
+from .RuleSet import RuleSet
+from .Transport import HttpTransport
 
 
-class BaseHttpTarget:
+class BaseHttpTarget(BaseTarget):
     """
     Base class to hold output for standard HTTP spray targets
     """
 
-    def __init__(self):
-        self.username = ""
-        self.password = ""
+    USERNAME_FORMAT = UsernameFormat.RAW
+
+    #
+    # Default success/failure rules, see RuleSet. Responses no rule matches
+    # are left unclassified for the analyzer's response length statistics
+    #
+    RULES = []
+
+    transport = HttpTransport()
+    rules = None
 
 
     #
@@ -22,11 +30,38 @@ class BaseHttpTarget:
         self.url = self.url.replace("https://", "http://", 1)
 
 
-    # 
+    #
+    # Compile the module's rules, with any rules from the --rules config
+    # taking precedence over the defaults
+    #
+    def set_rules(self, overrides=None):
+        self.rules = RuleSet(list(overrides or []) + self.RULES)
+
+
+    #
+    # Classify with the module's rules and record the response code and length for analysis
+    #
+    def classify(self, spec, response):
+        if self.rules is None:
+            self.set_rules()
+
+        result, message = self.rules.classify(response)
+
+        return AttemptResult(
+            spec.username,
+            spec.password,
+            code=response.status_code,
+            length=len(response.content),
+            result=result,
+            message=message,
+        )
+
+
+    #
     # Print default module headers
     #
     def print_headers(self):
-        header = ("%-35s %-25s %-13s %-15s" % (SprayResult.USERNAME, SprayResult.PASSWORD, SprayResult.RESPONSE_CODE, SprayResult.RESPONSE_LENGTH))
+        header = ("%-13s %-35s %-25s %-13s %-15s" % (SprayResult.RESULT, SprayResult.USERNAME, SprayResult.PASSWORD, SprayResult.RESPONSE_CODE, SprayResult.RESPONSE_LENGTH))
         print(header)
         print("-" * len(header))
 
@@ -34,36 +69,5 @@ class BaseHttpTarget:
     #
     # Print login attempt
     #
-    def print_response(self, response, outfile, timeout=False, print_to_screen=True):
-        if timeout:
-            code = "TIMEOUT"
-            length = "TIMEOUT"
-        else:
-            code = response.status_code
-            length = str(len(response.content))
-
-        if print_to_screen:
-            print("%-35s %-25s %13s %15s" % (self.username, self.password, code, length))
-        
-        self.log_attempt(code, length, outfile)
-
-    
-    #
-    # Log attempt as JSON object to file
-    #
-    def log_attempt(self, code, length, outfile):
-        output = open(outfile, "a")
-        data = json.dumps(
-            {
-                SprayResult.TIMESTAMP       : datetime.datetime.now(datetime.UTC).strftime("%Y-%m-%d %H:%M:%S"),
-                SprayResult.MODULE          : self.__class__.__name__,
-                SprayResult.USERNAME        : self.username,
-                SprayResult.PASSWORD        : self.password,
-                SprayResult.RESPONSE_CODE   : code,
-                SprayResult.RESPONSE_LENGTH : length,
-            }
-        )
-        logger.debug(data, extra=JSON_FMT)
-        output.write(data)
-        output.write("\n")
-        output.close()
\ No newline at end of file
+    def print_result(self, result):
+        print("%-13s %-35s %-25s %13s %15s" % (result.result or "", result.username, result.password, result.shown("code"), result.shown("length")))
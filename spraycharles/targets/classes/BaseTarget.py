@@ -0,0 +1,94 @@
+import logging
+
+from spraycharles.lib.utils import UsernameFormat
+from spraycharles.lib.logger import logger, JSON_FMT
+from spraycharles.lib.profiler import profiler
+from spraycharles.lib.serialization import encode_record
+
+from .Attempt import AttemptResult
+
+
+class BaseTarget:
+    """
+    Base class for spray targets. A login attempt is split into:
+        prepare()  - pure; builds an immutable request spec for username/password
+        send()     - executes the spec with the target's transport
+        classify() - pure; turns the spec and response into an AttemptResult
+    No per-attempt state is kept on the instance, so several attempts can be in flight
+    """
+
+    NAME = None
+    DESCRIPTION = None
+    USERNAME_FORMAT = UsernameFormat.RAW
+
+    transport = None
+
+    #
+    # Prefetcher for modules that fetch per-user values ahead of attempts
+    #
+    prefetcher = None
+
+
+    def prepare(self, username, password):
+        raise NotImplementedError
+
+
+    def send(self, spec):
+        return self.transport.send(spec)
+
+
+    #
+    # Usernames about to be attempted, in order, for modules that can
+    # prepare for them ahead of time
+    #
+    def upcoming(self, usernames):
+        pass
+
+
+    #
+    # An upcoming username won't be attempted now - skipped, deferred or
+    # pruned - so anything prepared for it can be dropped
+    #
+    def skip(self, username):
+        pass
+
+
+    def classify(self, spec, response):
+        raise NotImplementedError
+
+
+    #
+    # Result recorded when the request timed out
+    #
+    def timeout_result(self, spec):
+        return AttemptResult(spec.username, spec.password, timeout=True)
+
+
+    #
+    # Print and log a classified attempt
+    #
+    def report(self, result, outfile, print_to_screen=True):
+        if print_to_screen:
+            with profiler.phase("print"):
+                self.print_result(result)
+        with profiler.phase("log"):
+            self.log_result(result, outfile)
+
+
+    def print_headers(self):
+        raise NotImplementedError
+
+
+    def print_result(self, result):
+        raise NotImplementedError
+
+
+    #
+    # Log attempt as JSON object to file
+    #
+    def log_result(self, result, outfile):
+        line = encode_record(result.record(self.__class__.__name__))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(line.decode().rstrip(), extra=JSON_FMT)
+        with open(outfile, "ab") as output:
+            output.write(line)
@@ -0,0 +1,239 @@
+import asyncio
+import threading
+import time
+
+import requests
+from requests.cookies import RequestsCookieJar
+from requests.structures import CaseInsensitiveDict
+
+from spraycharles.lib.logger import logger
+from spraycharles.lib.profiler import profiler
+
+from .Resolver import resolver
+from .Transport import AttemptTimer, _thaw
+
+try:
+    import httpcore
+    import httpx
+except ImportError:
+    httpcore = None
+    httpx = None
+
+
+class HttpxTransport:
+    """
+    Executes HttpRequest specs with httpx on an asyncio event loop running
+    in a background thread, pooling HTTP/1.1 connections and multiplexing
+    HTTP/2 where the server offers it. send() blocks like HttpTransport, so
+    modules run unchanged, while attempts sent from several threads (such
+    as Okta's stateToken prefetch) overlap on the loop. Responses come back
+    as requests Responses and httpx errors as requests exceptions.
+    Connections go to the resolver's pinned addresses, as with requests
+    """
+
+    def __init__(self, http2=True):
+        if httpx is None:
+            raise RuntimeError("The httpx transport needs httpx - pip install 'spraycharles[httpx]'")
+
+        self.http2 = http2
+        self.pools = {}
+        self.pinned = True
+
+        try:
+            self._pool(False)
+        except ImportError:
+            logger.warning("HTTP/2 needs the h2 package (pip install 'spraycharles[httpx]') - using HTTP/1.1")
+            self.http2 = False
+            self._pool(False)
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="httpx", daemon=True)
+        self.thread.start()
+
+
+    @staticmethod
+    def available():
+        return httpx is not None
+
+
+    #
+    # Connection pool per certificate verification setting, so modules that
+    # verify certificates (Office365) keep doing so
+    #
+    def _pool(self, verify):
+        pool = self.pools.get(verify)
+        if pool is None:
+            pool = httpx.AsyncHTTPTransport(http2=self.http2, verify=verify, retries=0)
+            self.pinned = _pin(pool) and self.pinned
+            self.pools[verify] = pool
+        return pool
+
+
+    def describe(self):
+        return "httpx (HTTP/2)" if self.http2 else "httpx (HTTP/1.1)"
+
+
+    def send(self, spec):
+        #
+        # The attempt timer is thread-local to the caller, so hand it over
+        #
+        timer = AttemptTimer.current()
+        future = asyncio.run_coroutine_threadsafe(self._send(spec, timer), self.loop)
+
+        try:
+            return future.result()
+        except httpx.HTTPError as e:
+            raise _requests_error(e) from e
+
+
+    async def _send(self, spec, timer):
+        #
+        # A client per attempt over the shared pool, so cookies never carry
+        # over between attempts, as with requests.request
+        #
+        client = httpx.AsyncClient(transport=self._pool(spec.verify), cookies=_thaw(spec.cookies), follow_redirects=True, timeout=spec.timeout)
+
+        data = _thaw(spec.data)
+        body = {"content": data} if isinstance(data, (str, bytes)) else {"data": data}
+
+        async with client.stream(
+            spec.method,
+            spec.url,
+            headers=_thaw(spec.headers),
+            json=_thaw(spec.json),
+            auth=spec.auth,
+            extensions={"trace": _tracer(timer)},
+            **body,
+        ) as response:
+            await response.aread()
+
+        return _response(response)
+
+
+    def close(self):
+        for pool in list(self.pools.values()):
+            asyncio.run_coroutine_threadsafe(pool.aclose(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+class _PinnedBackend:
+    """
+    httpcore network backend opening connections to pinned hosts at their
+    pinned address, failing over like requests connections. TLS is started
+    by httpcore with the hostname, so SNI and certificate checks are unchanged
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        def connect(address):
+            return self.backend.connect_tcp(address, port, timeout=timeout, local_address=local_address, socket_options=socket_options)
+
+        if not resolver.is_pinned(host):
+            return await connect(host)
+
+        address = resolver.address(host)
+        try:
+            return await connect(address)
+        except (httpcore.ConnectError, httpcore.ConnectTimeout) as error:
+            for other in resolver.others(host, address):
+                try:
+                    stream = await connect(other)
+                except (httpcore.ConnectError, httpcore.ConnectTimeout):
+                    continue
+
+                resolver.repin(host, address, other)
+                return stream
+            raise error
+
+
+#
+# Route a pool's connections through the pinned addresses. httpx has no
+# public hook for the network backend, so this returns False if the
+# internals it relies on are missing
+#
+def _pin(pool):
+    connections = getattr(pool, "_pool", None)
+    if connections is None or not hasattr(connections, "_network_backend"):
+        return False
+
+    connections._network_backend = _PinnedBackend(connections._network_backend)
+    return True
+
+
+#
+# httpcore trace callback recording connect, TLS and first byte times into
+# the timer and the profiler
+#
+def _tracer(timer):
+    started = {}
+
+    async def trace(event, info):
+        step, _, state = event.rpartition(".")
+        if state == "started":
+            started[step] = time.perf_counter()
+            return
+
+        if state != "complete" or step not in started:
+            return
+
+        elapsed = time.perf_counter() - started.pop(step)
+        if step == "connection.connect_tcp":
+            profiler.record("connect", elapsed)
+            if timer is not None:
+                timer.add("connect", elapsed)
+        elif step == "connection.start_tls":
+            profiler.record("tls", elapsed)
+            if timer is not None:
+                timer.add("tls", elapsed)
+        elif step.endswith(".receive_response_headers") and timer is not None:
+            timer.first_byte()
+
+    return trace
+
+
+#
+# requests Response with an httpx response's status, headers, cookies, body and redirect chain
+#
+def _response(response, history=True):
+    converted = requests.Response()
+    converted.status_code = response.status_code
+    converted.reason = response.reason_phrase
+    converted.url = str(response.url)
+    converted.headers = CaseInsensitiveDict({name: ", ".join(response.headers.get_list(name)) for name in response.headers.keys()})
+    converted.encoding = response.encoding
+    converted.cookies = RequestsCookieJar()
+    converted.cookies.update(response.cookies.jar)
+    try:
+        converted._content = response.content
+    except httpx.ResponseNotRead:
+        converted._content = b""
+    converted._content_consumed = True
+
+    if history:
+        converted.history = [_response(previous, history=False) for previous in response.history]
+    return converted
+
+
+#
+# requests exception matching an httpx error, so the spray loop handles both backends alike
+#
+def _requests_error(error):
+    message = str(error)
+    if isinstance(error, httpx.ConnectTimeout):
+        return requests.exceptions.ConnectTimeout(message)
+    if isinstance(error, httpx.ReadTimeout):
+        return requests.exceptions.ReadTimeout(message)
+    if isinstance(error, httpx.TimeoutException):
+        return requests.exceptions.Timeout(message)
+    if isinstance(error, (httpx.NetworkError, httpx.RemoteProtocolError)):
+        return requests.exceptions.ConnectionError(message)
+    if isinstance(error, httpx.TooManyRedirects):
+        return requests.exceptions.TooManyRedirects(message)
+    return requests.exceptions.RequestException(message)
@@ -0,0 +1,67 @@
+import threading
+from dataclasses import dataclass
+from typing import Any
+
+from spraycharles.lib.profiler import profiler
+from spraycharles.lib.utils import UsernameFormat
+
+from .Attempt import AttemptRequest, AttemptResult
+from .BaseTarget import BaseTarget
+
+
+@dataclass(frozen=True, slots=True)
+class LegacyResult(AttemptResult):
+    """
+    Result for a legacy module - classification and logging stay inside the
+    module's print_response(), so the raw response is carried through
+    """
+
+    response: Any = None
+
+
+class LegacyTarget(BaseTarget):
+    """
+    Adapter for third-party modules written against the old stateful
+    interface (login() and print_response() sharing per-attempt state on
+    the instance). Attempts through the adapter are serialized
+    """
+
+    def __init__(self, module):
+        self.module = module
+        self.NAME = module.NAME
+        self.DESCRIPTION = getattr(module, "DESCRIPTION", None)
+        self.USERNAME_FORMAT = getattr(module, "USERNAME_FORMAT", UsernameFormat.RAW)
+        self._lock = threading.Lock()
+
+
+    #
+    # Anything else (url, set_path, get_conn, ...) comes from the wrapped module
+    #
+    def __getattr__(self, name):
+        return getattr(self.module, name)
+
+
+    def prepare(self, username, password):
+        return AttemptRequest(username, password)
+
+
+    def send(self, spec):
+        with self._lock:
+            return self.module.login(spec.username, spec.password)
+
+
+    def classify(self, spec, response):
+        return LegacyResult(spec.username, spec.password, response=response)
+
+
+    def timeout_result(self, spec):
+        return LegacyResult(spec.username, spec.password, timeout=True)
+
+
+    def report(self, result, outfile, print_to_screen=True):
+        with self._lock, profiler.phase("print_response"):
+            self.module.print_response(result.response, outfile, timeout=result.timeout, print_to_screen=print_to_screen)
+
+
+    def print_headers(self):
+        self.module.print_headers()
@@ -0,0 +1,142 @@
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from spraycharles.lib.logger import logger
+from spraycharles.lib.profiler import profiler
+
+
+class Prefetcher:
+    """
+    Fetches per-user values (such as Okta stateTokens) in background
+    threads ahead of the attempts that need them. Values are cached by
+    key for ttl seconds after they arrive and handed out once; a fetch
+    that raised or returned None is dropped, so the caller fetches the
+    value itself. Only the spray thread calls into the cache
+
+    Each take() is counted as a hit, miss or expired value, and passed to
+    counter if one is set. Values are only fetched as far ahead as they
+    stay fresh at the expected gap between attempts (see pace())
+    """
+
+    def __init__(self, fetch, ttl=60, ahead=2):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.ahead = ahead
+        self.reach = ahead
+        self.queue = []
+        self.positions = {}
+        self.entries = {}
+        self.done = set()
+        self.executor = ThreadPoolExecutor(max_workers=ahead, thread_name_prefix="prefetch")
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.counter = None
+
+
+    #
+    # Usernames the spray is about to attempt, in order
+    #
+    def upcoming(self, keys):
+        self.queue = list(keys)
+        self.positions = {key: index for index, key in enumerate(self.queue)}
+        self.done = set()
+
+        # cached values for users no longer queued won't be used
+        for key in [key for key in self.entries if key not in self.positions]:
+            self.invalidate(key)
+
+
+    #
+    # Start fetching for the users queued after key, other than those
+    # already taken or skipped in this pass
+    #
+    def prefetch_after(self, key):
+        index = self.positions.get(key)
+        if index is None:
+            return
+
+        for next_key in self.queue[index + 1:index + 1 + self.reach]:
+            if next_key not in self.entries and next_key not in self.done:
+                self.entries[next_key] = self.executor.submit(self._fetch, next_key)
+
+
+    #
+    # Expected seconds between attempts, at most. A value fetched for the user
+    # n places ahead is used about n gaps later, so only users within the ttl
+    # are fetched - none if a single gap outlasts it
+    #
+    def pace(self, gap):
+        reach = self.ahead if not gap else min(self.ahead, math.ceil(self.ttl / gap) - 1)
+        if reach != self.reach:
+            if reach:
+                logger.debug("Prefetching %d user(s) ahead at up to %ds between attempts", reach, gap)
+            else:
+                logger.debug("Not prefetching - values expire within %ds, before the next attempt", self.ttl)
+        self.reach = reach
+
+
+    def _fetch(self, key):
+        with profiler.phase("prefetch"):
+            return self.fetch(key), time.monotonic()
+
+
+    #
+    # The value fetched for key, waiting for it if the fetch is still in
+    # flight, or None if nothing usable was fetched
+    #
+    def take(self, key):
+        self.done.add(key)
+
+        future = self.entries.pop(key, None)
+        if future is None:
+            self._count("miss")
+            return None
+
+        try:
+            value, fetched = future.result()
+        except Exception as e:
+            logger.debug("Prefetch for %s failed: %s", key, e)
+            self._count("miss")
+            return None
+
+        if value is None:
+            self._count("miss")
+            return None
+
+        if time.monotonic() - fetched > self.ttl:
+            logger.debug("Prefetched value for %s expired", key)
+            self._count("expired")
+            return None
+
+        self._count("hit")
+        return value
+
+
+    def _count(self, outcome):
+        if outcome == "hit":
+            self.hits += 1
+        elif outcome == "miss":
+            self.misses += 1
+        else:
+            self.expired += 1
+
+        if self.counter is not None:
+            self.counter(outcome)
+
+
+    #
+    # Drop the value fetched for key, and don't fetch it again in this pass
+    #
+    def invalidate(self, key):
+        self.done.add(key)
+        future = self.entries.pop(key, None)
+        if future is not None:
+            future.cancel()
+
+
+    def clear(self):
+        for key in list(self.entries):
+            self.invalidate(key)
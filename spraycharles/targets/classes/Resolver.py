@@ -0,0 +1,160 @@
+import ipaddress
+import socket
+import threading
+import time
+
+from spraycharles.lib.logger import logger
+
+
+class Resolver:
+    """
+    Resolves target hosts once and pins connections to the chosen address.
+    getaddrinfo doesn't report record TTLs, so answers are refreshed after
+    a fixed ttl; a refresh keeps the pinned address while it is still in
+    the answer, so a spray doesn't hop between load balanced nodes, and a
+    failed refresh keeps the old answer. Only pinned hosts are affected -
+    HTTP connections to them are opened to the pinned address with the
+    hostname kept for SNI and the Host header. Hostnames are matched
+    case-insensitively
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.pinned = {}
+        self._lock = threading.Lock()
+
+
+    #
+    # Resolve host and pin connections to it. Returns the pinned address,
+    # or None if the host didn't resolve (connections then resolve as usual)
+    #
+    def pin(self, host, port=443):
+        if not host or not self.ttl:
+            return None
+
+        try:
+            ipaddress.ip_address(host)
+            return host
+        except ValueError:
+            pass
+
+        try:
+            addresses = Resolver._lookup(host, port)
+        except OSError as e:
+            logger.warning(f"Could not resolve {host}: {e}")
+            return None
+
+        with self._lock:
+            self.pinned[host.lower()] = {"port": port, "addresses": addresses, "address": addresses[0], "expires": time.monotonic() + self.ttl}
+        logger.debug("Pinned %s to %s (of %s)", host, addresses[0], ", ".join(addresses))
+        return addresses[0]
+
+
+    @staticmethod
+    def _lookup(host, port):
+        answers = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        return list(dict.fromkeys(answer[4][0] for answer in answers))
+
+
+    #
+    # Address to connect to for host - the pinned one, refreshed once its
+    # answer is older than the ttl - or host itself if it isn't pinned
+    #
+    def address(self, host):
+        entry = self.pinned.get(host.lower())
+        if entry is None:
+            return host
+
+        if time.monotonic() >= entry["expires"]:
+            with self._lock:
+                if time.monotonic() >= entry["expires"]:
+                    self._refresh(host, entry)
+
+        return entry["address"]
+
+
+    #
+    # Open a connection to a pinned host with connect(address). If the pinned
+    # address fails, the host's other addresses are tried in order and the
+    # first that connects is pinned instead
+    #
+    def connect(self, host, connect):
+        address = self.address(host)
+        try:
+            return connect(address)
+        except OSError as error:
+            for other in self.others(host, address):
+                try:
+                    conn = connect(other)
+                except OSError:
+                    continue
+
+                self.repin(host, address, other)
+                return conn
+            raise error
+
+
+    #
+    # The host's other addresses to try after address failed, in answer order
+    #
+    def others(self, host, address):
+        with self._lock:
+            return [other for other in self.pinned[host.lower()]["addresses"] if other != address]
+
+
+    #
+    # Pin host to other after address failed, unless another thread already moved it
+    #
+    def repin(self, host, address, other):
+        with self._lock:
+            entry = self.pinned[host.lower()]
+            if entry["address"] != address:
+                return
+
+            entry["address"] = other
+        logger.info(f"{host} connection to {address} failed - now pinned to {other}")
+
+
+    def is_pinned(self, host):
+        return host.lower() in self.pinned
+
+
+    def _refresh(self, host, entry):
+        entry["expires"] = time.monotonic() + self.ttl
+
+        try:
+            addresses = Resolver._lookup(host, entry["port"])
+        except OSError as e:
+            logger.debug("Refreshing %s failed, keeping %s: %s", host, entry["address"], e)
+            return
+
+        entry["addresses"] = addresses
+        if entry["address"] not in addresses:
+            logger.info(f"{host} no longer resolves to {entry['address']} - now pinned to {addresses[0]}")
+            entry["address"] = addresses[0]
+
+
+    def describe(self, host):
+        entry = self.pinned.get(host.lower())
+        if entry is None:
+            return host
+
+        others = len(entry["addresses"]) - 1
+        return f"{entry['address']}" + (f" (pinned, {others} other address{'es' if others > 1 else ''})" if others else "")
+
+
+resolver = Resolver()
+
+
+#
+# urllib3 opens every requests connection through create_connection, so
+# wrapping it with this (see install_hooks) covers all HTTP transports
+#
+def _pinned(function):
+    def wrapper(address, *args, **kwargs):
+        host, port = address
+        if not resolver.is_pinned(host):
+            return function(address, *args, **kwargs)
+        return resolver.connect(host, lambda pinned: function((pinned, port), *args, **kwargs))
+    wrapper.__wrapped__ = function
+    return wrapper
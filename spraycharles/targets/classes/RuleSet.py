@@ -0,0 +1,253 @@
+import re
+import string
+
+from spraycharles.lib.utils import LoginResult
+
+
+CONDITIONS = ("status", "location", "cookie", "body", "json")
+OPTIONS = ("value", "match", "result", "message")
+MISSING = object()
+
+
+class ResponseView:
+    """
+    Lazily extracted response properties, so each is computed at most once
+    per response no matter how many rules look at it
+    """
+
+    __slots__ = ("response", "_location", "_cookies", "_text", "_json")
+
+    def __init__(self, response):
+        self.response = response
+        self._location = MISSING
+        self._cookies = None
+        self._text = None
+        self._json = MISSING
+
+
+    @property
+    def status(self):
+        return self.response.status_code
+
+
+    #
+    # Location of the first redirect in the chain - login forms usually
+    # redirect once, and requests follows it
+    #
+    @property
+    def location(self):
+        if self._location is MISSING:
+            self._location = None
+            for resp in [*self.response.history, self.response]:
+                location = resp.headers.get("Location")
+                if location is not None:
+                    self._location = location
+                    break
+        return self._location
+
+
+    #
+    # Names of cookies set anywhere in the redirect chain
+    #
+    @property
+    def cookies(self):
+        if self._cookies is None:
+            self._cookies = {name for resp in [*self.response.history, self.response] for name in resp.cookies.keys()}
+        return self._cookies
+
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = self.response.text
+        return self._text
+
+
+    def json_path(self, path):
+        if self._json is MISSING:
+            try:
+                self._json = self.response.json()
+            except Exception:
+                self._json = None
+
+        node = self._json
+        for part in path:
+            if isinstance(node, dict):
+                node = node.get(part, MISSING)
+            elif isinstance(node, list) and part.isdigit() and int(part) < len(node):
+                node = node[int(part)]
+            else:
+                return MISSING
+            if node is MISSING:
+                return MISSING
+        return node
+
+
+#
+# Replacement fields of a message template, by name - {value[0]} is value
+#
+def _fields(message):
+    return {re.match(r"\w*", name).group() for _, name, _, _ in string.Formatter().parse(message) if name is not None}
+
+
+class Rule:
+    """
+    One compiled rule. All supplied conditions must match
+    """
+
+    __slots__ = ("status", "location", "cookie", "body", "json", "value", "match", "result", "message", "template")
+
+    def __init__(self, spec):
+        unknown = set(spec) - set(CONDITIONS) - set(OPTIONS)
+        if unknown:
+            raise ValueError(f"unknown rule keys: {', '.join(sorted(unknown))}")
+
+        if "result" not in spec:
+            raise ValueError(f"rule is missing a result: {spec}")
+
+        status = spec.get("status")
+        self.status = None if status is None else frozenset(status if isinstance(status, list) else [status])
+        self.location = re.compile(spec["location"]) if "location" in spec else None
+        self.cookie = spec.get("cookie")
+        self.body = re.compile(spec["body"]) if "body" in spec else None
+        self.json = tuple(str(spec["json"]).split(".")) if "json" in spec else None
+
+        value = spec.get("value")
+        self.value = None if value is None else frozenset(str(v) for v in (value if isinstance(value, list) else [value]))
+        self.match = re.compile(spec["match"]) if "match" in spec else None
+
+        if (self.value is not None or self.match is not None) and self.json is None:
+            raise ValueError(f"'value' and 'match' require a 'json' path: {spec}")
+
+        self.result = LoginResult(spec["result"]).value
+        self.message = str(spec.get("message", ""))
+
+        #
+        # Catch broken templates now rather than mid-spray
+        #
+        try:
+            fields = _fields(self.message)
+        except ValueError as e:
+            raise ValueError(f"invalid message {self.message!r}: {e} - write literal braces as {{{{ and }}}}")
+
+        if fields - {"value"} or (fields and self.json is None):
+            raise ValueError(f"message {self.message!r} can only use {{value}}, which requires a 'json' path - write literal braces as {{{{ and }}}}")
+
+        self.template = "{" in self.message or "}" in self.message
+
+
+    #
+    # Exact json value rules (plus an optional status) can be looked up
+    # in a table instead of being checked one by one
+    #
+    @property
+    def indexable(self):
+        return self.json is not None and self.value is not None and self.match is None and \
+            self.location is None and self.cookie is None and self.body is None
+
+
+    def matches(self, view):
+        if self.status is not None and view.status not in self.status:
+            return False
+
+        if self.json is not None:
+            value = view.json_path(self.json)
+            if value is MISSING:
+                return False
+            if self.value is not None and str(value) not in self.value:
+                return False
+            if self.match is not None and not self.match.search(str(value)):
+                return False
+
+        if self.location is not None:
+            location = view.location
+            if location is None or not self.location.search(location):
+                return False
+
+        if self.cookie is not None and self.cookie not in view.cookies:
+            return False
+
+        if self.body is not None and not self.body.search(view.text):
+            return False
+
+        return True
+
+
+    #
+    # Messages may include the matched json value, e.g. "{value}". A value
+    # the template can't format (e.g. "{value:d}" for a string) leaves it raw
+    #
+    def format_message(self, view):
+        if not self.template:
+            return self.message
+
+        value = view.json_path(self.json) if self.json is not None else None
+        try:
+            return self.message.format(value=value)
+        except (ValueError, TypeError, KeyError, IndexError, AttributeError):
+            return self.message
+
+
+class RuleSet:
+    """
+    Compiled, ordered success/failure rules for a module. The first matching
+    rule decides the result. Rules keyed on an exact json value are indexed
+    by that value, so long error code tables cost one lookup per response
+    """
+
+    def __init__(self, rules):
+        self.rules = []
+        for indx, spec in enumerate(rules or []):
+            try:
+                self.rules.append(Rule(spec))
+            except (ValueError, re.error) as e:
+                raise ValueError(f"Invalid rule #{indx + 1}: {e}")
+
+        #
+        # json path -> {value: [rule indices]}; everything else is scanned
+        #
+        self.index = {}
+        self.scan = []
+        for indx, rule in enumerate(self.rules):
+            if rule.indexable:
+                table = self.index.setdefault(rule.json, {})
+                for value in rule.value:
+                    table.setdefault(value, []).append(indx)
+            else:
+                self.scan.append(indx)
+
+
+    def __len__(self):
+        return len(self.rules)
+
+
+    #
+    # Returns (result, message) for a response, or (None, None) if no rule matched
+    #
+    def classify(self, response):
+        view = ResponseView(response)
+        best = None
+
+        for path, table in self.index.items():
+            value = view.json_path(path)
+            if value is MISSING or isinstance(value, (dict, list)):
+                continue
+            for indx in table.get(str(value), ()):
+                if best is not None and indx > best:
+                    break
+                if self.rules[indx].matches(view):
+                    best = indx
+                    break
+
+        for indx in self.scan:
+            if best is not None and indx > best:
+                break
+            if self.rules[indx].matches(view):
+                best = indx
+                break
+
+        if best is None:
+            return None, None
+
+        rule = self.rules[best]
+        return rule.result, rule.format_message(view)
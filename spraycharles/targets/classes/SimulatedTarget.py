@@ -0,0 +1,43 @@
+from spraycharles.lib.utils import LoginResult, UsernameFormat
+
+from .Attempt import AttemptRequest, AttemptResult
+from .BaseTarget import BaseTarget
+
+
+class SimulatedTarget(BaseTarget):
+    """
+    Local stand-in for a module when simulating a spray plan. Usernames are
+    formatted as the module would, but nothing is sent: each attempt takes
+    latency seconds of the virtual clock, fails, and is added to the
+    timeline instead of the results file
+    """
+
+    def __init__(self, module, clock, timeline, latency=0.5):
+        self.module = module
+        self.NAME = module.NAME
+        self.DESCRIPTION = getattr(module, "DESCRIPTION", None)
+        self.USERNAME_FORMAT = getattr(module, "USERNAME_FORMAT", UsernameFormat.RAW)
+        self.url = getattr(module, "url", None)
+        self.clock = clock
+        self.timeline = timeline
+        self.latency = latency
+
+
+    def prepare(self, username, password):
+        return AttemptRequest(username, password)
+
+
+    def send(self, spec):
+        self.clock.advance(self.latency)
+
+
+    def classify(self, spec, response):
+        return AttemptResult(spec.username, spec.password, result=LoginResult.FAIL.value)
+
+
+    def report(self, result, outfile, print_to_screen=True):
+        self.timeline.add(self.clock.time(), result.username, result.password)
+
+
+    def print_headers(self):
+        pass
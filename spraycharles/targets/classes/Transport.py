@@ -0,0 +1,505 @@
+import base64
+import hashlib
+import inspect
+import re
+import socket
+import ssl
+import threading
+import time
+from contextlib import contextmanager
+from enum import Enum
+from types import MappingProxyType
+
+import requests
+import urllib3.connection
+import urllib3.util.connection
+from impacket import ntlm
+from impacket.smb import SMB_DIALECT
+from impacket.smbconnection import SessionError, SMBConnection
+
+from spraycharles.lib.profiler import profiler
+
+from .Attempt import Timing
+from .Resolver import _pinned, resolver
+
+
+#
+# Specs hold read-only views of their dicts; requests wants the real thing
+#
+def _thaw(value):
+    if isinstance(value, MappingProxyType):
+        return dict(value)
+    return value
+
+
+#
+# Backends HTTP modules can send attempts through, selected per spray
+#
+class TransportBackend(str, Enum):
+    requests = "requests"
+    httpx    = "httpx"
+
+
+CHANNEL_BINDING = "channel_binding_value" in inspect.signature(ntlm.getNTLMSSPType3).parameters
+
+_timers = threading.local()
+
+
+class AttemptTimer:
+    """
+    Network timings of one login attempt. The timer is active on the
+    calling thread while the attempt is sent, and transports and the
+    connection hooks below record into it, so modules need no changes.
+    reused is True when a response arrived without opening a connection
+    """
+
+    def __init__(self):
+        self.start = None
+        self.connect = None
+        self.tls = None
+        self.ttfb = None
+        self.total = None
+        self.reused = None
+        self.resumed = None
+
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        _timers.current = self
+        return self
+
+
+    def __exit__(self, *exc):
+        self.total = time.perf_counter() - self.start
+        _timers.current = None
+
+
+    @staticmethod
+    def current():
+        return getattr(_timers, "current", None)
+
+
+    #
+    # Add time spent opening a connection (connect) or in a TLS handshake (tls)
+    #
+    def add(self, name, elapsed):
+        setattr(self, name, (getattr(self, name) or 0.0) + elapsed)
+        self.reused = False
+
+
+    def first_byte(self):
+        if self.ttfb is None:
+            self.ttfb = time.perf_counter() - self.start
+        if self.reused is None:
+            self.reused = True
+
+
+    def timing(self):
+        return Timing(self.connect, self.tls, self.ttfb, self.total, self.reused)
+
+
+#
+# Time a connection step into the active attempt's timer, if any
+#
+@contextmanager
+def _measure(name):
+    timer = AttemptTimer.current()
+    if timer is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - start)
+
+
+def _timed(name, function):
+    def wrapper(*args, **kwargs):
+        with _measure(name):
+            return function(*args, **kwargs)
+    wrapper.__wrapped__ = function
+    return wrapper
+
+
+_hooks = threading.Lock()
+_hooks_installed = False
+
+
+#
+# urllib3 looks these up at call time, so wrapping them pins connections to
+# the resolved target address and times DNS lookups, TCP connects and TLS
+# handshakes for every requests-based transport, into the attempt timer
+# and the profiler's phases. Installed once, by the spray, so importing the
+# targets package leaves urllib3 untouched
+#
+def install_hooks():
+    global _hooks_installed
+
+    with _hooks:
+        if _hooks_installed:
+            return
+
+        socket.getaddrinfo = profiler.wrap("dns", socket.getaddrinfo)
+        urllib3.util.connection.create_connection = _timed("connect", profiler.wrap("connect", _pinned(urllib3.util.connection.create_connection)))
+        urllib3.connection.ssl_wrap_socket = _timed("tls", profiler.wrap("tls", urllib3.connection.ssl_wrap_socket))
+        _hooks_installed = True
+
+
+#
+# requests response hook - runs once the response headers are parsed,
+# before the body is read
+#
+def _first_byte(response, *args, **kwargs):
+    timer = AttemptTimer.current()
+    if timer is not None:
+        timer.first_byte()
+
+
+class TlsSessionCache:
+    """
+    TLS sessions per server name, offered on new connections so servers
+    that close the connection after every attempt resume the session
+    (session ticket or ID) with an abbreviated handshake instead of a full
+    one. Sessions are only valid with the SSL context that made them, so
+    the cache owns one context for all connections
+    """
+
+    def __init__(self):
+        self.sessions = {}
+        self.handshakes = 0
+        self.resumed = 0
+        self._lock = threading.Lock()
+
+        self.context = _ResumingContext(ssl.PROTOCOL_TLS_CLIENT)
+        self.context.check_hostname = False
+        self.context.verify_mode = ssl.CERT_NONE
+        self.context.cache = self
+
+
+    def get(self, server_hostname):
+        return self.sessions.get(server_hostname)
+
+
+    #
+    # Count a completed handshake and keep its session. TLS 1.3 servers send
+    # tickets after the handshake, so the session is taken again once the
+    # response arrived (remember)
+    #
+    def handshake(self, server_hostname, sock):
+        with self._lock:
+            self.handshakes += 1
+            if sock.session_reused:
+                self.resumed += 1
+
+        self.remember(server_hostname, sock)
+
+        timer = AttemptTimer.current()
+        if timer is not None:
+            timer.resumed = sock.session_reused
+
+
+    def remember(self, server_hostname, sock):
+        session = sock.session
+        if session is not None:
+            self.sessions[server_hostname] = session
+
+
+    def forget(self, server_hostname):
+        self.sessions.pop(server_hostname, None)
+
+
+    #
+    # requests response hook keeping the session of the response's connection
+    #
+    def response_hook(self, response, *args, **kwargs):
+        try:
+            sock = response.raw._fp.fp.raw._sock
+        except AttributeError:
+            return
+
+        if isinstance(sock, ssl.SSLSocket):
+            self.remember(sock.server_hostname, sock)
+
+
+    def hit_rate(self):
+        return self.resumed / self.handshakes if self.handshakes else None
+
+
+class _ResumingContext(ssl.SSLContext):
+    """
+    Client context offering the cached session for the server name
+    """
+
+    def wrap_socket(self, sock, *args, server_hostname=None, session=None, **kwargs):
+        session = session or self.cache.get(server_hostname)
+        try:
+            tls = super().wrap_socket(sock, *args, server_hostname=server_hostname, session=session, **kwargs)
+        except ssl.SSLError:
+            # don't offer a session the server choked on again
+            self.cache.forget(server_hostname)
+            raise
+
+        self.cache.handshake(server_hostname, tls)
+        return tls
+
+
+class _ResumingAdapter(requests.adapters.HTTPAdapter):
+    def __init__(self, context, **kwargs):
+        self.context = context
+        super().__init__(**kwargs)
+
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["ssl_context"] = self.context
+        super().init_poolmanager(*args, **kwargs)
+
+
+class HttpTransport:
+    """
+    Executes HttpRequest specs with the requests library. With a
+    TlsSessionCache, HTTPS connections resume cached TLS sessions
+    """
+
+    def __init__(self, tls_sessions=None):
+        self.tls_sessions = tls_sessions
+        self.adapter = None if tls_sessions is None else _ResumingAdapter(tls_sessions.context)
+
+
+    def send(self, spec):
+        if self.adapter is None:
+            return requests.request(
+                spec.method,
+                spec.url,
+                headers=_thaw(spec.headers),
+                data=_thaw(spec.data),
+                json=_thaw(spec.json),
+                cookies=_thaw(spec.cookies),
+                auth=spec.auth,
+                timeout=spec.timeout,
+                verify=spec.verify,
+                hooks={"response": _first_byte},
+            )  # , proxies=self.proxyDict)
+
+        #
+        # A fresh session per attempt, as requests.request uses, so no
+        # cookies carry over - only the adapter and its TLS context are shared
+        #
+        with requests.Session() as session:
+            session.mount("https://", self.adapter)
+            return session.request(
+                spec.method,
+                spec.url,
+                headers=_thaw(spec.headers),
+                data=_thaw(spec.data),
+                json=_thaw(spec.json),
+                cookies=_thaw(spec.cookies),
+                auth=spec.auth,
+                timeout=spec.timeout,
+                verify=spec.verify,
+                hooks={"response": [_first_byte, self.tls_sessions.response_hook]},
+            )
+
+
+class NtlmTransport:
+    """
+    Executes HttpRequest specs with a native NTLM handshake. NTLM
+    authenticates the connection rather than the request, so the Type 1
+    and Type 3 messages are sent over one kept-alive connection, which is
+    reused across attempts while the server allows it. The anonymous probe
+    requests_ntlm starts with is skipped, leaving two round trips per attempt
+    """
+
+    CHALLENGE = re.compile(r"(?:NTLM|Negotiate) ([A-Za-z0-9+/]+=*)")
+
+    def __init__(self):
+        self.scheme = "NTLM"
+        self.type1 = ntlm.getNTLMSSPType1("", "", use_ntlmv2=True)
+        self.negotiate = self.type1.getData()
+        self._lock = threading.Lock()
+
+        #
+        # One pooled connection - the handshake has to stay on it
+        #
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+
+    def send(self, spec):
+        with self._lock:
+            try:
+                return self._handshake(spec)
+            finally:
+                # cookies set for one user must not go out with the next one's attempt
+                self.session.cookies.clear()
+
+
+    #
+    # Type 1, Type 2 and Type 3 exchange for one attempt
+    #
+    def _handshake(self, spec):
+        response, challenge = self._negotiate(spec)
+
+        #
+        # Some endpoints only offer NTLM wrapped in Negotiate
+        #
+        if challenge is None and response.status_code == 401 and self.scheme == "NTLM" and \
+                "negotiate" in response.headers.get("WWW-Authenticate", "").lower():
+            self.scheme = "Negotiate"
+            response, challenge = self._negotiate(spec)
+
+        # no handshake offered, nothing to authenticate against
+        if challenge is None:
+            return response
+
+        response = self._request(spec, self._authenticate(spec, challenge, response))
+
+        # only this response says anything about the credentials
+        response.ntlm_authenticated = True
+
+        #
+        # The connection is now authenticated as this user; start the next
+        # attempt on a fresh one
+        #
+        if response.status_code != 401:
+            self.session.close()
+
+        return response
+
+
+    def _request(self, spec, token, stream=False):
+        headers = {**_thaw(spec.headers), "Authorization": f"{self.scheme} {base64.b64encode(token).decode()}"}
+        return self.session.request(
+            spec.method,
+            spec.url,
+            headers=headers,
+            data=_thaw(spec.data),
+            json=_thaw(spec.json),
+            cookies=_thaw(spec.cookies),
+            timeout=spec.timeout,
+            verify=spec.verify,
+            allow_redirects=False,
+            stream=stream,
+            hooks={"response": _first_byte},
+        )
+
+
+    #
+    # Send the Type 1 message, returning the response and its Type 2 challenge
+    #
+    def _negotiate(self, spec):
+        response = self._request(spec, self.negotiate, stream=True)
+
+        # read the certificate while the socket is still attached, then release the connection
+        response.binding = _channel_binding(response)
+        response.content
+
+        if response.status_code != 401:
+            return response, None
+
+        for value in response.headers.get("WWW-Authenticate", "").split(","):
+            match = self.CHALLENGE.search(value.strip())
+            if match:
+                return response, base64.b64decode(match.group(1))
+
+        return response, None
+
+
+    #
+    # Build the Type 3 message for the spec's credentials
+    #
+    def _authenticate(self, spec, challenge, response):
+        domain, _, user = spec.username.rpartition("\\")
+
+        # older impacket releases have no channel binding support
+        extra = {"channel_binding_value": response.binding, "service": "HTTP"} if CHANNEL_BINDING else {}
+        type3, _ = ntlm.getNTLMSSPType3(self.type1, challenge, user, spec.password, domain, use_ntlmv2=True, **extra)
+
+        return type3.getData()
+
+
+#
+# Channel binding token (RFC 5929 tls-server-end-point) for servers enforcing
+# Extended Protection, from the certificate on the response's connection
+#
+def _channel_binding(response):
+    cert = _peer_certificate(response)
+    if not cert:
+        return b""
+
+    application_data = b"tls-server-end-point:" + _end_point_hash(cert)
+    bindings = b"\x00" * 16 + len(application_data).to_bytes(4, "little") + application_data
+    return hashlib.md5(bindings).digest()
+
+
+#
+# DER certificate of the (still attached) connection a streamed response
+# arrived on. urllib3 2.x exposes the connection; older releases only
+# through the wrapped file object
+#
+def _peer_certificate(response):
+    for sock in (lambda: response.raw.connection.sock, lambda: response.raw._fp.fp.raw._sock):
+        try:
+            cert = sock().getpeercert(True)
+        except (AttributeError, ValueError):
+            continue
+        if cert:
+            return cert
+    return None
+
+
+#
+# Certificate hash for tls-server-end-point: the certificate's own signature
+# hash, with MD5 and SHA-1 (and unknown algorithms) upgraded to SHA-256.
+# Without cryptography installed the certificate can't be parsed, so SHA-256
+# is assumed
+#
+def _end_point_hash(cert):
+    try:
+        from cryptography import x509
+        from cryptography.exceptions import UnsupportedAlgorithm
+    except ImportError:
+        return hashlib.sha256(cert).digest()
+
+    try:
+        algorithm = x509.load_der_x509_certificate(cert).signature_hash_algorithm
+    except (ValueError, UnsupportedAlgorithm):
+        algorithm = None
+
+    name = getattr(algorithm, "name", "sha256")
+    if name not in ("sha224", "sha256", "sha384", "sha512"):
+        name = "sha256"
+    return hashlib.new(name, cert).digest()
+
+
+class SmbTransport:
+    """
+    Executes SmbRequest specs over a new SMB connection per attempt.
+    Returns None on success or the SessionError raised by the login
+    """
+
+    def send(self, spec):
+        #
+        # Connection setup covers the TCP connect and dialect negotiation
+        #
+        with _measure("connect"):
+            address = resolver.address(spec.host)
+            if spec.smbv1:
+                conn = SMBConnection(spec.host, address, None, 445, preferredDialect=SMB_DIALECT)
+            else:
+                conn = SMBConnection(spec.host, address, None, 445)
+
+        # the negotiate response is the first the server sends back
+        timer = AttemptTimer.current()
+        if timer is not None:
+            timer.first_byte()
+
+        try:
+            conn.login(spec.user, spec.password, spec.domain)
+            conn.logoff()
+            return None
+        except SessionError as e:
+            return e
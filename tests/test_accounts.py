@@ -0,0 +1,48 @@
+import pytest
+
+from spraycharles.lib.utils import UserIndex, UsernameFormat
+
+
+MIXED = ["jdoe", "CORP\\jdoe", "jdoe@corp.com", "JDoe"]
+
+
+@pytest.mark.parametrize("fmt", [UsernameFormat.DOWNLEVEL, UsernameFormat.RAW])
+@pytest.mark.parametrize("domain", ["CORP", "corp.com"])
+def test_mixed_forms_are_one_account(fmt, domain):
+    index = UserIndex(fmt, domain).update(MIXED)
+
+    assert len(index) == 1
+    assert index.duplicates == 3
+    assert index.accounts[0].key == "jdoe"
+
+
+def test_mixed_forms_submit_once_per_format():
+    assert [a.submit for a in UserIndex(UsernameFormat.DOWNLEVEL, "CORP").update(MIXED)] == ["CORP\\jdoe"]
+    assert [a.submit for a in UserIndex(UsernameFormat.RAW, "CORP").update(MIXED)] == ["CORP\\jdoe"]
+    assert [a.submit for a in UserIndex(UsernameFormat.UPN, "corp.com").update(MIXED)] == ["jdoe@corp.com"]
+
+
+def test_mixed_forms_without_domain():
+    index = UserIndex(UsernameFormat.DOWNLEVEL).update(["CORP\\jdoe", "jdoe@corp.com"])
+
+    assert [a.key for a in index] == ["jdoe"]
+    assert [a.submit for a in index] == ["CORP\\jdoe"]
+
+
+def test_several_domains_stay_separate():
+    index = UserIndex(UsernameFormat.DOWNLEVEL, "CORP").update(
+        ["jdoe", "CORP\\jdoe", "jdoe@corp.com", "OTHER\\jdoe", "jdoe@other.org"]
+    )
+
+    assert sorted(a.key for a in index) == ["corp\\jdoe", "other\\jdoe"]
+    assert sorted(a.submit for a in index) == ["CORP\\jdoe", "OTHER\\jdoe"]
+
+
+def test_reload_keeps_accounts():
+    index = UserIndex(UsernameFormat.DOWNLEVEL, "CORP").update(MIXED)
+    account = index.accounts[0]
+
+    index.update(MIXED + ["asmith"])
+
+    assert index.accounts[0] is account
+    assert [a.key for a in index] == ["jdoe", "asmith"]